@@ -18,8 +18,97 @@ class Settings(BaseSettings):
     
     # Otras variables (Opcionales para evitar errores si no están en .env)
     SLACK_WEBHOOK_URL: Optional[str] = None
+    # Notificador de Slack: ventana para juntar alertas, tamaño de cola y respaldo en disco
+    SLACK_COALESCE_SECONDS: float = 5
+    SLACK_QUEUE_SIZE: int = 500
+    SLACK_SPILL_FILE: str = "slack_spill.jsonl"
     APIFY_TOKEN: Optional[str] = None
 
+    # Trace ID por request en los logs (header X-Request-ID) y /metrics
+    TRACE_IDS_ENABLED: bool = True
+
+    # Caché de usuarios autenticados (token -> usuario); nunca dura más que el 'exp' del token
+    AUTH_CACHE_TTL_SECONDS: int = 60
+    AUTH_CACHE_MAX_ENTRIES: int = 1000
+
+    # Workers que procesan los mensajes entrantes de WhatsApp en segundo plano
+    WEBHOOK_WORKERS: int = 4
+    WEBHOOK_QUEUE_SIZE: int = 100
+
+    # Write-behind del Excel: cada cuánto se vacía el buffer y cuota de escritura (req/min)
+    SHEET_FLUSH_INTERVAL_SECONDS: float = 5
+    SHEETS_WRITE_REQUESTS_PER_MINUTE: int = 50
+    # Cada cuánto se vuelve a leer la fila de cabeceras (por si alguien agrega o mueve columnas)
+    SHEET_HEADERS_TTL_SECONDS: float = 300
+
+    # Sincronización tabla leads <-> Excel: cada cuánto se suben los cambios locales
+    # y cada cuánto se vuelve a bajar la hoja (ediciones hechas a mano)
+    LEAD_SYNC_INTERVAL_SECONDS: float = 30
+    LEAD_SYNC_PULL_SECONDS: float = 300
+    # El daily job y la sincronización periódica bajan solo lo nuevo del Excel (False = la hoja entera)
+    LEAD_INCREMENTAL_PULL: bool = True
+
+    # Al arrancar, conectar Google Sheets y OpenAI en segundo plano (el arranque no los espera)
+    WARMUP_SERVICES_ON_STARTUP: bool = True
+
+    # Varios workers: los jobs programados los corre solo el líder (lock en la base con heartbeats).
+    # Si el líder muere, otro worker toma el lock cuando vence (TTL).
+    SCHEDULER_LEADER_ELECTION: bool = True
+    SCHEDULER_LOCK_TTL_SECONDS: float = 30
+    SCHEDULER_HEARTBEAT_SECONDS: float = 10
+    # Una ejecución 'running' más vieja que esto se da por muerta (no bloquea la siguiente)
+    SCHEDULER_MAX_RUN_SECONDS: float = 4 * 3600
+
+    # Daily outreach: paralelismo por etapa y límites de requests/segundo
+    OUTREACH_LLM_CONCURRENCY: int = 8
+    OUTREACH_SEND_CONCURRENCY: int = 4
+    OPENAI_REQUESTS_PER_SECOND: float = 5
+    TWILIO_MESSAGES_PER_SECOND: float = 1   # por número de origen, entre todos los workers (outbox)
+    OUTBOX_DISPATCHERS: int = 2
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    # Un 'sending' más viejo que esto quedó de un worker que murió (se marca 'unknown')
+    OUTBOX_SENDING_STALE_SECONDS: float = 300
+
+    # Caché de resultados de qualify_lead (se invalida sola si cambia el prompt o el modelo)
+    QUALIFY_CACHE_TTL_HOURS: float = 24 * 7
+    QUALIFY_CACHE_MAX_ENTRIES: int = 20000
+
+    # Modo Batch API para calificar (opcional): se usa si hay al menos QUALIFY_BATCH_MIN_LEADS leads nuevos
+    QUALIFY_BATCH_MODE: bool = False
+    QUALIFY_BATCH_MIN_LEADS: int = 50
+    QUALIFY_BATCH_CHUNK_SIZE: int = 500
+    QUALIFY_BATCH_POLL_SECONDS: float = 30
+    QUALIFY_BATCH_TIMEOUT_HOURS: float = 24
+
+    # Varios leads por request a GPT (1 = un lead por llamada, como siempre).
+    # Los leads que vuelven mal se reintentan solos hasta QUALIFY_GROUP_MAX_RETRIES veces.
+    QUALIFY_LEADS_PER_REQUEST: int = 1
+    QUALIFY_GROUP_MAX_RETRIES: int = 2
+
+    # Contexto de generate_response: tokens máximos del historial (resumen + últimos mensajes),
+    # cuántos mensajes recientes van siempre textuales y de a cuántos se resumen los viejos
+    CONTEXT_TOKEN_BUDGET: int = 3000
+    CONTEXT_KEEP_MESSAGES: int = 10
+    CONTEXT_SUMMARY_BATCH: int = 6
+    SUMMARY_MODEL: str = "gpt-4o-mini"
+
+    # Clasificador rápido de intents (antes de GPT). El modelo es opcional (pickle estilo scikit).
+    INTENT_MODEL_PATH: Optional[str] = None
+    INTENT_MODEL_MIN_CONFIDENCE: float = 0.9
+    INTENT_MEMO_SIZE: int = 5000
+
+    # Búsquedas del dashboard que pueden correr a la vez
+    SCRAPE_JOB_WORKERS: int = 3
+    # Filas por cada append_rows mientras llegan los resultados de Apify
+    SCRAPE_APPEND_CHUNK_SIZE: int = 25
+    # Cada cuánto se re-sincroniza el índice local de duplicados contra el Excel
+    DEDUP_RECONCILE_HOURS: float = 24
+    # Runs de Apify simultáneos por token en las búsquedas múltiples (ciudades x nichos)
+    APIFY_MAX_PARALLEL_RUNS: int = 3
+    # Caché de resultados de Apify (misma búsqueda dentro del TTL => no se vuelve a correr el actor)
+    APIFY_CACHE_TTL_HOURS: float = 24
+    APIFY_CACHE_MAX_ENTRIES: int = 500
+
     # Variables de Identidad
     AGENT_NAME: str = "Pedro"
     COMPANY_NAME: str = "Violet Wave"
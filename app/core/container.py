@@ -0,0 +1,115 @@
+import time
+import threading
+import logging
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class Container:
+    """
+    Servicios compartidos del proceso (OpenAI, Twilio, Excel, memoria, Slack),
+    construidos la PRIMERA vez que se usan y no al importar: arrancar la app no
+    abre conexiones ni importa los SDKs pesados, y si Google no responde falla
+    ese uso (y se reintenta en el próximo), no el arranque.
+
+        container.openai_service                      # en código normal
+        container.override("openai_client", fake)     # pruebas / benchmarks
+    """
+    def __init__(self):
+        self._factories = {}
+        self._instances = {}
+        self._build_seconds = {}
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory):
+        self._factories[name] = factory
+
+    def get(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self._build_seconds[name] = round(time.perf_counter() - start, 4)
+                logger.info(f"🧩 Servicio '{name}' creado en {self._build_seconds[name]}s.")
+            return self._instances[name]
+
+    def __getattr__(self, name: str):
+        if name.startswith("_") or name not in self._factories:
+            raise AttributeError(name)
+        return self.get(name)
+
+    def peek(self, name: str):
+        """La instancia si ya existe, o None (sin construirla)."""
+        return self._instances.get(name)
+
+    def override(self, name: str, instance):
+        with self._lock:
+            self._instances[name] = instance
+
+    def reset(self, name: str = None):
+        """Olvida una instancia (o todas): se vuelve a construir en el próximo uso."""
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    def warm_up(self, names: list):
+        """Crea los servicios indicados (en un hilo aparte al arrancar). Si alguno falla se reintenta en su primer uso."""
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo crear '{name}' por adelantado: {e}")
+
+    def build_stats(self) -> dict:
+        """Segundos que tardó en construirse cada servicio usado hasta ahora."""
+        return dict(self._build_seconds)
+
+# --- Factories (los imports van adentro para no cargar los SDKs al importar este módulo) ---
+
+def _openai_client():
+    from openai import OpenAI
+    return OpenAI(api_key=settings.OPENAI_API_KEY)
+
+def _openai_service():
+    from app.services.openai_service import OpenAIService
+    return OpenAIService(client=container.openai_client)
+
+def _gsheet_service():
+    from app.services.gsheet_service import GSheetService
+    from app.services.lead_store import lead_sync
+    service = GSheetService()
+    lead_sync.track(service)
+    return service
+
+def _memory():
+    from app.utils.memory import Memory
+    return Memory()
+
+def _slack_service():
+    from app.services.slack_service import SlackService
+    service = SlackService()
+    service.start()
+    return service
+
+def _conversation_context():
+    from app.services.conversation_context import ConversationContext
+    return ConversationContext(
+        container.memory,
+        summarizer=container.openai_service.summarize_conversation,
+        token_budget=settings.CONTEXT_TOKEN_BUDGET,
+        keep_messages=settings.CONTEXT_KEEP_MESSAGES,
+        summary_batch=settings.CONTEXT_SUMMARY_BATCH
+    )
+
+container = Container()
+container.register("openai_client", _openai_client)
+container.register("openai_service", _openai_service)
+container.register("gsheet_service", _gsheet_service)
+container.register("memory", _memory)
+container.register("slack_service", _slack_service)
+container.register("conversation_context", _conversation_context)
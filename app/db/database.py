@@ -1,5 +1,5 @@
 import os  # <--- IMPORTANTE: Necesitamos importar 'os'
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -7,7 +7,10 @@ from sqlalchemy.orm import sessionmaker
 # 1. Pregunta si existe la carpeta del volumen de Railway (/app/data)
 # 2. Si existe, usa esa ruta para que los datos sean eternos.
 # 3. Si no existe (estás en tu PC), usa el archivo local ./leads.db
-if os.path.exists("/app/data"):
+# (DATABASE_URL, si está definida, tiene prioridad: ej. una base temporal para los benchmarks)
+if os.getenv("DATABASE_URL"):
+    SQLALCHEMY_DATABASE_URL = os.environ["DATABASE_URL"]
+elif os.path.exists("/app/data"):
     SQLALCHEMY_DATABASE_URL = "sqlite:////app/data/leads.db"
 else:
     SQLALCHEMY_DATABASE_URL = "sqlite:///./leads.db"
@@ -15,13 +18,42 @@ else:
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
+
+# SQLite en modo WAL: los lectores no bloquean al escritor y varias
+# peticiones concurrentes pueden escribir sin perder datos (esperan el lock).
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def init_db():
+    """
+    Crea las tablas que falten y los índices agregados después (no hay migraciones).
+    Se llama una vez al arrancar (lifespan, scripts, benchmarks), nunca al importar un módulo.
+    """
+    from app.db import models  # registra los modelos en Base
+
+    with engine.connect() as conn:
+        if engine.dialect.name == "sqlite":
+            # Un worker a la vez: los demás esperan el lock (busy_timeout) y después ya ven todo creado
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+        Base.metadata.create_all(bind=conn)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+        conn.commit()
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
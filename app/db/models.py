@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy import Column, Integer, String, Boolean, Text, Float, Index
 from app.db.database import Base
 
 class User(Base):
@@ -8,3 +8,213 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
     is_active = Column(Boolean, default=True)
+
+class ConversationMessage(Base):
+    """Un mensaje del historial de WhatsApp (una fila por mensaje, solo se agrega)."""
+    __tablename__ = "conversation_messages"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False)
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+
+    # Leer el historial de un usuario = recorrer solo sus filas, en orden
+    __table_args__ = (
+        Index("ix_conversation_messages_user_id_id", "user_id", "id"),
+    )
+
+class MessageTokenCount(Base):
+    """Tokens de cada mensaje del historial (se cuentan una sola vez, al guardarlo)."""
+    __tablename__ = "message_token_counts"
+
+    message_id = Column(Integer, primary_key=True)   # conversation_messages.id
+    tokens = Column(Integer, nullable=False)
+
+class ConversationSummary(Base):
+    """
+    Resumen acumulado de la parte vieja de una conversación: todo lo que tiene
+    id <= summarized_until_id ya está resumido y no se vuelve a mandar a GPT.
+    """
+    __tablename__ = "conversation_summaries"
+
+    user_id = Column(String, primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    summarized_until_id = Column(Integer, nullable=False, default=0)
+    summary_tokens = Column(Integer, nullable=False, default=0)
+    updated_at = Column(Float, nullable=True)
+
+class CacheEntry(Base):
+    """Entrada de caché persistente (ver app/utils/disk_cache.py)."""
+    __tablename__ = "cache_entries"
+
+    namespace = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    value = Column(Text, nullable=False)
+    created_at = Column(Float, nullable=False)
+    last_access = Column(Float, nullable=False)
+
+    # Para desalojar por LRU dentro de cada namespace
+    __table_args__ = (
+        Index("ix_cache_entries_namespace_last_access", "namespace", "last_access"),
+    )
+
+class LeadDedupKey(Base):
+    """Teléfono normalizado o placeId de Google ya guardado en un Excel (índice de duplicados)."""
+    __tablename__ = "lead_dedup_keys"
+
+    spreadsheet_id = Column(String, primary_key=True)
+    kind = Column(String, primary_key=True)    # "phone" | "place"
+    value = Column(String, primary_key=True)
+
+class DedupIndexState(Base):
+    """Cuándo se sincronizó por última vez el índice de duplicados contra el Excel."""
+    __tablename__ = "dedup_index_state"
+
+    spreadsheet_id = Column(String, primary_key=True)
+    reconciled_at = Column(Float, nullable=False)
+    row_count = Column(Integer, nullable=False, default=0)
+
+class OutboundMessage(Base):
+    """Outbox de mensajes de WhatsApp/SMS: todo lo que se manda por Twilio pasa por acá."""
+    __tablename__ = "outbound_messages"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Misma clave => mismo mensaje (nunca se manda dos veces)
+    idempotency_key = Column(String, unique=True, nullable=False, index=True)
+    to_number = Column(String, nullable=False)
+    from_number = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    # queued -> sending -> sent | failed | unknown (se cortó a mitad del envío)
+    status = Column(String, nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(Float, nullable=False)
+    sid = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_outbound_messages_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+class DataMigration(Base):
+    """Migraciones de datos ya aplicadas (corren una sola vez aunque arranquen varios workers a la vez)."""
+    __tablename__ = "data_migrations"
+
+    name = Column(String, primary_key=True)
+    applied_at = Column(Float, nullable=False)
+
+class OutboxSenderSlot(Base):
+    """Próximo turno de envío de cada número de origen, compartido por todos los workers (rate limit de Twilio)."""
+    __tablename__ = "outbox_sender_slots"
+
+    from_number = Column(String, primary_key=True)
+    next_send_at = Column(Float, nullable=False)
+
+class InboundMessage(Base):
+    """MessageSid de Twilio ya recibido: si Twilio reintenta el webhook, el mensaje no se procesa dos veces."""
+    __tablename__ = "inbound_messages"
+
+    message_sid = Column(String, primary_key=True)
+    user_id = Column(String, nullable=False)
+    received_at = Column(Float, nullable=False)
+
+class Lead(Base):
+    """
+    Lead guardado localmente (fuente de verdad). El Excel es la vista para
+    humanos: se sincroniza en los dos sentidos (ver app/services/lead_store.py).
+    """
+    __tablename__ = "leads"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    spreadsheet_id = Column(String, nullable=False)
+    sheet_row = Column(Integer, nullable=True)        # fila en el Excel (1-based)
+    name = Column(String, nullable=True)
+    phone = Column(String, nullable=True)
+    phone_normalized = Column(String, nullable=True)  # solo dígitos
+    phone_suffix = Column(String, nullable=True)      # últimos 8 dígitos (match como el del Excel)
+    status = Column(String, nullable=False, default="New")
+    notes = Column(Text, nullable=True)
+    place_id = Column(String, nullable=True)
+    data = Column(Text, nullable=True)                # fila completa del Excel en JSON
+    dirty = Column(Boolean, nullable=False, default=False)  # estado cambiado localmente, falta subirlo
+    updated_at = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_leads_spreadsheet_row", "spreadsheet_id", "sheet_row", unique=True),
+        Index("ix_leads_spreadsheet_phone_suffix", "spreadsheet_id", "phone_suffix"),
+        # Vincular una conversación con su lead busca en todas las planillas
+        Index("ix_leads_phone_suffix", "phone_suffix"),
+        Index("ix_leads_spreadsheet_phone", "spreadsheet_id", "phone_normalized"),
+        Index("ix_leads_spreadsheet_status", "spreadsheet_id", "status"),
+        Index("ix_leads_dirty", "dirty"),
+    )
+
+class SheetSyncState(Base):
+    """Última sincronización Excel <-> tabla leads, por planilla."""
+    __tablename__ = "sheet_sync_state"
+
+    spreadsheet_id = Column(String, primary_key=True)
+    last_pull_at = Column(Float, nullable=False, default=0)
+    last_push_at = Column(Float, nullable=False, default=0)
+    row_count = Column(Integer, nullable=False, default=0)
+
+class Conversation(Base):
+    """Una conversación de WhatsApp (el detalle de mensajes está en conversation_messages)."""
+    __tablename__ = "conversations"
+
+    user_id = Column(String, primary_key=True)        # ej: whatsapp:+5492611234567
+    phone_normalized = Column(String, nullable=True, index=True)
+    lead_id = Column(Integer, nullable=True, index=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    last_message_at = Column(Float, nullable=True)
+
+class ScrapeJobState(Base):
+    """Búsqueda del dashboard (ver app/services/scrape_jobs.py). En la base para que cualquier worker la vea."""
+    __tablename__ = "scrape_jobs"
+
+    id = Column(String, primary_key=True)
+    owner = Column(String, nullable=False, index=True)
+    params = Column(Text, nullable=False)            # JSON
+    status = Column(String, nullable=False, default="queued")   # queued | running | success | error | cancelled
+    phase = Column(String, nullable=False, default="queued")
+    result = Column(Text, nullable=True)             # JSON
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    created_at = Column(Float, nullable=False)
+    finished_at = Column(Float, nullable=True)
+
+class ScrapeJobEvent(Base):
+    """Cada cambio de fase de una búsqueda (lo que consume el stream SSE)."""
+    __tablename__ = "scrape_job_events"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)           # JSON: {"phase": ..., "ts": ..., ...datos}
+
+    __table_args__ = (
+        Index("ix_scrape_job_events_job_id_id", "job_id", "id"),
+    )
+
+class SchedulerLock(Base):
+    """
+    Lock de líder del scheduler: con varios workers (uvicorn/gunicorn) solo el
+    dueño corre los jobs programados. Se renueva con heartbeats y vence solo.
+    """
+    __tablename__ = "scheduler_locks"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)            # host:pid:random del worker
+    acquired_at = Column(Float, nullable=False)
+    heartbeat_at = Column(Float, nullable=False)
+    expires_at = Column(Float, nullable=False)
+
+class ScheduledRun(Base):
+    """Cada ejecución de un job programado: la primera que se registra es la única que corre."""
+    __tablename__ = "scheduled_runs"
+
+    job_id = Column(String, primary_key=True)
+    run_key = Column(String, primary_key=True)        # horario programado, ej: 2025-01-31T10:00
+    owner = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="running")  # running | done | failed
+    started_at = Column(Float, nullable=False)
+    finished_at = Column(Float, nullable=True)
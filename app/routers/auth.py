@@ -48,3 +48,9 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         data={"sub": user.email}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.get("/auth/cache-stats")
+async def auth_cache_stats(current_user: security.CurrentUser = Depends(security.get_current_user)):
+    """Aciertos de la caché de usuarios autenticados (get_current_user)."""
+    return security.user_cache.stats()
@@ -0,0 +1,131 @@
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from app.core import security
+from app.services.scraper_service import ScraperService
+from app.services.gsheet_service import GSheetService
+from app.services.scrape_jobs import scrape_jobs
+import logging
+
+router = APIRouter(prefix="/api/buscar-leads", tags=["Scraping"])
+logger = logging.getLogger(__name__)
+
+# --- MODELOS DE DATOS ---
+class ScrapeRequest(BaseModel):
+    apify_token: Optional[str] = None # <--- Campo del Token Apify
+    city: str
+    country: str
+    niche: str          
+    spreadsheet_id: str 
+    limit: int = 10
+
+class BatchScrapeRequest(BaseModel):
+    apify_token: Optional[str] = None
+    cities: List[str]
+    niches: List[str]
+    country: Optional[str] = None
+    spreadsheet_id: str
+    limit: int = 10
+
+def _get_own_job(job_id: str, current_user: security.CurrentUser):
+    job = scrape_jobs.get(job_id)
+    if job is None or job.owner != current_user.email:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job no encontrado")
+    return job
+
+# --- ENDPOINT PARA BUSCAR LEADS (PROTEGIDO JWT) ---
+@router.post("")
+async def buscar_leads_google_maps(
+    request: ScrapeRequest, 
+    current_user: security.CurrentUser = Depends(security.get_current_user)
+):
+    """
+    DASHBOARD TOOL: Busca leads en Google Maps y llena el Excel indicado.
+    Requiere autenticación JWT + Token Apify opcional.
+    Responde al instante con un job_id; el avance se consulta por polling o SSE.
+    """
+    logger.info(f"🔎 Buscando '{request.niche}' (User: {current_user.email})")
+
+    def run(job):
+        # Pasamos el token del usuario (si lo puso) al servicio
+        return ScraperService().scrape_and_save(
+            city=request.city, 
+            country=request.country, 
+            niche=request.niche,
+            spreadsheet_id=request.spreadsheet_id,
+            limit=request.limit,
+            apify_token=request.apify_token,
+            progress=job.emit,
+            cancel_event=job.cancel_event
+        )
+
+    params = request.model_dump(exclude={"apify_token"})
+    job = await asyncio.to_thread(scrape_jobs.submit, current_user.email, params, run)
+    return {"status": "queued", "job_id": job.id}
+
+@router.post("/batch")
+async def buscar_leads_batch(
+    request: BatchScrapeRequest,
+    current_user: security.CurrentUser = Depends(security.get_current_user)
+):
+    """
+    Búsqueda múltiple (ciudades x nichos) en paralelo, con una sola escritura al Excel.
+    Igual que /api/buscar-leads, responde con un job_id.
+    """
+    logger.info(f"🔎 Búsqueda múltiple {len(request.cities)}x{len(request.niches)} (User: {current_user.email})")
+
+    def run(job):
+        return ScraperService().scrape_batch_and_save(
+            cities=request.cities,
+            niches=request.niches,
+            country=request.country,
+            spreadsheet_id=request.spreadsheet_id,
+            limit=request.limit,
+            apify_token=request.apify_token,
+            progress=job.emit,
+            cancel_event=job.cancel_event
+        )
+
+    params = request.model_dump(exclude={"apify_token"})
+    job = await asyncio.to_thread(scrape_jobs.submit, current_user.email, params, run)
+    return {"status": "queued", "job_id": job.id}
+
+@router.get("")
+async def listar_jobs(current_user: security.CurrentUser = Depends(security.get_current_user)):
+    return await asyncio.to_thread(scrape_jobs.list_for, current_user.email)
+
+@router.get("/{job_id}")
+async def estado_job(job_id: str, current_user: security.CurrentUser = Depends(security.get_current_user)):
+    job = await asyncio.to_thread(_get_own_job, job_id, current_user)
+    return await asyncio.to_thread(job.snapshot)
+
+@router.get("/{job_id}/events")
+async def eventos_job(job_id: str, current_user: security.CurrentUser = Depends(security.get_current_user)):
+    """Server-Sent Events con las fases del job (running_actor, items_fetched, saved...)."""
+    job = await asyncio.to_thread(_get_own_job, job_id, current_user)
+    return StreamingResponse(
+        scrape_jobs.stream(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/{job_id}/cancel")
+async def cancelar_job(job_id: str, current_user: security.CurrentUser = Depends(security.get_current_user)):
+    job = await asyncio.to_thread(_get_own_job, job_id, current_user)
+    if not await asyncio.to_thread(scrape_jobs.cancel, job.id):
+        return {"status": await asyncio.to_thread(lambda: job.status), "message": "El job ya había terminado."}
+    return {"status": "cancelling"}
+
+@router.post("/dedup/{spreadsheet_id}/reconcile")
+async def reconciliar_duplicados(spreadsheet_id: str, current_user: security.CurrentUser = Depends(security.get_current_user)):
+    """Re-sincroniza a pedido el índice local de duplicados con lo que hay en el Excel."""
+    def run():
+        GSheetService(spreadsheet_id=spreadsheet_id).reconcile_dedup_index()
+
+    try:
+        await asyncio.to_thread(run)
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "success", "spreadsheet_id": spreadsheet_id}
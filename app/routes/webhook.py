@@ -1,33 +1,56 @@
-from fastapi import APIRouter, Form
-from app.services.openai_service import OpenAIService
-from app.services.twilio_service import TwilioService
-from app.services.gsheet_service import GSheetService
-from app.services.slack_service import SlackService
-from app.utils.memory import Memory
+from fastapi import APIRouter, Form, HTTPException, status
+from app.core.container import container
+from app.services.outbox import outbox
+from app.services.lead_store import lead_sync
+from app.utils.worker_pool import KeyedWorkerPool, QueueFullError
+from app.core.config import settings
 import logging
+import uuid
+from typing import Optional
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-openai_service = OpenAIService()
-twilio_service = TwilioService()
-gsheet_service = GSheetService()
-slack_service = SlackService()
-memory = Memory()
+# OpenAI, Excel, Slack y memoria se crean en el primer mensaje (ver app/core/container.py),
+# así importar este módulo no abre conexiones.
+
+# Los mensajes se procesan fuera del event loop. Misma clave (From) = mismo hilo,
+# así los mensajes de un mismo número se responden en orden.
+message_workers = KeyedWorkerPool(
+    num_workers=settings.WEBHOOK_WORKERS,
+    max_queue_size=settings.WEBHOOK_QUEUE_SIZE,
+    name="whatsapp"
+)
 
 @router.post("/webhook/whatsapp")
-async def whatsapp_webhook(From: str = Form(...), Body: str = Form(...)):
-    user_id = From 
-    user_message = Body
-    
-    logger.info(f"📩 Mensaje: {user_message} | De: {user_id}")
-    
+async def whatsapp_webhook(From: str = Form(...), Body: str = Form(...), MessageSid: Optional[str] = Form(None)):
+    logger.info(f"📩 Mensaje: {Body} | De: {From}")
+
+    # Respondemos 200 al instante; el pipeline (GPT, Excel, Slack, Twilio) corre en el pool
+    try:
+        message_workers.submit(From, process_message, From, Body, MessageSid)
+    except QueueFullError as e:
+        logger.error(f"❌ {e}")
+        # 503 => Twilio reintenta el webhook más tarde
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Busy")
+
+    return {"status": "queued"}
+
+def process_message(user_id: str, user_message: str, message_sid: str = None) -> str:
+    """Pipeline completo de un mensaje entrante. Corre en un hilo del pool."""
+    # Clave de la respuesta en el outbox: si Twilio reintenta el webhook, no respondemos dos veces
+    reply_key = f"reply:{message_sid or uuid.uuid4().hex}"
+
+    memory = container.memory
+    openai_service = container.openai_service
+
     # Recuperamos historial ANTES de agregar el nuevo mensaje para contar
-    current_history = memory.get_history(user_id)
-    turns_count = len(current_history)
+    turns_count = memory.count_messages(user_id)
     
-    # Guardamos el mensaje actual
-    memory.add_message(user_id, "user", user_message)
+    # Guardamos el mensaje actual (si Twilio reintenta el mismo MessageSid, no se procesa de nuevo)
+    if not memory.add_message(user_id, "user", user_message, message_sid=message_sid):
+        logger.info(f"⏭️ Mensaje {message_sid} duplicado (reintento de Twilio), se ignora.")
+        return "duplicate"
     
     # 1. Clasificar
     intent = openai_service.classify_intent(user_message)
@@ -46,35 +69,36 @@ async def whatsapp_webhook(From: str = Form(...), Body: str = Form(...)):
         
         clean_phone = user_id.replace("whatsapp:", "")
         
-        # A. Excel
-        gsheet_service.update_status_by_phone(clean_phone, "Lead Caliente")
+        # A. Estado del lead (tabla local; LeadSync lo sube al Excel)
+        lead_sync.update_status_by_phone(container.gsheet_service, clean_phone, "Lead Caliente")
         
-        # B. Slack (Intentamos enviar y logueamos resultado)
+        # B. Slack (solo se encola; el notificador la manda en segundo plano)
         try:
-            slack_service.send_alert(clean_phone, user_message)
-            logger.info("🔔 Alerta enviada a Slack")
+            container.slack_service.send_alert(clean_phone, user_message)
+            logger.info("🔔 Alerta encolada para Slack")
         except Exception as e:
-            logger.error(f"❌ Error enviando a Slack: {e}")
+            logger.error(f"❌ Error encolando alerta de Slack: {e}")
 
         # C. Link
         reply = "¡Genial! 🚀 Vamos a solucionarlo.\n\nAgenda tu demo de 10 min aquí:\n👉 https://calendly.com/ramiro-baudo-violetwaveai/30min"
-        twilio_service.send_message(user_id, reply)
+        outbox.enqueue(user_id, reply, idempotency_key=reply_key)
         memory.add_message(user_id, "assistant", reply)
         
-        return {"status": "handoff_completed"}
+        return "handoff_completed"
 
     elif intent == 'NOT_INTERESTED':
         clean_phone = user_id.replace("whatsapp:", "")
-        gsheet_service.update_status_by_phone(clean_phone, "No interesado")
-        return {"status": "stopped"}
+        lead_sync.update_status_by_phone(container.gsheet_service, clean_phone, "No interesado")
+        return "stopped"
 
     else:
         # Conversación (INTERESTED)
         # Aquí el bot leerá el prompt nuevo y hará preguntas de cualificación
-        history = memory.get_history(user_id)
+        # Últimos mensajes + resumen de lo anterior, dentro del presupuesto de tokens
+        history = container.conversation_context.build(user_id)
         reply = openai_service.generate_response(history)
         
         memory.add_message(user_id, "assistant", reply)
-        twilio_service.send_message(user_id, reply)
+        outbox.enqueue(user_id, reply, idempotency_key=reply_key)
         
-        return {"status": "replied"}
\ No newline at end of file
+        return "replied"
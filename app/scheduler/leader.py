@@ -0,0 +1,177 @@
+import os
+import time
+import uuid
+import socket
+import asyncio
+import logging
+from datetime import datetime
+from sqlalchemy import case, exists, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from app.db import database, models
+
+logger = logging.getLogger(__name__)
+
+class LeaderLock:
+    """
+    Elección de líder entre workers con un lock en la base (tabla scheduler_locks).
+    El líder lo renueva cada 'heartbeat' segundos; si el worker muere, el lock
+    vence a los 'ttl' segundos y lo toma el próximo que lo intente.
+    Además cada ejecución (programada o manual) se registra en scheduled_runs y no
+    arranca si ya hay otra del mismo job corriendo, así un job corre una sola vez
+    aunque dos workers se crean líderes a la vez (ej: una pausa larga).
+    Las tablas las crea database.init_db() en el lifespan (acá no se toca la base al construir).
+    """
+    def __init__(self, name: str = "scheduler", ttl: float = 30, heartbeat: float = 10,
+                 max_run_seconds: float = 4 * 3600, session_factory=database.SessionLocal, owner: str = None):
+        self.name = name
+        self.ttl = ttl
+        self.heartbeat = heartbeat
+        # Una ejecución 'running' más vieja que esto quedó de un worker que murió
+        self.max_run_seconds = max_run_seconds
+        self.session_factory = session_factory
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.is_leader = False
+
+    def try_acquire(self) -> bool:
+        """Toma el lock (si está libre o vencido) o lo renueva si ya es nuestro."""
+        now = time.time()
+        Lock = models.SchedulerLock
+        db = self.session_factory()
+        try:
+            # UPDATE condicional: atómico aunque varios workers lo intenten a la vez
+            acquired = db.query(Lock).filter(
+                Lock.name == self.name,
+                (Lock.owner == self.owner) | (Lock.expires_at < now)
+            ).update({
+                "acquired_at": case((Lock.owner == self.owner, Lock.acquired_at), else_=now),
+                "owner": self.owner,
+                "heartbeat_at": now,
+                "expires_at": now + self.ttl,
+            }, synchronize_session=False)
+            if acquired:
+                db.commit()
+            else:
+                # No existe todavía (primer arranque) o lo tiene otro worker
+                db.add(Lock(name=self.name, owner=self.owner, acquired_at=now, heartbeat_at=now,
+                            expires_at=now + self.ttl))
+                try:
+                    db.commit()
+                    acquired = 1
+                except IntegrityError:
+                    db.rollback()
+        finally:
+            db.close()
+
+        leader = bool(acquired)
+        if leader != self.is_leader:
+            if leader:
+                logger.info(f"👑 Worker {self.owner} es el líder del scheduler.")
+            else:
+                logger.warning(f"⚠️ Worker {self.owner} dejó de ser el líder del scheduler.")
+        self.is_leader = leader
+        return leader
+
+    def release(self):
+        """Suelta el lock al apagar, así otro worker lo toma sin esperar a que venza."""
+        Lock = models.SchedulerLock
+        db = self.session_factory()
+        try:
+            db.query(Lock).filter(Lock.name == self.name, Lock.owner == self.owner).update(
+                {"expires_at": 0}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+        self.is_leader = False
+
+    async def heartbeat_loop(self):
+        """Task del event loop: renueva (o intenta tomar) el lock cada 'heartbeat' segundos."""
+        while True:
+            try:
+                await asyncio.to_thread(self.try_acquire)
+            except Exception as e:
+                # Sin base no podemos asegurar que seguimos siendo líderes
+                logger.error(f"❌ Error renovando el lock del scheduler: {e}")
+                self.is_leader = False
+            await asyncio.sleep(self.heartbeat)
+
+    # --- Ejecuciones ---
+
+    def claim_run(self, job_id: str, run_key: str) -> bool:
+        """
+        Registra la ejecución, salvo que ya exista (mismo horario) o que haya otra
+        del mismo job corriendo. Un solo INSERT ... SELECT WHERE NOT EXISTS: atómico.
+        """
+        now = time.time()
+        Run = models.ScheduledRun
+        running = select(Run.job_id).where(
+            Run.job_id == job_id, Run.status == "running", Run.started_at > now - self.max_run_seconds
+        )
+        values = select(
+            literal(job_id), literal(run_key), literal(self.owner), literal("running"), literal(now)
+        ).where(~exists(running))
+        db = self.session_factory()
+        try:
+            result = db.execute(
+                insert(Run).from_select(["job_id", "run_key", "owner", "status", "started_at"], values)
+            )
+            db.commit()
+            return result.rowcount == 1
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def run_claimed(self, job_id: str, run_key: str) -> bool:
+        db = self.session_factory()
+        try:
+            return db.get(models.ScheduledRun, (job_id, run_key)) is not None
+        finally:
+            db.close()
+
+    def finish_run(self, job_id: str, run_key: str, status: str):
+        Run = models.ScheduledRun
+        db = self.session_factory()
+        try:
+            db.query(Run).filter(Run.job_id == job_id, Run.run_key == run_key).update(
+                {"status": status, "finished_at": time.time()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def leader_job(self, job_id: str, fn):
+        """
+        Envuelve un job (async o no) para que corra en UN solo worker por horario.
+        Si no somos líderes esperamos hasta ttl + heartbeat por si el líder acaba
+        de morir; si otro worker ya registró la ejecución, no hacemos nada.
+        """
+        async def run():
+            run_key = datetime.now().strftime("%Y-%m-%dT%H:%M")
+            deadline = time.monotonic() + self.ttl + self.heartbeat
+            while not await asyncio.to_thread(self.try_acquire):
+                if time.monotonic() > deadline or await asyncio.to_thread(self.run_claimed, job_id, run_key):
+                    logger.info(f"⏭️ '{job_id}' ({run_key}) lo corre otro worker.")
+                    return
+                await asyncio.sleep(self.heartbeat)
+
+            if not await self.run_once(job_id, run_key, fn):
+                logger.info(f"⏭️ '{job_id}' ({run_key}) ya se ejecutó o está corriendo.")
+
+        run.__name__ = f"{job_id}_leader_job"
+        return run
+
+    async def run_once(self, job_id: str, run_key: str, fn) -> bool:
+        """Corre 'fn' si se pudo registrar la ejecución (ver claim_run). Retorna si corrió."""
+        if not await asyncio.to_thread(self.claim_run, job_id, run_key):
+            return False
+        status = "failed"
+        try:
+            result = fn()
+            if asyncio.iscoroutine(result):
+                await result
+            status = "done"
+        finally:
+            await asyncio.to_thread(self.finish_run, job_id, run_key, status)
+        return True
@@ -1,26 +1,34 @@
 import logging
 import os
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
 
 # --- IMPORTAMOS TUS SERVICIOS Y CONFIGURACIÓN ---
-from app.services.gsheet_service import GSheetService 
-from app.services.twilio_service import TwilioService
+from app.services.gsheet_service import GSheetService, sheet_writer
+from app.services.outbox import outbox
+from app.services.lead_store import lead_store, lead_sync
 from app.core.config import settings # <--- Importante: Aquí traemos tus datos (Pedro, Violet Wave, etc.)
-
-load_dotenv() 
+from app.core.container import container
+from app.utils.rate_limit import TokenBucket
+from app.utils.disk_cache import PersistentCache, make_key
+from app.utils.metrics import track
+from app.services.openai_batch import BatchRunner, OpenAIBatchTransport
 
 logger = logging.getLogger(__name__)
 
-# Configura OpenAI usando la key de settings
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
+# El cliente de OpenAI se crea en el primer uso (container.openai_client); el .env lo lee settings
 
 # --- PROMPT DEL SISTEMA (CONFIGURADO PARA ODONTÓLOGOS) ---
 # Usamos f-string para inyectar tu nombre y empresa directamente.
 # Nota: Las llaves del JSON {{ }} están dobles para escapar el f-string de Python.
 
-SYSTEM_PROMPT = f"""
+QUALIFY_INSTRUCTIONS = f"""
 Eres un experto en desarrollo de negocios (SDR) para la agencia '{settings.COMPANY_NAME}'.
 Tu nombre es {settings.AGENT_NAME}.
 Tu objetivo es analizar leads del nicho: {settings.NICHE}.
@@ -36,100 +44,451 @@ REGLAS PARA EL MENSAJE:
 - Menciona un problema específico de los odontólogos (ej: sillas vacías, inasistencias, confirmación manual).
 - Termina con una pregunta abierta corta para iniciar conversación.
 - Ejemplo de tono: "Hola [Nombre Lead], soy {settings.AGENT_NAME} de {settings.COMPANY_NAME}. Vi que gestionan muchas citas, ¿cómo manejan las inasistencias actualmente?"
+"""
 
+SYSTEM_PROMPT = QUALIFY_INSTRUCTIONS + """
 Responde SOLAMENTE con este JSON:
-{{
+{
     "score": (número 1-10),
     "reason": (texto breve),
     "is_qualified": (true/false),
     "suggested_message": (El mensaje listo para enviar, sin placeholders, usando tu nombre real)
-}}
+}
+"""
+
+# Varios leads por request (QUALIFY_LEADS_PER_REQUEST > 1): mismo criterio, respuesta en array
+GROUP_SYSTEM_PROMPT = QUALIFY_INSTRUCTIONS + """
+Vas a recibir VARIOS leads en un array JSON, cada uno con su "lead_id".
+Califica cada lead por separado y responde SOLAMENTE con este JSON:
+{
+    "results": [
+        {
+            "lead_id": (el mismo lead_id que recibiste),
+            "score": (número 1-10),
+            "reason": (texto breve),
+            "is_qualified": (true/false),
+            "suggested_message": (El mensaje listo para enviar, o null si no es calificado)
+        }
+    ]
+}
 """
 
+QUALIFY_MODEL = "gpt-3.5-turbo" # Puedes cambiar a gpt-4 si quieres más precisión
+
+# Caché en disco de las calificaciones: re-correr el job o /test-manual no vuelve a pagar GPT
+qualify_cache = PersistentCache(
+    namespace="qualify_lead",
+    ttl_seconds=settings.QUALIFY_CACHE_TTL_HOURS * 3600,
+    max_entries=settings.QUALIFY_CACHE_MAX_ENTRIES
+)
+
+def _qualify_cache_key(lead_data) -> str:
+    """
+    Hash de los datos del lead (sin Status, que cambia entre corridas) + prompt + modelo.
+    Si se edita el prompt en settings, la clave cambia y la caché queda invalidada.
+    """
+    canonical = {
+        str(k).strip(): str(v).strip()
+        for k, v in dict(lead_data).items()
+        if k != 'Status' and v is not None and str(v).strip() != ''
+    }
+    return make_key(canonical, SYSTEM_PROMPT, QUALIFY_MODEL)
+
+def _qualify_request_body(lead_data) -> dict:
+    """Cuerpo del chat.completions de calificación (igual para la llamada directa y la Batch API)."""
+    # Pasamos los datos del lead al prompt de usuario
+    user_content = f"Analiza este lead: {str(lead_data)}"
+    return {
+        "model": QUALIFY_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_content}
+        ],
+        "temperature": 0.7,
+        "response_format": {"type": "json_object"}
+    }
+
+class LeadAnalysis(BaseModel):
+    """Respuesta de GPT al calificar un lead. Si no valida, el lead se reintenta (no se descarta)."""
+    score: int = Field(ge=1, le=10)
+    reason: str
+    is_qualified: bool
+    suggested_message: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _message_if_qualified(self):
+        if self.is_qualified and not (self.suggested_message or "").strip():
+            raise ValueError("is_qualified=true sin suggested_message")
+        return self
+
+class LeadAnalysisItem(LeadAnalysis):
+    lead_id: str
+
+    @field_validator("lead_id", mode="before")
+    @classmethod
+    def _lead_id_as_str(cls, value):
+        return str(value)
+
+def _strip_fences(content: str) -> str:
+    # Limpieza de markdown por si GPT responde con ```json ... ``` (no debería con JSON mode)
+    return content.replace("```json", "").replace("```", "").strip()
+
+def _parse_analysis(content: str) -> dict:
+    """JSON de un lead -> dict validado. Lanza ValueError (ValidationError lo es) si no cumple."""
+    return LeadAnalysis.model_validate_json(_strip_fences(content)).model_dump()
+
 def qualify_lead(lead_data):
     """ Función auxiliar para consultar a GPT y calificar el lead """
     try:
-        # Pasamos los datos del lead al prompt de usuario
-        user_content = f"Analiza este lead: {str(lead_data)}"
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo", # Puedes cambiar a gpt-4 si quieres más precisión
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_content}
-            ],
-            temperature=0.7
-        )
-        content = response.choices[0].message.content
-        
-        # Limpieza de markdown por si GPT responde con ```json ... ```
-        content = content.replace("```json", "").replace("```", "").strip()
-        
-        return json.loads(content)
+        cache_key = _qualify_cache_key(lead_data)
+        cached = qualify_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        body = _qualify_request_body(lead_data)
+        with track("openai", "qualify_lead", request=body["messages"]) as call:
+            response = container.openai_client.chat.completions.create(**body)
+            content = response.choices[0].message.content
+            call.response_bytes = len(content or "")
+        analysis = _parse_analysis(content)
+        qualify_cache.set(cache_key, analysis)
+        return analysis
     except Exception as e:
         logger.error(f"Error calificando lead: {e}")
         return None
 
-async def daily_outreach_job():
+def _group_request_body(items: list) -> dict:
+    """chat.completions para varios leads: [(lead_id, lead_data), ...] en un solo mensaje."""
+    leads = [{"lead_id": lead_id, **dict(lead_data)} for lead_id, lead_data in items]
+    return {
+        "model": QUALIFY_MODEL,
+        "messages": [
+            {"role": "system", "content": GROUP_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Analiza estos leads: {json.dumps(leads, ensure_ascii=False, default=str)}"}
+        ],
+        "temperature": 0.7,
+        "response_format": {"type": "json_object"}
+    }
+
+def _parse_group(content: str, expected: set) -> dict:
+    """
+    {"results": [...]} -> {lead_id: análisis} solo con los items que validan.
+    Los que faltan, sobran o no cumplen el esquema quedan afuera (se reintentan).
+    """
+    results = json.loads(_strip_fences(content)).get("results")
+    if not isinstance(results, list):
+        raise ValueError("falta el array 'results'")
+    parsed = {}
+    for raw in results:
+        try:
+            item = LeadAnalysisItem.model_validate(raw)
+        except ValidationError as e:
+            logger.warning(f"Item inválido en la respuesta agrupada: {e.errors()[:1]}")
+            continue
+        if item.lead_id in expected:
+            parsed[item.lead_id] = item.model_dump(exclude={"lead_id"})
+    return parsed
+
+def qualify_leads_grouped(items: list, bucket: TokenBucket = None,
+                          max_retries: int = None) -> dict:
+    """
+    Califica varios leads en una sola llamada a GPT (JSON mode + validación por item).
+    'items' es [(lead_id, lead_data), ...]; devuelve {lead_id: análisis o None}.
+    Solo los leads que vuelven mal (o no vuelven) se mandan de nuevo, hasta 'max_retries' veces.
+    """
+    if max_retries is None:
+        max_retries = settings.QUALIFY_GROUP_MAX_RETRIES
+    results = {}
+    pending = {}    # lead_id -> (lead_data, cache_key)
+    for lead_id, lead_data in items:
+        cache_key = _qualify_cache_key(lead_data)
+        cached = qualify_cache.get(cache_key)
+        if cached is not None:
+            results[lead_id] = cached
+        else:
+            pending[lead_id] = (lead_data, cache_key)
+
+    attempt = 0
+    while pending and attempt <= max_retries:
+        attempt += 1
+        body = _group_request_body([(lead_id, data) for lead_id, (data, _) in pending.items()])
+        try:
+            if bucket is not None:
+                bucket.acquire()
+            with track("openai", "qualify_leads_grouped", request=body["messages"]) as call:
+                response = container.openai_client.chat.completions.create(**body)
+                content = response.choices[0].message.content
+                call.response_bytes = len(content or "")
+            parsed = _parse_group(content, set(pending))
+        except Exception as e:
+            logger.error(f"Error calificando {len(pending)} leads agrupados (intento {attempt}): {e}")
+            continue
+
+        for lead_id, analysis in parsed.items():
+            qualify_cache.set(pending.pop(lead_id)[1], analysis)
+            results[lead_id] = analysis
+        if pending:
+            logger.warning(f"🔁 {len(pending)} leads sin respuesta válida (intento {attempt}), se reintentan.")
+
+    for lead_id in pending:
+        results[lead_id] = None
+    return results
+
+class StageStats:
+    """Latencias por etapa del job (qualify, send) para el reporte final."""
+    def __init__(self):
+        self.latencies = {}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.latencies.setdefault(stage, []).append(seconds)
+
+    def incr(self, key: str):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def report(self, total_leads: int, elapsed: float) -> dict:
+        stages = {}
+        for stage, values in self.latencies.items():
+            values = sorted(values)
+            stages[stage] = {
+                "count": len(values),
+                "avg_s": round(sum(values) / len(values), 3),
+                "p50_s": round(values[len(values) // 2], 3),
+                "p95_s": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+            }
+        return {
+            "leads": total_leads,
+            "elapsed_s": round(elapsed, 1),
+            "leads_per_min": round(total_leads / (elapsed / 60), 1) if elapsed > 0 else 0,
+            "results": dict(self.counts),
+            "stages": stages,
+        }
+
+# Rate limit de OpenAI compartido por todo el proceso (el de Twilio lo aplica el outbox por número)
+openai_bucket = TokenBucket(rate=settings.OPENAI_REQUESTS_PER_SECOND)
+
+def _timed_call(bucket: TokenBucket, stats: StageStats, stage: str, fn, *args, **kwargs):
+    """Espera turno en el rate limit y mide cuánto tarda la llamada (corre en un hilo)."""
+    if bucket is not None:
+        bucket.acquire()
+    start = time.monotonic()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        stats.record(stage, time.monotonic() - start)
+
+async def _process_lead(lead, executor, llm_sem: asyncio.Semaphore, send_sem: asyncio.Semaphore,
+                        stats: StageStats, analysis: dict = None):
+    """'analysis' viene ya calculado en modo batch; si es None se califica con una llamada directa."""
+    loop = asyncio.get_running_loop()
+    lead_dict = lead_store.lead_data(lead)
+
+    # Obtenemos nombre y teléfono
+    name = lead_dict.get('Nombre') or lead_dict.get('name') or 'Doctor'
+    raw_phone = str(lead_dict.get('Phone', '')) 
+
+    try:
+        # 4. Calificar con IA (Usando el nuevo Prompt)
+        if analysis is None:
+            async with llm_sem:
+                analysis = await loop.run_in_executor(
+                    executor, _timed_call, openai_bucket, stats, "qualify", qualify_lead, lead_dict
+                )
+        
+        if analysis and analysis.get('is_qualified'):
+            message_body = analysis.get('suggested_message')
+            
+            if raw_phone:
+                # --- FORMATO WHATSAPP ---
+                if not raw_phone.startswith("whatsapp:"):
+                    to_number = f"whatsapp:{raw_phone}"
+                else:
+                    to_number = raw_phone
+
+                logger.info(f"Lead {name} CALIFICADO (Score: {analysis.get('score')}). Enviando: '{message_body}'")
+
+                # 5. Enviar por el outbox: la clave evita mandarle dos veces al mismo lead
+                #    (si el job se corta después de enviar, al re-correr se recupera el SID)
+                idempotency_key = f"outreach:{lead.spreadsheet_id}:{lead.phone_normalized}"
+                async with send_sem:
+                    sid = await loop.run_in_executor(
+                        executor, partial(_timed_call, None, stats, "send", outbox.send_and_wait,
+                                          to=to_number, body=message_body, idempotency_key=idempotency_key)
+                    )
+                
+                if sid:
+                    logger.info(f"Mensaje enviado con éxito! SID: {sid}")
+                    await loop.run_in_executor(executor, lead_sync.set_status, lead.id, "Contacted")
+                    stats.incr("contacted")
+                else:
+                    logger.error("Twilio no devolvió un SID, algo falló (ver outbox).")
+                    stats.incr("send_failed")
+            else:
+                logger.warning(f"El lead {name} es calificado pero no tiene número de teléfono.")
+                stats.incr("no_phone")
+
+        elif analysis is None:
+            # GPT falló o respondió algo inválido: el lead sigue 'New' y se reintenta en la próxima corrida
+            logger.warning(f"Lead {name} sin análisis válido, queda como 'New'.")
+            stats.incr("qualify_failed")
+
+        else:
+            # No calificado
+            logger.info(f"Lead {name} NO calificado. Razón: {analysis.get('reason')}")
+            await loop.run_in_executor(executor, lead_sync.set_status, lead.id, "Disqualified")
+            stats.incr("disqualified")
+
+    except Exception as inner_e:
+        logger.error(f"Error procesando lead {name}: {inner_e}")
+        stats.incr("errors")
+
+async def _process_leads_batch(leads, executor, llm_sem, send_sem, stats: StageStats, transport):
+    """
+    Modo batch: califica todos los leads con la Batch API y cada resultado pasa
+    al envío apenas vuelve su tanda. Lo que ya está en caché no se manda; lo que
+    falla en el batch se califica con la llamada directa de siempre.
+    """
+    tasks = []
+    pending = {}    # custom_id -> lead
+    requests = []
+
+    def process(lead, analysis=None):
+        tasks.append(asyncio.create_task(_process_lead(lead, executor, llm_sem, send_sem, stats, analysis)))
+
+    def lookup_cached():
+        # SQLite: fuera del event loop
+        return [(lead, qualify_cache.get(_qualify_cache_key(lead_store.lead_data(lead)))) for lead in leads]
+
+    for lead, cached in await asyncio.to_thread(lookup_cached):
+        if cached is not None:
+            process(lead, cached)
+            continue
+        custom_id = f"lead-{lead.id}"
+        pending[custom_id] = lead
+        requests.append((custom_id, _qualify_request_body(lead_store.lead_data(lead))))
+
+    runner = BatchRunner(
+        transport,
+        chunk_size=settings.QUALIFY_BATCH_CHUNK_SIZE,
+        poll_interval=settings.QUALIFY_BATCH_POLL_SECONDS,
+        timeout=settings.QUALIFY_BATCH_TIMEOUT_HOURS * 3600
+    )
+    try:
+        async for custom_id, content, error in runner.stream(requests):
+            lead = pending.pop(custom_id, None)
+            if lead is None:
+                continue
+            analysis = None
+            if content is not None:
+                try:
+                    analysis = _parse_analysis(content)
+                    await asyncio.to_thread(qualify_cache.set, _qualify_cache_key(lead_store.lead_data(lead)), analysis)
+                    stats.incr("batch_qualified")
+                except ValueError as e:
+                    error = f"JSON inválido: {e}"
+            if analysis is None:
+                logger.warning(f"Batch sin resultado para {custom_id} ({error}). Se califica en directo.")
+                stats.incr("batch_fallback")
+            process(lead, analysis)
+    except Exception as e:
+        logger.error(f"❌ Error en la Batch API, se sigue con llamadas directas: {e}")
+    finally:
+        for lead in pending.values():
+            process(lead)
+        await asyncio.gather(*tasks)
+
+async def _process_leads_grouped(leads, executor, llm_sem, send_sem, stats: StageStats, group_size: int):
+    """
+    Califica de a 'group_size' leads por request y cada lead pasa al envío
+    apenas vuelve su grupo. Lo que no se pudo calificar agrupado va por la llamada directa.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def run_group(group):
+        items = [(str(lead.id), lead_store.lead_data(lead)) for lead in group]
+        async with llm_sem:
+            analyses = await loop.run_in_executor(
+                executor, _timed_call, None, stats, "qualify_group", qualify_leads_grouped, items, openai_bucket
+            )
+        for lead in group:
+            if analyses.get(str(lead.id)) is None:
+                stats.incr("group_fallback")
+        await asyncio.gather(*(
+            _process_lead(lead, executor, llm_sem, send_sem, stats, analyses.get(str(lead.id)))
+            for lead in group
+        ))
+
+    await asyncio.gather(*(
+        run_group(leads[i:i + group_size]) for i in range(0, len(leads), group_size)
+    ))
+
+async def daily_outreach_job(batch_transport=None):
+    """
+    'batch_transport' permite usar otro transporte para la Batch API (ej: uno falso
+    en pruebas); por defecto se usa OpenAI cuando QUALIFY_BATCH_MODE está activo.
+    """
     logger.info("Starting daily outreach job...")
+    job_start = time.monotonic()
     
     try:
-        # 1. Instanciamos TUS servicios
-        gsheet_service = GSheetService()
-        twilio_service = TwilioService()
+        # 1. Instanciamos TUS servicios y traemos los cambios hechos a mano en el Excel
+        # Credenciales y open_by_key son llamadas de red: fuera del event loop
+        gsheet_service = await asyncio.to_thread(GSheetService)
+        spreadsheet_id = lead_sync.track(gsheet_service)
+        # Solo las filas nuevas desde la última corrida + el estado de las 'New' (LEAD_INCREMENTAL_PULL)
+        await asyncio.to_thread(lead_sync.refresh, spreadsheet_id)
         
-        # 2. Cargamos leads nuevos
-        df_leads = gsheet_service.load_new_leads()
+        # 2. Cargamos leads nuevos (consulta local a la tabla leads)
+        leads = await asyncio.to_thread(lead_store.new_leads, spreadsheet_id)
         
-        if df_leads.empty:
+        if not leads:
             logger.info("No hay leads nuevos ('New') para procesar.")
             return
 
-        logger.info(f"Encontrados {len(df_leads)} leads nuevos.")
+        logger.info(f"Encontrados {len(leads)} leads nuevos.")
 
-        # 3. Procesamos cada lead
-        for index, row in df_leads.iterrows():
-            lead_dict = row.to_dict()
-            
-            # Obtenemos nombre y teléfono
-            name = lead_dict.get('Nombre') or lead_dict.get('name') or 'Doctor'
-            raw_phone = str(lead_dict.get('Phone', '')) 
+        # 3. Procesamos los leads en paralelo: N llamadas a GPT y M envíos a la vez,
+        #    cada etapa con su propio rate limit. Los estados se guardan en la tabla leads.
+        llm_sem = asyncio.Semaphore(settings.OUTREACH_LLM_CONCURRENCY)
+        send_sem = asyncio.Semaphore(settings.OUTREACH_SEND_CONCURRENCY)
+        stats = StageStats()
+        max_workers = settings.OUTREACH_LLM_CONCURRENCY + settings.OUTREACH_SEND_CONCURRENCY
 
-            try:
-                # 4. Calificar con IA (Usando el nuevo Prompt)
-                analysis = qualify_lead(lead_dict)
-                
-                if analysis and analysis.get('is_qualified'):
-                    message_body = analysis.get('suggested_message')
-                    
-                    if raw_phone:
-                        # --- FORMATO WHATSAPP ---
-                        if not raw_phone.startswith("whatsapp:"):
-                            to_number = f"whatsapp:{raw_phone}"
-                        else:
-                            to_number = raw_phone
-
-                        logger.info(f"Lead {name} CALIFICADO (Score: {analysis.get('score')}). Enviando: '{message_body}'")
-
-                        # 5. Enviar usando TU servicio
-                        sid = twilio_service.send_message(to=to_number, body=message_body)
-                        
-                        if sid:
-                            logger.info(f"Mensaje enviado con éxito! SID: {sid}")
-                            gsheet_service.update_lead_status(index, "Contacted")
-                        else:
-                            logger.error("Twilio no devolvió un SID, algo falló.")
-                    else:
-                        logger.warning(f"El lead {name} es calificado pero no tiene número de teléfono.")
+        use_batch = batch_transport is not None or (
+            settings.QUALIFY_BATCH_MODE and len(leads) >= settings.QUALIFY_BATCH_MIN_LEADS
+        )
 
-                else:
-                    # No calificado
-                    reason = analysis.get('reason') if analysis else "Error en análisis"
-                    logger.info(f"Lead {name} NO calificado. Razón: {reason}")
-                    gsheet_service.update_lead_status(index, "Disqualified")
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="outreach") as executor:
+            if use_batch:
+                logger.info("📦 Calificando con la Batch API de OpenAI.")
+                await _process_leads_batch(
+                    leads, executor, llm_sem, send_sem, stats,
+                    transport=batch_transport or OpenAIBatchTransport(
+                        await asyncio.to_thread(container.get, "openai_client")
+                    )
+                )
+            elif settings.QUALIFY_LEADS_PER_REQUEST > 1:
+                logger.info(f"🧩 Calificando de a {settings.QUALIFY_LEADS_PER_REQUEST} leads por request.")
+                await _process_leads_grouped(
+                    leads, executor, llm_sem, send_sem, stats, settings.QUALIFY_LEADS_PER_REQUEST
+                )
+            else:
+                await asyncio.gather(*(
+                    _process_lead(lead, executor, llm_sem, send_sem, stats)
+                    for lead in leads
+                ))
+
+        report = stats.report(len(leads), time.monotonic() - job_start)
+        report["qualify_cache"] = qualify_cache.stats()
+        logger.info(f"📊 Daily outreach terminado: {json.dumps(report)}")
 
-            except Exception as inner_e:
-                logger.error(f"Error procesando lead {name}: {inner_e}")
+        # Subimos al Excel todos los estados nuevos en pocos batch_update
+        await asyncio.to_thread(lead_sync.sync, spreadsheet_id, False)
 
     except Exception as e:
-        logger.error(f"Error general en el job: {e}")
\ No newline at end of file
+        logger.error(f"Error general en el job: {e}")
+    finally:
+        await asyncio.to_thread(sheet_writer.flush)
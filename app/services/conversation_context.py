@@ -0,0 +1,63 @@
+import logging
+from app.utils.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+class ConversationContext:
+    """
+    Arma el historial que se le manda a generate_response dentro de un
+    presupuesto de tokens:
+    - los últimos 'keep_messages' mensajes van textuales (mientras entren),
+    - lo anterior se resume en un resumen acumulado que se guarda con la conversación.
+    El resumen se actualiza de forma incremental (resumen anterior + mensajes que
+    salieron de la ventana) y solo cuando la ventana avanzó 'summary_batch'
+    mensajes o ya no entra todo en el presupuesto.
+    """
+    def __init__(self, memory, summarizer, token_budget: int = 3000,
+                 keep_messages: int = 10, summary_batch: int = 6):
+        self.memory = memory
+        self.summarizer = summarizer    # (resumen_anterior, [mensajes]) -> nuevo resumen
+        self.token_budget = token_budget
+        self.keep_messages = keep_messages
+        self.summary_batch = summary_batch
+
+    def _window_start(self, messages: list, budget: int) -> int:
+        """Índice desde donde entran los mensajes recientes (siempre al menos el último)."""
+        used = 0
+        start = len(messages)
+        for i in range(len(messages) - 1, -1, -1):
+            if len(messages) - i > self.keep_messages:
+                break
+            if used + messages[i]["tokens"] > budget and start < len(messages):
+                break
+            used += messages[i]["tokens"]
+            start = i
+        return start
+
+    def build(self, user_id: str) -> list:
+        state = self.memory.get_summary(user_id)
+        summary = state.summary if state else ""
+        summary_tokens = state.summary_tokens if state else 0
+        until_id = state.summarized_until_id if state else 0
+
+        # Solo se leen los mensajes que todavía no están en el resumen
+        messages = self.memory.get_messages_after(user_id, until_id)
+        start = self._window_start(messages, self.token_budget - summary_tokens)
+        older = messages[:start]
+        total_tokens = summary_tokens + sum(m["tokens"] for m in messages)
+
+        if older and (len(older) >= self.summary_batch or total_tokens > self.token_budget):
+            try:
+                summary = self.summarizer(summary, [{"role": m["role"], "content": m["content"]} for m in older])
+                summary_tokens = count_tokens(summary)
+                self.memory.save_summary(user_id, summary, older[-1]["id"], summary_tokens)
+                logger.info(f"🗜️ Resumen actualizado ({user_id}): {len(older)} mensajes -> {summary_tokens} tokens.")
+            except Exception as e:
+                # Sin resumen nuevo: en este turno los mensajes viejos quedan afuera del prompt
+                logger.error(f"❌ Error resumiendo la conversación de {user_id}: {e}")
+            messages = messages[start:]
+
+        history = [{"role": m["role"], "content": m["content"]} for m in messages]
+        if summary:
+            history.insert(0, {"role": "system", "content": f"Resumen de la conversación hasta ahora: {summary}"})
+        return history
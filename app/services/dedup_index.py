@@ -0,0 +1,68 @@
+import re
+import time
+import logging
+from app.db import database, models
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PLACE_ID_RE = re.compile(r"query_place_id=([A-Za-z0-9_-]+)")
+
+def extract_place_id(text) -> str:
+    """Saca el placeId de una URL de Google Maps (ej: la que guardamos en 'Notas')."""
+    match = PLACE_ID_RE.search(str(text or ""))
+    return match.group(1) if match else ""
+
+class DedupIndex:
+    """
+    Índice local (SQLite) de los leads que ya existen en un Excel, por teléfono
+    normalizado y por placeId. Agregar leads cuesta O(leads nuevos) en vez de
+    bajar la hoja entera; contra el Excel solo se reconcilia cada
+    DEDUP_RECONCILE_HOURS o a pedido.
+    """
+    def __init__(self, spreadsheet_id: str, session_factory=database.SessionLocal):
+        self.spreadsheet_id = spreadsheet_id
+        self.session_factory = session_factory
+
+    def needs_reconcile(self) -> bool:
+        db = self.session_factory()
+        try:
+            state = db.get(models.DedupIndexState, self.spreadsheet_id)
+        finally:
+            db.close()
+        max_age = settings.DEDUP_RECONCILE_HOURS * 3600
+        return state is None or time.time() - state.reconciled_at > max_age
+
+    def reconcile(self, phones, place_ids, row_count: int = 0):
+        """Reemplaza el índice con lo que hay hoy en el Excel."""
+        Key = models.LeadDedupKey
+        rows = {("phone", p) for p in phones if p} | {("place", p) for p in place_ids if p}
+        db = self.session_factory()
+        try:
+            db.query(Key).filter(Key.spreadsheet_id == self.spreadsheet_id).delete(synchronize_session=False)
+            db.bulk_insert_mappings(Key, [
+                {"spreadsheet_id": self.spreadsheet_id, "kind": kind, "value": value}
+                for kind, value in rows
+            ])
+            db.merge(models.DedupIndexState(
+                spreadsheet_id=self.spreadsheet_id, reconciled_at=time.time(), row_count=row_count
+            ))
+            db.commit()
+        finally:
+            db.close()
+        logger.info(f"🔁 Índice de duplicados reconciliado ({self.spreadsheet_id}): {len(rows)} claves.")
+
+    def contains(self, db, phone: str, place_id: str = "") -> bool:
+        Key = models.LeadDedupKey
+        if phone and db.get(Key, (self.spreadsheet_id, "phone", phone)) is not None:
+            return True
+        if place_id and db.get(Key, (self.spreadsheet_id, "place", place_id)) is not None:
+            return True
+        return False
+
+    def add(self, db, keys: list):
+        """Registra [(telefono, place_id), ...] recién agregados al Excel."""
+        rows = {("phone", p) for p, _ in keys if p} | {("place", pid) for _, pid in keys if pid}
+        for kind, value in rows:
+            db.merge(models.LeadDedupKey(spreadsheet_id=self.spreadsheet_id, kind=kind, value=value))
+        db.commit()
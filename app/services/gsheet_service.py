@@ -1,22 +1,203 @@
-import gspread
-import pandas as pd
 import re
 import json
 import os
-from google.oauth2.service_account import Credentials
+import time
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from app.core.config import settings
+from app.utils.rate_limit import TokenBucket
+from app.utils.metrics import track, InstrumentedProxy
+from app.services.dedup_index import DedupIndex, extract_place_id
+from app.services.lead_store import lead_store
 
-class GSheetService:
-    def __init__(self, spreadsheet_id=None):
+logger = logging.getLogger(__name__)
+
+# Métodos de la worksheet que son llamadas a la API (se miden en /metrics)
+WORKSHEET_API_METHODS = (
+    "row_values", "col_values", "get", "batch_get", "get_all_values", "get_all_records",
+    "append_rows", "batch_update", "update_cell", "update",
+)
+
+# Máximo de rangos por batch_get (filas puntuales x columnas)
+MAX_RANGES_PER_BATCH_GET = 200
+
+class SheetRow:
+    """
+    Una fila del Excel leída por columnas. Liviana: guarda solo la tupla de
+    valores; los nombres de columna son la misma tupla para todas las filas.
+    """
+    __slots__ = ("sheet_row", "columns", "values")
+
+    def __init__(self, sheet_row: int, columns: tuple, values: tuple):
+        self.sheet_row = sheet_row
+        self.columns = columns
+        self.values = values
+
+    def get(self, column: str, default=""):
+        try:
+            return self.values[self.columns.index(column)]
+        except ValueError:
+            return default
+
+    def to_dict(self) -> dict:
+        return dict(zip(self.columns, self.values))
+
+    def __repr__(self):
+        return f"SheetRow({self.sheet_row}, {self.to_dict()})"
+
+# gspread y google-auth se importan recién al conectar (tardan en cargar); las
+# letras de columna las calculamos acá para no necesitarlos solo por esto.
+def _col_letter(col: int) -> str:
+    """1 -> 'A', 27 -> 'AA'"""
+    letters = ""
+    while col:
+        col, rem = divmod(col - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+def _a1(row: int, col: int) -> str:
+    return f"{_col_letter(col)}{row}"
+
+def _row_runs(rows) -> list:
+    """[2, 3, 4, 9, 10] -> [(2, 4), (9, 10)]: tramos contiguos para pedir pocos rangos."""
+    runs = []
+    for row in sorted(set(rows)):
+        if runs and row == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], row)
+        else:
+            runs.append((row, row))
+    return runs
+
+class SheetWriteBuffer:
+    """
+    Write-behind para las escrituras al Excel.
+    Los cambios de celda se acumulan en memoria (si la misma celda se escribe dos
+    veces, solo se manda el último valor) y un hilo los manda cada pocos segundos
+    con batch_update, respetando la cuota de escritura de Google Sheets.
+    """
+    def __init__(self, flush_interval: float = 5, requests_per_minute: int = 50,
+                 max_ranges_per_request: int = 500, max_retries: int = 5):
+        self.flush_interval = flush_interval
+        self.max_ranges_per_request = max_ranges_per_request
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(rate=requests_per_minute / 60, capacity=5)
+        # (spreadsheet_id, worksheet_id) -> (worksheet, {(fila, col): valor})
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enqueue(self, worksheet, row: int, col: int, value):
+        key = (worksheet.spreadsheet.id, worksheet.id)
+        with self._lock:
+            _, cells = self._pending.setdefault(key, (worksheet, {}))
+            cells[(row, col)] = value
+        self._ensure_started()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(len(cells) for _, cells in self._pending.values())
+
+    def flush(self):
+        """Manda todo lo pendiente. Lo que falla se vuelve a encolar (sin pisar valores más nuevos)."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+
+            for key, (worksheet, cells) in batch.items():
+                items = list(cells.items())
+                for i in range(0, len(items), self.max_ranges_per_request):
+                    chunk = items[i:i + self.max_ranges_per_request]
+                    updates = [
+                        {"range": _a1(row, col), "values": [[value]]}
+                        for (row, col), value in chunk
+                    ]
+                    try:
+                        self._send_with_backoff(worksheet, updates)
+                    except Exception as e:
+                        logger.error(f"❌ Error escribiendo {len(chunk)} celdas en el Excel: {e}")
+                        self._requeue(key, worksheet, chunk)
+                    else:
+                        logger.info(f"📝 Excel: {len(chunk)} celdas actualizadas en un batch_update.")
+
+    def _send_with_backoff(self, worksheet, updates: list):
+        from gspread.exceptions import APIError
+        for attempt in range(self.max_retries + 1):
+            self._bucket.acquire()
+            try:
+                worksheet.batch_update(updates)
+                return
+            except APIError as e:
+                response = getattr(e, "response", None)
+                code = getattr(response, "status_code", None)
+                if code not in (429, 500, 503) or attempt == self.max_retries:
+                    raise
+                wait = min(2 ** attempt, 64)
+                logger.warning(f"⏳ Cuota de Google Sheets ({code}). Reintentando en {wait}s...")
+                time.sleep(wait)
+
+    def _requeue(self, key, worksheet, chunk: list):
+        with self._lock:
+            _, current = self._pending.setdefault(key, (worksheet, {}))
+            for cell, value in chunk:
+                current.setdefault(cell, value)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._stop.clear()
+                    self._thread = threading.Thread(target=self._run, name="sheet-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def shutdown(self):
+        """Frena el hilo y manda lo que quede pendiente (se llama al apagar la app)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 1)
+            self._thread = None
+        self.flush()
+
+# Buffer único para todo el proceso (daily job + webhook)
+sheet_writer = SheetWriteBuffer(
+    flush_interval=settings.SHEET_FLUSH_INTERVAL_SECONDS,
+    requests_per_minute=settings.SHEETS_WRITE_REQUESTS_PER_MINUTE
+)
+
+class GoogleClientFactory:
+    """
+    Cliente de Google Sheets compartido por todo el proceso (scheduler + requests).
+    - Lee las credenciales una sola vez y las refresca ANTES de que venzan.
+    - Usa una única sesión HTTP con pool de conexiones keep-alive.
+    - Guarda en un LRU las hojas ya abiertas, así no repetimos open_by_key/open.
+    """
+    SCOPES = [
+        "https://www.googleapis.com/auth/spreadsheets",
+        "https://www.googleapis.com/auth/drive"
+    ]
+
+    def __init__(self, max_worksheets: int = 32, refresh_margin_seconds: int = 300, pool_size: int = 16):
+        self.max_worksheets = max_worksheets
+        self.refresh_margin = timedelta(seconds=refresh_margin_seconds)
+        self.pool_size = pool_size
+        self._creds = None
+        self._client = None
+        self._worksheets = OrderedDict()
+        self._auth_request = None
+        self._lock = threading.RLock()
+
+    def _load_credentials(self):
         """
         Conecta a Google Sheets usando archivo físico O variable de entorno (Nube).
         """
-        # Definimos los permisos necesarios
-        scopes = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive"
-        ]
-
+        from google.oauth2.service_account import Credentials
         creds = None
         
         # 1. Intentar cargar desde Variable de Entorno (Railway/Nube)
@@ -25,7 +206,7 @@ class GSheetService:
             try:
                 # print("[INFO] Usando credenciales desde Variable de Entorno (JSON).") 
                 creds_dict = json.loads(settings.GOOGLE_CREDENTIALS_JSON)
-                creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
+                creds = Credentials.from_service_account_info(creds_dict, scopes=self.SCOPES)
             except Exception as e:
                 print(f"[ERROR] Falló al leer GOOGLE_CREDENTIALS_JSON: {e}")
 
@@ -33,67 +214,222 @@ class GSheetService:
         if not creds and settings.GOOGLE_CREDENTIALS_FILE:
             if os.path.exists(settings.GOOGLE_CREDENTIALS_FILE):
                 # print(f"[INFO] Usando credenciales desde archivo: {settings.GOOGLE_CREDENTIALS_FILE}")
-                creds = Credentials.from_service_account_file(settings.GOOGLE_CREDENTIALS_FILE, scopes=scopes)
+                creds = Credentials.from_service_account_file(settings.GOOGLE_CREDENTIALS_FILE, scopes=self.SCOPES)
             else:
                 # Solo avisamos si tampoco hay JSON, para no llenar el log de ruido
                 if not settings.GOOGLE_CREDENTIALS_JSON:
                     print("[WARN] No se encontró el archivo de credenciales y no hay variable JSON.")
 
-        # 3. Autenticar cliente
         if not creds:
             raise Exception("❌ No se encontraron credenciales de Google válidas (ni archivo ni variable ENV).")
+        return creds
 
-        self.client = gspread.authorize(creds)
-        
-        # 4. Abrir la hoja correcta
-        if spreadsheet_id:
-            try:
-                self.sheet = self.client.open_by_key(spreadsheet_id).sheet1
-            except Exception as e:
-                print(f"[ERROR] No pude abrir la hoja con ID {spreadsheet_id}. Error: {e}")
-                raise e
-        else:
-            self.sheet = self.client.open(settings.GOOGLE_SHEET_NAME).sheet1
+    def _refresh_if_needed(self):
+        expiry = self._creds.expiry  # UTC naive (convención de google-auth)
+        if expiry is None or expiry - datetime.utcnow() < self.refresh_margin:
+            with track("google_auth", "credentials.refresh"):
+                self._creds.refresh(self._auth_request)
+
+    def get_client(self):
+        """gspread.Client compartido (se conecta en la primera llamada)."""
+        with self._lock:
+            if self._client is None:
+                import gspread
+                from google.auth.transport.requests import AuthorizedSession, Request as GoogleAuthRequest
+                from requests.adapters import HTTPAdapter
+                self._auth_request = GoogleAuthRequest()
+                self._creds = self._load_credentials()
+                session = AuthorizedSession(self._creds)
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                self._client = gspread.Client(auth=self._creds, session=session)
+            self._refresh_if_needed()
+            return self._client
+
+    def get_worksheet(self, spreadsheet_id=None):
+        """sheet1 de la planilla indicada (o la de GOOGLE_SHEET_NAME), reutilizando el handle si ya estaba abierta."""
+        key = spreadsheet_id or f"name:{settings.GOOGLE_SHEET_NAME}"
+        with self._lock:
+            client = self.get_client()
+            if key in self._worksheets:
+                self._worksheets.move_to_end(key)
+                return self._worksheets[key]
+
+            if spreadsheet_id:
+                try:
+                    with track("google_sheets", "open_by_key"):
+                        worksheet = client.open_by_key(spreadsheet_id).sheet1
+                except Exception as e:
+                    print(f"[ERROR] No pude abrir la hoja con ID {spreadsheet_id}. Error: {e}")
+                    raise e
+            else:
+                with track("google_sheets", "open"):
+                    worksheet = client.open(settings.GOOGLE_SHEET_NAME).sheet1
+            worksheet = InstrumentedProxy(worksheet, "google_sheets", WORKSHEET_API_METHODS)
+
+            self._worksheets[key] = worksheet
+            while len(self._worksheets) > self.max_worksheets:
+                self._worksheets.popitem(last=False)
+            return worksheet
+
+    def forget(self, spreadsheet_id=None):
+        """Saca una hoja del LRU (ej: si la borraron o cambiaron permisos)."""
+        key = spreadsheet_id or f"name:{settings.GOOGLE_SHEET_NAME}"
+        with self._lock:
+            self._worksheets.pop(key, None)
+
+google_clients = GoogleClientFactory()
+
+class GSheetService:
+    def __init__(self, spreadsheet_id=None):
+        """
+        Usa el cliente compartido del proceso: sin re-autenticar ni re-abrir la hoja
+        si ya se usó antes (ver GoogleClientFactory).
+        """
+        self.client = google_clients.get_client()
+        self.sheet = google_clients.get_worksheet(spreadsheet_id)
+
+        # --- Caché de cabeceras ---
+        # (buscar leads por teléfono y cambiar estados va por la tabla leads: ver LeadSync)
+        self._index_lock = threading.Lock()
+        self._headers = None        # {"Status": 3, ...} (columnas 1-based)
+        self._headers_at = 0.0
+
+    def _get_headers(self) -> dict:
+        # Vence a los SHEET_HEADERS_TTL_SECONDS: si alguien inserta o mueve una columna,
+        # los estados no se siguen escribiendo en la columna equivocada hasta reiniciar
+        if self._headers is None or time.monotonic() - self._headers_at > settings.SHEET_HEADERS_TTL_SECONDS:
+            self._store_headers(self.sheet.row_values(1))
+        return self._headers
+
+    def _store_headers(self, header_row: list):
+        self._headers = {name: i + 1 for i, name in enumerate(header_row)}
+        self._headers_at = time.monotonic()
+
+    def refresh_headers(self, header_row: list):
+        """Actualiza la caché con una fila de cabeceras ya leída (ej: la de get_all_values en LeadSync.pull)."""
+        with self._index_lock:
+            self._store_headers(header_row)
+
+    def _phone_col(self, headers: dict) -> int:
+        return headers.get('Phone') or headers.get('phone') or 2
+
+    def iter_rows(self, columns: list = None, first_row: int = 2, rows: list = None):
+        """
+        Generador de SheetRow que baja solo lo necesario con batch_get:
+        - columns: nombres de columnas a leer (None = todas; las que no existen se ignoran),
+        - rows: filas puntuales (se piden por tramos contiguos); si es None, de 'first_row' al final.
+        """
+        with self._index_lock:
+            headers = self._get_headers()
+        if columns is None:
+            columns = sorted(headers, key=headers.get)
+        cols = [(name, headers[name]) for name in columns if name in headers]
+        if not cols:
+            return
+        names = tuple(name for name, _ in cols)
+
+        runs = [(first_row, None)] if rows is None else _row_runs(rows)
+        runs_per_call = max(1, MAX_RANGES_PER_BATCH_GET // len(cols))
+        for i in range(0, len(runs), runs_per_call):
+            chunk = runs[i:i + runs_per_call]
+            ranges = [
+                f"{_col_letter(col)}{start}:{_col_letter(col)}{end or ''}"
+                for start, end in chunk for _, col in cols
+            ]
+            results = self.sheet.batch_get(ranges)
+            for j, (start, end) in enumerate(chunk):
+                # Cada rango vuelve sin las filas vacías del final: completamos con ''
+                column_values = [
+                    [r[0] if r else "" for r in values]
+                    for values in results[j * len(cols):(j + 1) * len(cols)]
+                ]
+                count = end - start + 1 if end else max((len(v) for v in column_values), default=0)
+                for offset in range(count):
+                    yield SheetRow(
+                        start + offset,
+                        names,
+                        tuple(v[offset] if offset < len(v) else "" for v in column_values)
+                    )
+
+    def update_row_status(self, sheet_row: int, new_status: str):
+        """Encola el cambio de estado de una fila (1-based) en el write-behind."""
+        with self._index_lock:
+            status_col = self._get_headers()['Status']
+        sheet_writer.enqueue(self.sheet, sheet_row, status_col, new_status)
 
-    def load_new_leads(self) -> pd.DataFrame:
-        all_records = self.sheet.get_all_records()
-        df = pd.DataFrame(all_records)
-        if df.empty or 'Status' not in df.columns:
-            return pd.DataFrame()
-        return df[df['Status'] == 'New']
+    def flush(self):
+        """Fuerza el envío de los cambios de estado pendientes."""
+        sheet_writer.flush()
 
-    def update_lead_status(self, row_index: int, new_status: str):
-        actual_row = row_index + 2
-        headers = self.sheet.row_values(1)
-        status_col = headers.index('Status') + 1
-        self.sheet.update_cell(actual_row, status_col, new_status)
+    def pending_writes(self) -> int:
+        return sheet_writer.pending_count()
 
     def _normalize_phone(self, phone):
         """Deja solo los números."""
         return re.sub(r'\D', '', str(phone))
 
-    def add_leads(self, leads_list: list) -> dict:
+    def reconcile_dedup_index(self) -> DedupIndex:
+        """Reconstruye el índice local de duplicados leyendo solo las columnas Phone y Notas."""
+        with self._index_lock:
+            headers = self._get_headers()
+            phone_col = self._phone_col(headers)
+            notes_col = headers.get('Notas') or 4
+        letters = [_col_letter(col) for col in (phone_col, notes_col)]
+        phone_values, notes_values = self.sheet.batch_get([f"{l}2:{l}" for l in letters])
+
+        index = DedupIndex(self.sheet.spreadsheet.id)
+        index.reconcile(
+            phones=(self._normalize_phone(r[0]) for r in phone_values if r),
+            place_ids=(extract_place_id(r[0]) for r in notes_values if r),
+            row_count=len(phone_values)
+        )
+        return index
+
+    def _dedup_index(self) -> DedupIndex:
+        index = DedupIndex(self.sheet.spreadsheet.id)
+        if index.needs_reconcile():
+            index = self.reconcile_dedup_index()
+        return index
+
+    def add_leads_stream(self, leads, chunk_size: int = 50, on_chunk=None) -> dict:
         """
-        Agrega leads validando que el teléfono no exista ya en el Excel.
-        Retorna un reporte con la cantidad de guardados y duplicados.
+        Igual que add_leads pero consume un iterable/generador: deduplica contra el
+        índice local de duplicados (teléfono y placeId) y va agregando bloques de
+        'chunk_size' filas con append_rows a medida que llegan, sin juntar todo en
+        memoria ni bajar la hoja. 'on_chunk(report)' recibe el avance.
+        Lanza la excepción si falla el Excel (add_leads la atrapa).
         """
+        index = self._dedup_index()
+        db = index.session_factory()
+
+        rows_to_add = []
+        keys_to_add = []
+        seen_in_batch = set()
+        count_new = 0
+        total_processed = 0
+
+        def flush_rows():
+            if rows_to_add:
+                response = self.sheet.append_rows(rows_to_add)
+                # Solo marcamos como existentes los que de verdad se escribieron
+                index.add(db, keys_to_add)
+                lead_store.record_appended(self.sheet.spreadsheet.id, rows_to_add, response)
+                rows_to_add.clear()
+                keys_to_add.clear()
+                if on_chunk:
+                    on_chunk({"found": total_processed, "added": count_new, "duplicates": total_processed - count_new})
+
         try:
-            all_records = self.sheet.get_all_records()
-            existing_df = pd.DataFrame(all_records)
-            
-            existing_phones = set()
-            if not existing_df.empty and 'Phone' in existing_df.columns:
-                existing_phones = set(self._normalize_phone(p) for p in existing_df['Phone'].astype(str))
-
-            rows_to_add = []
-            count_new = 0
-            total_processed = len(leads_list)
-
-            for lead in leads_list:
+            for lead in leads:
+                total_processed += 1
                 raw_phone = lead.get('Phone', '')
                 clean_phone = self._normalize_phone(raw_phone)
-                
-                if clean_phone in existing_phones:
+                place_id = lead.get('PlaceId') or extract_place_id(lead.get('Notas', ''))
+
+                if (clean_phone and clean_phone in seen_in_batch) or (place_id and place_id in seen_in_batch):
+                    continue
+                if index.contains(db, clean_phone, place_id):
                     continue
                 
                 row = [
@@ -103,51 +439,36 @@ class GSheetService:
                     lead.get('Notas', '') 
                 ]
                 rows_to_add.append(row)
-                existing_phones.add(clean_phone) 
+                keys_to_add.append((clean_phone, place_id))
+                seen_in_batch.update(k for k in (clean_phone, place_id) if k)
                 count_new += 1
 
-            if rows_to_add:
-                self.sheet.append_rows(rows_to_add)
-                print(f"[OK] Se agregaron {count_new} leads NUEVOS.")
-            
-            duplicates_count = total_processed - count_new
-
-            if count_new == 0:
-                print("[AVISO] Todos los leads encontrados ya existian en el Excel.")
-            
-            return {
-                "added": count_new,
-                "duplicates": duplicates_count
-            }
-                
-        except Exception as e:
-            print(f"[ERROR] Guardando en Excel: {e}")
-            return {"added": 0, "duplicates": 0}
+                if len(rows_to_add) >= chunk_size:
+                    flush_rows()
+
+            flush_rows()
+        finally:
+            db.close()
+
+        if count_new:
+            print(f"[OK] Se agregaron {count_new} leads NUEVOS.")
+        else:
+            print("[AVISO] Todos los leads encontrados ya existian en el Excel.")
+
+        return {
+            "found": total_processed,
+            "added": count_new,
+            "duplicates": total_processed - count_new
+        }
 
-    def update_status_by_phone(self, target_phone: str, new_status: str):
+    def add_leads(self, leads_list: list) -> dict:
+        """
+        Agrega leads validando que el teléfono no exista ya en el Excel.
+        Retorna un reporte con la cantidad de guardados y duplicados.
+        """
         try:
-            target_clean = self._normalize_phone(target_phone)
-            headers = self.sheet.row_values(1)
-            try:
-                if 'Phone' in headers: phone_col_index = headers.index('Phone') + 1
-                elif 'phone' in headers: phone_col_index = headers.index('phone') + 1
-                else: phone_col_index = 2
-                status_col_index = headers.index('Status') + 1
-            except ValueError:
-                return False
-
-            phone_column_values = self.sheet.col_values(phone_col_index)
-            found_row = -1
-            for i, val in enumerate(phone_column_values):
-                val_clean = self._normalize_phone(val)
-                if val_clean and target_clean.endswith(val_clean[-8:]): 
-                    found_row = i + 1
-                    break
-            
-            if found_row > 1:
-                self.sheet.update_cell(found_row, status_col_index, new_status)
-                return True
-            else:
-                return False
+            report = self.add_leads_stream(leads_list, chunk_size=max(1, len(leads_list)))
+            return {"added": report["added"], "duplicates": report["duplicates"]}
         except Exception as e:
-            return False
\ No newline at end of file
+            print(f"[ERROR] Guardando en Excel: {e}")
+            return {"added": 0, "duplicates": 0}
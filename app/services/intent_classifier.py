@@ -0,0 +1,114 @@
+import re
+import pickle
+import threading
+import unicodedata
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("READY_TO_BOOK", "NOT_INTERESTED", "INTERESTED", "QUESTION")
+
+# Mensajes que el prompt de GPT ya trata como casos fijos (texto normalizado -> etiqueta)
+EXACT_MATCHES = {
+    # Afirmaciones cortas
+    "si": "READY_TO_BOOK", "sii": "READY_TO_BOOK", "dale": "READY_TO_BOOK",
+    "ok": "READY_TO_BOOK", "okey": "READY_TO_BOOK", "okay": "READY_TO_BOOK",
+    "bueno": "READY_TO_BOOK", "genial": "READY_TO_BOOK", "perfecto": "READY_TO_BOOK",
+    "claro": "READY_TO_BOOK", "de una": "READY_TO_BOOK", "listo": "READY_TO_BOOK",
+    "me parece bien": "READY_TO_BOOK", "si me parece": "READY_TO_BOOK",
+    "si me parece bien": "READY_TO_BOOK", "me parece genial": "READY_TO_BOOK",
+    "si claro": "READY_TO_BOOK", "claro que si": "READY_TO_BOOK", "si dale": "READY_TO_BOOK",
+    "dale si": "READY_TO_BOOK", "ok dale": "READY_TO_BOOK", "dale ok": "READY_TO_BOOK",
+    "si genial": "READY_TO_BOOK", "si perfecto": "READY_TO_BOOK", "si por favor": "READY_TO_BOOK",
+    # Rechazos claros
+    "no gracias": "NOT_INTERESTED", "no me interesa": "NOT_INTERESTED",
+    "no nos interesa": "NOT_INTERESTED", "no estoy interesado": "NOT_INTERESTED",
+    "no estoy interesada": "NOT_INTERESTED", "no me interesa gracias": "NOT_INTERESTED",
+    "no por ahora": "NOT_INTERESTED", "no por ahora gracias": "NOT_INTERESTED",
+}
+
+# Reglas por regex (se compilan una sola vez). Solo se aplican a mensajes cortos.
+# (patrón, etiqueta, vale_si_es_pregunta): "Si?" o "No me interesa?" son ambiguos => LLM.
+AFFIRMATIONS = r"(si|dale|ok|okey|bueno|genial|perfecto|claro|listo|de una|me parece( bien)?)"
+REGEX_RULES = [
+    (re.compile(rf"^{AFFIRMATIONS}( {AFFIRMATIONS})*( gracias)?$"), "READY_TO_BOOK", False),
+    # Anclado: el pedido del link es todo el mensaje (con un "si"/"dale" adelante a lo sumo);
+    # "no me pasa el link" o "todavia no me mandaste el link" van al LLM
+    (re.compile(rf"^({AFFIRMATIONS} )*(por favor )?((me|nos) )?(pasa|pasas|pasame|manda|mandas|mandame|envia|enviame|compart\w*)"
+                r"( me)?( el| tu)? (link|enlace|calendly)( por favor| porfa| gracias)?$"), "READY_TO_BOOK", True),
+    (re.compile(r"^no( gracias)?( (me|nos) interesa| estoy interesad[oa])( gracias)?$"), "NOT_INTERESTED", False),
+]
+REGEX_MAX_WORDS = 6
+
+def normalize_message(text: str) -> str:
+    """minúsculas, sin tildes ni signos, espacios simples y letras repetidas colapsadas ('siii' -> 'si')."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^a-z0-9ñ ]+", " ", text)
+    text = re.sub(r"(.)\1{2,}", r"\1", text)
+    return " ".join(text.split())
+
+class LRUMemo:
+    """Memo acotado (LRU) seguro entre hilos."""
+    def __init__(self, max_size: int = 5000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+class FastIntentClassifier:
+    """
+    Clasificador local que corre ANTES de GPT: tabla exacta, reglas regex y,
+    opcionalmente, un modelo estilo scikit-learn (predict_proba + classes_).
+    Retorna la etiqueta solo cuando está seguro; si no, None (=> se consulta al LLM).
+    """
+    def __init__(self, model_path: str = None, min_confidence: float = 0.9):
+        self.min_confidence = min_confidence
+        self.model = None
+        if model_path:
+            try:
+                with open(model_path, "rb") as f:
+                    self.model = pickle.load(f)
+                logger.info(f"🧠 Modelo de intents cargado desde {model_path}")
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo cargar el modelo de intents ({model_path}): {e}")
+
+    def classify(self, normalized: str, is_question: bool = False):
+        """Retorna (etiqueta, fuente) o (None, None)."""
+        if not normalized:
+            return None, None
+
+        label = EXACT_MATCHES.get(normalized)
+        if label and not is_question:
+            return label, "rules"
+
+        if len(normalized.split()) <= REGEX_MAX_WORDS:
+            for pattern, label, allow_question in REGEX_RULES:
+                if (allow_question or not is_question) and pattern.search(normalized):
+                    return label, "rules"
+
+        if self.model is not None:
+            try:
+                probs = self.model.predict_proba([normalized])[0]
+                best = max(range(len(probs)), key=lambda i: probs[i])
+                label = str(self.model.classes_[best])
+                if probs[best] >= self.min_confidence and label in INTENTS:
+                    return label, "model"
+            except Exception as e:
+                logger.warning(f"⚠️ Error en modelo de intents: {e}")
+
+        return None, None
@@ -0,0 +1,481 @@
+import re
+import json
+import time
+import threading
+import logging
+from sqlalchemy import func
+from app.db import database, models
+from app.core.config import settings
+from app.services.dedup_index import extract_place_id
+
+logger = logging.getLogger(__name__)
+
+# Mismo criterio que el índice del Excel: matcheamos por los últimos 8 dígitos
+PHONE_MATCH_DIGITS = 8
+
+# Si llega un teléfono que no tenemos, como mucho una bajada del Excel por minuto
+MISS_PULL_MIN_SECONDS = 60
+
+# Columnas que escribe add_leads (en ese orden)
+APPEND_HEADERS = ["Nombre", "Phone", "Status", "Notas"]
+
+UPDATED_RANGE_RE = re.compile(r"![A-Z]+(\d+)")
+
+def normalize_phone(phone) -> str:
+    """Deja solo los números."""
+    return re.sub(r'\D', '', str(phone or ""))
+
+class LeadStore:
+    """
+    Tabla 'leads' (SQLite) como fuente de verdad de los leads.
+    Leer leads nuevos, buscar por teléfono o cambiar un estado son consultas
+    locales por índice; el Excel se actualiza aparte (ver LeadSync).
+    Los cambios locales quedan marcados 'dirty' hasta que llegan al Excel, así
+    una bajada de la hoja no pisa un estado que todavía no se subió.
+    """
+    def __init__(self, session_factory=database.SessionLocal):
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+
+    # --- Excel -> tabla ---
+
+    def _fill(self, lead, record: dict, now: float) -> bool:
+        """Copia una fila del Excel al lead. Retorna True si cambió algo."""
+        data = json.dumps(record, ensure_ascii=False, sort_keys=True)
+        if lead.id is not None and lead.data == data:
+            return False
+
+        phone = str(record.get('Phone', record.get('phone', '')))
+        phone_normalized = normalize_phone(phone)
+        if lead.dirty and lead.phone_normalized != phone_normalized:
+            # Alguien movió/borró filas a mano: el estado pendiente era de otro lead
+            lead.dirty = False
+
+        lead.name = str(record.get('Nombre', record.get('name', '')))
+        lead.phone = phone
+        lead.phone_normalized = phone_normalized
+        lead.phone_suffix = phone_normalized[-PHONE_MATCH_DIGITS:] or None
+        lead.notes = str(record.get('Notas', ''))
+        lead.place_id = str(record.get('PlaceId', '')) or extract_place_id(lead.notes)
+        lead.data = data
+        if not lead.dirty:
+            lead.status = str(record.get('Status', '')).strip()
+        lead.updated_at = now
+        return True
+
+    def _sync_state(self, db, spreadsheet_id: str):
+        state = db.get(models.SheetSyncState, spreadsheet_id)
+        if state is None:
+            state = models.SheetSyncState(spreadsheet_id=spreadsheet_id, last_pull_at=0, last_push_at=0, row_count=0)
+            db.add(state)
+        return state
+
+    def apply_sheet_values(self, spreadsheet_id: str, values: list) -> dict:
+        """
+        Vuelca el contenido de la hoja (resultado de get_all_values) en la tabla.
+        Upsert por número de fila; las filas que ya no existen se borran.
+        """
+        headers = values[0] if values else []
+        rows = values[1:]
+        now = time.time()
+        Lead = models.Lead
+        changed = 0
+
+        with self._lock:
+            db = self.session_factory()
+            try:
+                existing = {
+                    lead.sheet_row: lead
+                    for lead in db.query(Lead).filter(Lead.spreadsheet_id == spreadsheet_id)
+                }
+                for offset, row in enumerate(rows):
+                    sheet_row = offset + 2
+                    record = dict(zip(headers, list(row) + [''] * (len(headers) - len(row))))
+                    lead = existing.pop(sheet_row, None)
+                    if lead is None:
+                        lead = Lead(spreadsheet_id=spreadsheet_id, sheet_row=sheet_row, dirty=False)
+                        db.add(lead)
+                    if self._fill(lead, record, now):
+                        changed += 1
+
+                for lead in existing.values():
+                    db.delete(lead)
+
+                state = self._sync_state(db, spreadsheet_id)
+                state.last_pull_at = now
+                state.row_count = len(rows)
+                db.commit()
+            finally:
+                db.close()
+
+        logger.info(f"⬇️ Excel -> leads ({spreadsheet_id}): {len(rows)} filas, {changed} cambios, {len(existing)} borradas.")
+        return {"rows": len(rows), "changed": changed, "deleted": len(existing)}
+
+    def record_appended(self, spreadsheet_id: str, rows: list, response) -> int:
+        """
+        Registra las filas que add_leads acaba de agregar con append_rows, usando
+        el rango que devuelve la API. Si no se puede saber la fila, se fuerza una
+        bajada completa en la próxima sincronización.
+        """
+        match = UPDATED_RANGE_RE.search(str(((response or {}).get("updates") or {}).get("updatedRange", "")))
+        now = time.time()
+        Lead = models.Lead
+
+        with self._lock:
+            db = self.session_factory()
+            try:
+                if match is None:
+                    self._sync_state(db, spreadsheet_id).last_pull_at = 0
+                    db.commit()
+                    return 0
+
+                first_row = int(match.group(1))
+                existing = {
+                    lead.sheet_row: lead
+                    for lead in db.query(Lead).filter(
+                        Lead.spreadsheet_id == spreadsheet_id,
+                        Lead.sheet_row.between(first_row, first_row + len(rows) - 1)
+                    )
+                }
+                for offset, row in enumerate(rows):
+                    sheet_row = first_row + offset
+                    lead = existing.get(sheet_row)
+                    if lead is None:
+                        lead = Lead(spreadsheet_id=spreadsheet_id, sheet_row=sheet_row, dirty=False)
+                        db.add(lead)
+                    self._fill(lead, dict(zip(APPEND_HEADERS, row)), now)
+                state = self._sync_state(db, spreadsheet_id)
+                state.row_count = max(state.row_count, first_row + len(rows) - 2)
+                db.commit()
+            finally:
+                db.close()
+        return len(rows)
+
+    def incremental_plan(self, spreadsheet_id: str) -> tuple:
+        """
+        (high-water mark, {fila: teléfono}) para una bajada incremental: la
+        cantidad de filas ya conocidas y las filas a revisar (las 'New' y la última,
+        que sirve para darse cuenta si alguien borró o movió filas a mano).
+        """
+        Lead = models.Lead
+        db = self.session_factory()
+        try:
+            state = db.get(models.SheetSyncState, spreadsheet_id)
+            if state is None or not state.row_count:
+                return 0, {}
+            last_row = state.row_count + 1
+            watched = {
+                sheet_row: phone or ""
+                for sheet_row, phone in db.query(Lead.sheet_row, Lead.phone_normalized).filter(
+                    Lead.spreadsheet_id == spreadsheet_id,
+                    (Lead.status == "New") | (Lead.sheet_row == last_row)
+                )
+            }
+            return state.row_count, watched
+        finally:
+            db.close()
+
+    def apply_incremental(self, spreadsheet_id: str, checked_rows, new_rows, watched: dict):
+        """
+        Aplica una bajada incremental: 'checked_rows' (Phone/Status de las filas
+        vigiladas) y 'new_rows' (filas completas después del high-water mark),
+        ya leídas del Excel (no generadores: no se llama a la API con el lock tomado).
+        Retorna None si alguna fila vigilada cambió de teléfono (hay que bajar todo).
+        """
+        statuses = {}
+        for row in checked_rows:
+            phone = normalize_phone(row.get('Phone') or row.get('phone'))
+            if watched.get(row.sheet_row) != phone:
+                logger.info(f"🔀 La fila {row.sheet_row} de {spreadsheet_id} cambió de teléfono: bajada completa.")
+                return None
+            statuses[row.sheet_row] = str(row.get('Status')).strip()
+        if len(statuses) != len(watched):
+            return None
+
+        now = time.time()
+        Lead = models.Lead
+        changed = 0
+        added = 0
+
+        with self._lock:
+            db = self.session_factory()
+            try:
+                if statuses:
+                    for lead in db.query(Lead).filter(
+                        Lead.spreadsheet_id == spreadsheet_id, Lead.sheet_row.in_(list(statuses))
+                    ):
+                        status = statuses[lead.sheet_row]
+                        if lead.dirty or lead.status == status:
+                            continue
+                        record = json.loads(lead.data) if lead.data else {}
+                        record['Status'] = status
+                        lead.data = json.dumps(record, ensure_ascii=False, sort_keys=True)
+                        lead.status = status
+                        lead.updated_at = now
+                        changed += 1
+
+                state = self._sync_state(db, spreadsheet_id)
+                existing = {
+                    lead.sheet_row: lead
+                    for lead in db.query(Lead).filter(
+                        Lead.spreadsheet_id == spreadsheet_id, Lead.sheet_row > state.row_count + 1
+                    )
+                }
+                for row in new_rows:
+                    lead = existing.get(row.sheet_row)
+                    if lead is None:
+                        lead = Lead(spreadsheet_id=spreadsheet_id, sheet_row=row.sheet_row, dirty=False)
+                        db.add(lead)
+                    if self._fill(lead, row.to_dict(), now):
+                        added += 1
+                    state.row_count = max(state.row_count, row.sheet_row - 1)
+                state.last_pull_at = now
+                db.commit()
+            finally:
+                db.close()
+
+        logger.info(f"⬇️ Excel -> leads ({spreadsheet_id}, incremental): {added} filas nuevas, {changed} estados cambiados.")
+        return {"added": added, "changed": changed}
+
+    def seconds_since_pull(self, spreadsheet_id: str) -> float:
+        db = self.session_factory()
+        try:
+            state = db.get(models.SheetSyncState, spreadsheet_id)
+        finally:
+            db.close()
+        return time.time() - state.last_pull_at if state else float("inf")
+
+    # --- Lecturas ---
+
+    def new_leads(self, spreadsheet_id: str) -> list:
+        Lead = models.Lead
+        db = self.session_factory()
+        try:
+            return (
+                db.query(Lead)
+                .filter(Lead.spreadsheet_id == spreadsheet_id, Lead.status == "New")
+                .order_by(Lead.sheet_row)
+                .all()
+            )
+        finally:
+            db.close()
+
+    @staticmethod
+    def lead_data(lead) -> dict:
+        """La fila completa del Excel (como get_all_records) para pasarle a GPT."""
+        return json.loads(lead.data) if lead.data else {"Nombre": lead.name, "Phone": lead.phone, "Notas": lead.notes}
+
+    def find_by_phone(self, spreadsheet_id: str, phone: str):
+        """Lead con ese teléfono (o None). Si está repetido gana la primera fila, como en el Excel."""
+        target = normalize_phone(phone)
+        if not target:
+            return None
+        Lead = models.Lead
+        db = self.session_factory()
+        try:
+            query = db.query(Lead).filter(Lead.spreadsheet_id == spreadsheet_id)
+            lead = (
+                query.filter(Lead.phone_suffix == target[-PHONE_MATCH_DIGITS:])
+                .order_by(Lead.sheet_row)
+                .first()
+            )
+            if lead is not None:
+                return lead
+            # Números cortos (menos de 8 dígitos): el teléfono buscado tiene que terminar igual
+            short = query.filter(
+                func.length(Lead.phone_normalized) < PHONE_MATCH_DIGITS,
+                Lead.phone_normalized != ""
+            ).order_by(Lead.sheet_row)
+            return next((l for l in short if target.endswith(l.phone_normalized)), None)
+        finally:
+            db.close()
+
+    # --- Escrituras locales ---
+
+    def set_status(self, lead_id: int, status: str) -> bool:
+        db = self.session_factory()
+        try:
+            updated = (
+                db.query(models.Lead)
+                .filter(models.Lead.id == lead_id)
+                .update({"status": status, "dirty": True, "updated_at": time.time()}, synchronize_session=False)
+            )
+            db.commit()
+            return bool(updated)
+        finally:
+            db.close()
+
+    def dirty_leads(self, spreadsheet_id: str) -> list:
+        Lead = models.Lead
+        db = self.session_factory()
+        try:
+            return (
+                db.query(Lead.id, Lead.sheet_row, Lead.status, Lead.updated_at)
+                .filter(Lead.spreadsheet_id == spreadsheet_id, Lead.dirty.is_(True))
+                .all()
+            )
+        finally:
+            db.close()
+
+    def mark_clean(self, spreadsheet_id: str, pushed: list):
+        """Saca la marca 'dirty' de lo que se subió, salvo que haya cambiado de nuevo mientras tanto."""
+        Lead = models.Lead
+        db = self.session_factory()
+        try:
+            for lead_id, updated_at in pushed:
+                db.query(Lead).filter(Lead.id == lead_id, Lead.updated_at == updated_at).update(
+                    {"dirty": False}, synchronize_session=False
+                )
+            self._sync_state(db, spreadsheet_id).last_push_at = time.time()
+            db.commit()
+        finally:
+            db.close()
+
+class LeadSync:
+    """
+    Hilo que mantiene el Excel y la tabla 'leads' alineados:
+    - sube los estados cambiados localmente (por el write-behind del Excel),
+    - cada LEAD_SYNC_PULL_SECONDS baja lo nuevo de la hoja (incremental; la hoja
+      entera solo si no se puede o si se pide explícitamente con sync(pull=True)).
+    """
+    def __init__(self, store: LeadStore, interval: float = 30, pull_interval: float = 300):
+        self.store = store
+        self.interval = interval
+        self.pull_interval = pull_interval
+        self._services = {}     # spreadsheet_id -> GSheetService
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def track(self, gsheet_service) -> str:
+        """Registra una planilla para sincronizar. Retorna su spreadsheet_id."""
+        spreadsheet_id = gsheet_service.sheet.spreadsheet.id
+        with self._lock:
+            self._services.setdefault(spreadsheet_id, gsheet_service)
+        return spreadsheet_id
+
+    def pull(self, spreadsheet_id: str) -> dict:
+        service = self._services[spreadsheet_id]
+        values = service.sheet.get_all_values()
+        if values:
+            # Ya que bajamos la hoja entera, renovamos las cabeceras (columnas movidas a mano)
+            service.refresh_headers(values[0])
+        return self.store.apply_sheet_values(spreadsheet_id, values)
+
+    def pull_incremental(self, spreadsheet_id: str) -> dict:
+        """
+        Baja solo las filas agregadas después del high-water mark (todas las
+        columnas) y Phone/Status de las filas 'New'. Si nunca se bajó la hoja o
+        alguien movió filas, hace la bajada completa.
+        """
+        service = self._services[spreadsheet_id]
+        watermark, watched = self.store.incremental_plan(spreadsheet_id)
+        if not watermark:
+            return self.pull(spreadsheet_id)
+        # Las lecturas al Excel se hacen acá, antes de tomar el lock de la tabla
+        checked_rows = list(service.iter_rows(['Phone', 'phone', 'Status'], rows=list(watched))) if watched else []
+        new_rows = list(service.iter_rows(first_row=watermark + 2))
+        result = self.store.apply_incremental(spreadsheet_id, checked_rows, new_rows, watched)
+        if result is None:
+            return self.pull(spreadsheet_id)
+        return result
+
+    def push(self, spreadsheet_id: str) -> int:
+        dirty = self.store.dirty_leads(spreadsheet_id)
+        if not dirty:
+            return 0
+        service = self._services[spreadsheet_id]
+        for _, sheet_row, status, _ in dirty:
+            if sheet_row:
+                service.update_row_status(sheet_row, status)
+        service.flush()
+        # Si algo quedó en el buffer (cuota, error) lo dejamos 'dirty' y se reintenta en la próxima vuelta
+        if service.pending_writes() == 0:
+            self.store.mark_clean(spreadsheet_id, [(lead_id, updated_at) for lead_id, _, _, updated_at in dirty])
+        logger.info(f"⬆️ leads -> Excel ({spreadsheet_id}): {len(dirty)} estados.")
+        return len(dirty)
+
+    def sync(self, spreadsheet_id: str, pull: bool = None):
+        """
+        Sube lo pendiente y baja la hoja: pull=True baja la hoja entera; pull=None
+        baja solo lo nuevo (ver pull_incremental) si la última bajada es vieja.
+        """
+        with self._sync_lock:
+            self.push(spreadsheet_id)
+            if pull:
+                self.pull(spreadsheet_id)
+            elif pull is None and self.store.seconds_since_pull(spreadsheet_id) > self.pull_interval:
+                self._pull_new(spreadsheet_id)
+
+    def refresh(self, spreadsheet_id: str) -> dict:
+        """Sube lo pendiente y trae solo lo nuevo del Excel (ver pull_incremental)."""
+        with self._sync_lock:
+            self.push(spreadsheet_id)
+            return self._pull_new(spreadsheet_id)
+
+    def _pull_new(self, spreadsheet_id: str) -> dict:
+        if settings.LEAD_INCREMENTAL_PULL:
+            return self.pull_incremental(spreadsheet_id)
+        return self.pull(spreadsheet_id)
+
+    def set_status(self, lead_id: int, status: str) -> bool:
+        updated = self.store.set_status(lead_id, status)
+        if updated:
+            self._wake.set()
+        return updated
+
+    def update_status_by_phone(self, gsheet_service, phone: str, status: str) -> bool:
+        spreadsheet_id = self.track(gsheet_service)
+        lead = self.store.find_by_phone(spreadsheet_id, phone)
+        if lead is None and self.store.seconds_since_pull(spreadsheet_id) > MISS_PULL_MIN_SECONDS:
+            # Puede ser una fila agregada a mano al Excel: bajamos lo nuevo y reintentamos
+            self.refresh(spreadsheet_id)
+            lead = self.store.find_by_phone(spreadsheet_id, phone)
+        if lead is None:
+            return False
+        return self.set_status(lead.id, status)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="lead-sync", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            with self._lock:
+                spreadsheet_ids = list(self._services)
+            for spreadsheet_id in spreadsheet_ids:
+                try:
+                    self.sync(spreadsheet_id)
+                except Exception as e:
+                    logger.error(f"❌ Error sincronizando leads con el Excel ({spreadsheet_id}): {e}")
+
+    def shutdown(self):
+        """Frena el hilo y sube los estados pendientes (se llama al apagar la app)."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+        with self._lock:
+            spreadsheet_ids = list(self._services)
+        for spreadsheet_id in spreadsheet_ids:
+            try:
+                with self._sync_lock:
+                    self.push(spreadsheet_id)
+            except Exception as e:
+                logger.error(f"❌ Error subiendo estados pendientes ({spreadsheet_id}): {e}")
+
+lead_store = LeadStore()
+lead_sync = LeadSync(
+    lead_store,
+    interval=settings.LEAD_SYNC_INTERVAL_SECONDS,
+    pull_interval=settings.LEAD_SYNC_PULL_SECONDS
+)
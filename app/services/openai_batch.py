@@ -0,0 +1,131 @@
+import json
+import time
+import asyncio
+import logging
+from app.utils.metrics import track
+
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+class OpenAIBatchTransport:
+    """
+    Transporte real contra la Batch API de OpenAI. Cualquier objeto con los
+    mismos métodos sirve (ej: un servidor falso local para pruebas).
+    """
+    def __init__(self, client):
+        self.client = client
+
+    def upload(self, jsonl: bytes) -> str:
+        with track("openai", "files.create", request=jsonl):
+            return self.client.files.create(file=("qualify_batch.jsonl", jsonl), purpose="batch").id
+
+    def create(self, input_file_id: str) -> str:
+        with track("openai", "batches.create"):
+            return self.client.batches.create(
+                input_file_id=input_file_id, endpoint=BATCH_ENDPOINT, completion_window="24h"
+            ).id
+
+    def retrieve(self, batch_id: str) -> dict:
+        with track("openai", "batches.retrieve"):
+            batch = self.client.batches.retrieve(batch_id)
+        return {"status": batch.status, "output_file_id": batch.output_file_id, "error_file_id": batch.error_file_id}
+
+    def download(self, file_id: str) -> str:
+        with track("openai", "files.content") as call:
+            text = self.client.files.content(file_id).text
+            call.response_bytes = len(text)
+        return text
+
+    def cancel(self, batch_id: str):
+        with track("openai", "batches.cancel"):
+            self.client.batches.cancel(batch_id)
+
+class BatchRunner:
+    """
+    Manda muchos chat.completions juntos por la Batch API: arma el JSONL, lo
+    sube en tandas de 'chunk_size' pedidos y hace polling. Los resultados se
+    devuelven a medida que termina cada tanda (no hay que esperar a todas).
+    """
+    def __init__(self, transport, chunk_size: int = 500, poll_interval: float = 30, timeout: float = 24 * 3600):
+        self.transport = transport
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    @staticmethod
+    def to_jsonl(requests: list) -> bytes:
+        """[(custom_id, body), ...] -> líneas del archivo de entrada de la Batch API."""
+        lines = (
+            json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body},
+                       ensure_ascii=False)
+            for custom_id, body in requests
+        )
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    @staticmethod
+    def parse_output(text: str):
+        """Líneas del archivo de salida -> (custom_id, contenido o None, error o None)."""
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            if item.get("error") or response.get("status_code", 200) != 200:
+                yield item.get("custom_id"), None, item.get("error") or body.get("error") or "status != 200"
+                continue
+            try:
+                yield item.get("custom_id"), body["choices"][0]["message"]["content"], None
+            except (KeyError, IndexError, TypeError) as e:
+                yield item.get("custom_id"), None, f"respuesta inesperada: {e}"
+
+    async def _submit(self, chunk: list) -> str:
+        file_id = await asyncio.to_thread(self.transport.upload, self.to_jsonl(chunk))
+        return await asyncio.to_thread(self.transport.create, file_id)
+
+    async def stream(self, requests: list):
+        """
+        Async generator de (custom_id, contenido, error). Los pedidos que no
+        vuelvan (batch fallido, vencido o timeout) salen con contenido None.
+        """
+        pending = {}    # batch_id -> custom_ids de la tanda
+        for i in range(0, len(requests), self.chunk_size):
+            chunk = requests[i:i + self.chunk_size]
+            batch_id = await self._submit(chunk)
+            pending[batch_id] = {custom_id for custom_id, _ in chunk}
+            logger.info(f"📦 Batch {batch_id} enviado ({len(chunk)} pedidos).")
+
+        deadline = time.monotonic() + self.timeout
+        while pending:
+            for batch_id in list(pending):
+                info = await asyncio.to_thread(self.transport.retrieve, batch_id)
+                if info["status"] not in BATCH_TERMINAL_STATUSES:
+                    continue
+
+                custom_ids = pending.pop(batch_id)
+                logger.info(f"📦 Batch {batch_id}: {info['status']}.")
+                for file_id in (info.get("output_file_id"), info.get("error_file_id")):
+                    if not file_id:
+                        continue
+                    text = await asyncio.to_thread(self.transport.download, file_id)
+                    for custom_id, content, error in self.parse_output(text):
+                        custom_ids.discard(custom_id)
+                        yield custom_id, content, error
+                for custom_id in custom_ids:
+                    yield custom_id, None, f"batch {info['status']} sin resultado"
+
+            if not pending:
+                break
+            if time.monotonic() > deadline:
+                for batch_id, custom_ids in pending.items():
+                    logger.error(f"⏰ Batch {batch_id} no terminó a tiempo, se cancela.")
+                    try:
+                        await asyncio.to_thread(self.transport.cancel, batch_id)
+                    except Exception as e:
+                        logger.error(f"❌ No se pudo cancelar el batch {batch_id}: {e}")
+                    for custom_id in custom_ids:
+                        yield custom_id, None, "timeout"
+                break
+            await asyncio.sleep(self.poll_interval)
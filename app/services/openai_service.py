@@ -1,14 +1,63 @@
-from openai import OpenAI
+import threading
 from app.core.config import settings
+from app.utils.metrics import track
+from app.services.intent_classifier import FastIntentClassifier, LRUMemo, normalize_message, INTENTS
 
 class OpenAIService:
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    def __init__(self, client=None):
+        # 'client' permite inyectar un cliente compatible (ej: el fake de los benchmarks)
+        if client is None:
+            from openai import OpenAI   # import diferido: el SDK tarda en cargar
+            client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = client
+
+        # Tier local de clasificación + memo de respuestas del LLM
+        self.fast_classifier = FastIntentClassifier(
+            model_path=settings.INTENT_MODEL_PATH,
+            min_confidence=settings.INTENT_MODEL_MIN_CONFIDENCE
+        )
+        self.intent_memo = LRUMemo(max_size=settings.INTENT_MEMO_SIZE)
+        self.intent_counters = {"rules": 0, "model": 0, "memo": 0, "llm": 0}
+        self._counters_lock = threading.Lock()
+
+    def _count_intent(self, source: str):
+        with self._counters_lock:
+            self.intent_counters[source] += 1
+
+    def intent_stats(self) -> dict:
+        """Qué fracción de los mensajes se resolvió sin llamar a GPT."""
+        with self._counters_lock:
+            counters = dict(self.intent_counters)
+        total = sum(counters.values())
+        local = total - counters["llm"]
+        return {**counters, "total": total, "fast_path_ratio": round(local / total, 3) if total else 0.0}
 
     def classify_intent(self, user_message: str) -> str:
-        # Normalizamos el mensaje a minúsculas para análisis más fácil
-        msg_lower = user_message.lower()
-        
+        # Normalizamos el mensaje (minúsculas, sin tildes ni signos) para análisis más fácil
+        normalized = normalize_message(user_message)
+        is_question = "?" in user_message
+
+        # 1. Tier local (microsegundos): "Si", "Dale", "Ok", "No gracias"...
+        label, source = self.fast_classifier.classify(normalized, is_question=is_question)
+        if label:
+            self._count_intent(source)
+            return label
+
+        # 2. Memo de lo que ya respondió GPT para el mismo texto
+        memo_key = f"{normalized}?" if is_question else normalized
+        label = self.intent_memo.get(memo_key)
+        if label:
+            self._count_intent("memo")
+            return label
+
+        # 3. Escalamos al LLM
+        label = self._classify_intent_llm(user_message)
+        self._count_intent("llm")
+        if label in INTENTS and normalized:
+            self.intent_memo.set(memo_key, label)
+        return label
+
+    def _classify_intent_llm(self, user_message: str) -> str:
         prompt = f"""
         Analiza el mensaje del prospecto: '{user_message}'.
         
@@ -32,15 +81,44 @@ class OpenAIService:
         Responde SOLO con la etiqueta.
         """
         
-        response = self.client.chat.completions.create(
-            model="gpt-4o", 
-            messages=[
-                {"role": "system", "content": "Eres un clasificador de intenciones agresivo para cierre de ventas. Ante la duda de una afirmación, clasifica como READY_TO_BOOK."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
-        )
-        return response.choices[0].message.content.strip().replace("'", "").replace('"', "").replace(".", "")
+        messages = [
+            {"role": "system", "content": "Eres un clasificador de intenciones agresivo para cierre de ventas. Ante la duda de una afirmación, clasifica como READY_TO_BOOK."},
+            {"role": "user", "content": prompt}
+        ]
+        with track("openai", "classify_intent", request=messages) as call:
+            response = self.client.chat.completions.create(
+                model="gpt-4o", 
+                messages=messages,
+                temperature=0
+            )
+            content = response.choices[0].message.content
+            call.response_bytes = len(content or "")
+        return content.strip().replace("'", "").replace('"', "").replace(".", "")
+
+    def summarize_conversation(self, previous_summary: str, messages: list) -> str:
+        """Resumen incremental: el resumen anterior + los mensajes que salieron de la ventana."""
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        prompt = f"""
+        Resumen previo de la conversación con el prospecto:
+        {previous_summary or "(vacío)"}
+
+        Mensajes nuevos:
+        {transcript}
+
+        Actualiza el resumen en menos de 150 palabras. Conserva datos del negocio,
+        problemas que contó, objeciones y si ya se le propuso la llamada.
+        Responde SOLO con el resumen.
+        """
+        messages = [{"role": "user", "content": prompt}]
+        with track("openai", "summarize_conversation", request=messages) as call:
+            response = self.client.chat.completions.create(
+                model=settings.SUMMARY_MODEL,
+                messages=messages,
+                temperature=0
+            )
+            content = response.choices[0].message.content
+            call.response_bytes = len(content or "")
+        return content.strip()
 
     def generate_response(self, conversation_history: list) -> str:
         system_prompt = f"""
@@ -59,9 +137,12 @@ class OpenAIService:
         messages = [{"role": "system", "content": system_prompt}]
         messages.extend(conversation_history)
         
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0.7
-        )
-        return response.choices[0].message.content.strip()
\ No newline at end of file
+        with track("openai", "generate_response", request=messages) as call:
+            response = self.client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                temperature=0.7
+            )
+            content = response.choices[0].message.content
+            call.response_bytes = len(content or "")
+        return content.strip()
\ No newline at end of file
@@ -0,0 +1,279 @@
+import time
+import threading
+import logging
+from sqlalchemy.exc import IntegrityError
+from app.db import database, models
+from app.core.config import settings
+from app.services.twilio_service import TwilioService
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = {"sent", "failed", "unknown"}
+
+def _is_transient(error: Exception) -> bool:
+    """429 y 5xx de Twilio o errores de red => se reintenta. El resto (número inválido, etc.) no."""
+    from twilio.base.exceptions import TwilioRestException
+    if isinstance(error, TwilioRestException):
+        return error.status == 429 or error.status >= 500
+    return True
+
+class Outbox:
+    """
+    Outbox persistente (tabla outbound_messages) + dispatcher.
+    Cada mensaje se registra ANTES de mandarse con una clave de idempotencia;
+    los hilos dispatcher lo mandan respetando un turno por número de origen
+    (compartido en la base entre workers), reintentan los errores transitorios
+    con backoff y guardan el SID.
+    Si el proceso muere a mitad de un envío, el mensaje queda 'unknown' y no
+    se reenvía solo (mejor revisar que mandar dos veces).
+    """
+    def __init__(self, session_factory=database.SessionLocal, twilio_factory=TwilioService,
+                 num_dispatchers: int = None, max_attempts: int = None, poll_interval: float = 1.0,
+                 sending_stale_seconds: float = None):
+        self.session_factory = session_factory
+        self.twilio_factory = twilio_factory
+        self.num_dispatchers = num_dispatchers or settings.OUTBOX_DISPATCHERS
+        self.max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+        # Con varios workers no se puede marcar 'unknown' todo lo que está 'sending':
+        # puede estar saliendo en otro. Solo lo que lleva más de esto (worker muerto).
+        self.sending_stale_seconds = sending_stale_seconds or settings.OUTBOX_SENDING_STALE_SECONDS
+        self.poll_interval = poll_interval
+        self._twilio = None
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_recovery = 0.0
+
+    @property
+    def twilio(self) -> TwilioService:
+        if self._twilio is None:
+            self._twilio = self.twilio_factory()
+        return self._twilio
+
+    def _reserve_send_slot(self, from_number: str) -> float:
+        """
+        Reserva el próximo turno de envío del número de origen (tabla outbox_sender_slots).
+        El turno está en la base y no en memoria: con varios workers el límite sigue
+        siendo TWILIO_MESSAGES_PER_SECOND por número, no por proceso. Retorna a qué hora mandar.
+        """
+        Slot = models.OutboxSenderSlot
+        interval = 1.0 / settings.TWILIO_MESSAGES_PER_SECOND
+        while True:
+            now = time.time()
+            db = self.session_factory()
+            try:
+                slot = db.get(Slot, from_number)
+                if slot is None:
+                    db.add(Slot(from_number=from_number, next_send_at=now + interval))
+                    try:
+                        db.commit()
+                        return now
+                    except IntegrityError:
+                        db.rollback()
+                        continue
+                send_at = max(now, slot.next_send_at)
+                # UPDATE condicional: si otro dispatcher (de este u otro worker) tomó el turno, reintentamos
+                reserved = db.query(Slot).filter(
+                    Slot.from_number == from_number, Slot.next_send_at == slot.next_send_at
+                ).update({"next_send_at": send_at + interval}, synchronize_session=False)
+                db.commit()
+                if reserved:
+                    return send_at
+            finally:
+                db.close()
+
+    # --- API pública ---
+    def enqueue(self, to: str, body: str, idempotency_key: str) -> int:
+        """
+        Registra el mensaje y retorna su id. Si la clave ya existe no crea otro:
+        retorna el existente (y solo re-encola si había fallado definitivamente).
+        """
+        now = time.time()
+        Msg = models.OutboundMessage
+        db = self.session_factory()
+        try:
+            existing = db.query(Msg).filter(Msg.idempotency_key == idempotency_key).first()
+            if existing is None:
+                message = Msg(
+                    idempotency_key=idempotency_key, to_number=to, from_number=self.twilio.sender_for(to),
+                    body=body, status="queued", attempts=0, next_attempt_at=now,
+                    created_at=now, updated_at=now
+                )
+                db.add(message)
+                try:
+                    db.commit()
+                    message_id = message.id
+                except IntegrityError:
+                    # Otro hilo registró la misma clave justo antes
+                    db.rollback()
+                    existing = db.query(Msg).filter(Msg.idempotency_key == idempotency_key).first()
+            if existing is not None:
+                if existing.status == "failed":
+                    existing.status, existing.attempts, existing.next_attempt_at = "queued", 0, now
+                    existing.updated_at = now
+                    db.commit()
+                message_id = existing.id
+        finally:
+            db.close()
+
+        self._ensure_started()
+        self._wake.set()
+        return message_id
+
+    def get(self, message_id: int):
+        db = self.session_factory()
+        try:
+            return db.get(models.OutboundMessage, message_id)
+        finally:
+            db.close()
+
+    def send_and_wait(self, to: str, body: str, idempotency_key: str, timeout: float = 120):
+        """Encola y espera el resultado. Retorna el SID o None si falló / no terminó a tiempo."""
+        message_id = self.enqueue(to, body, idempotency_key)
+        with self._lock:
+            event = self._waiters.setdefault(message_id, threading.Event())
+
+        deadline = time.monotonic() + timeout
+        while True:
+            message = self.get(message_id)
+            if message.status in FINAL_STATUSES:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            event.wait(min(remaining, 5))
+
+        with self._lock:
+            self._waiters.pop(message_id, None)
+        if message.status == "unknown":
+            logger.warning(f"⚠️ Mensaje {idempotency_key} en estado 'unknown': revisar en Twilio antes de reenviar.")
+        return message.sid if message.status == "sent" else None
+
+    # --- Dispatcher ---
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._recover_interrupted()
+            self._stop.clear()
+            for i in range(self.num_dispatchers):
+                t = threading.Thread(target=self._run, name=f"outbox-{i}", daemon=True)
+                self._threads.append(t)
+                t.start()
+        logger.info(f"📤 Outbox iniciado con {self.num_dispatchers} dispatcher/s.")
+
+    def _ensure_started(self):
+        if not self._threads:
+            self.start()
+
+    def shutdown(self, timeout: float = 10):
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for t in threads:
+            t.join(timeout=timeout)
+
+    def _recover_interrupted(self):
+        """Mensajes que quedaron 'sending' de un proceso que murió: no sabemos si salieron."""
+        Msg = models.OutboundMessage
+        now = time.time()
+        self._last_recovery = now
+        db = self.session_factory()
+        try:
+            count = db.query(Msg).filter(
+                Msg.status == "sending", Msg.updated_at < now - self.sending_stale_seconds
+            ).update(
+                {"status": "unknown", "error": "Interrumpido durante el envío", "updated_at": time.time()},
+                synchronize_session=False
+            )
+            db.commit()
+            if count:
+                logger.warning(f"⚠️ {count} mensajes quedaron a mitad de envío y se marcaron 'unknown'.")
+        finally:
+            db.close()
+
+    def _claim_next(self):
+        """Toma el próximo mensaje vencido y lo marca 'sending' (atómico entre dispatchers)."""
+        Msg = models.OutboundMessage
+        now = time.time()
+        db = self.session_factory()
+        try:
+            candidates = (
+                db.query(Msg.id)
+                .filter(Msg.status == "queued", Msg.next_attempt_at <= now)
+                .order_by(Msg.next_attempt_at, Msg.id)
+                .limit(5)
+                .all()
+            )
+            for (message_id,) in candidates:
+                claimed = db.query(Msg).filter(Msg.id == message_id, Msg.status == "queued").update(
+                    {"status": "sending", "attempts": Msg.attempts + 1, "updated_at": now},
+                    synchronize_session=False
+                )
+                db.commit()
+                if claimed:
+                    message = db.get(Msg, message_id)
+                    db.expunge(message)
+                    return message
+            return None
+        finally:
+            db.close()
+
+    def _finish(self, message, **fields):
+        db = self.session_factory()
+        try:
+            db.query(models.OutboundMessage).filter(models.OutboundMessage.id == message.id).update(
+                {**fields, "updated_at": time.time()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+        with self._lock:
+            event = self._waiters.get(message.id)
+        if event is not None and fields.get("status") in FINAL_STATUSES:
+            event.set()
+
+    def _dispatch(self, message):
+        wait = self._reserve_send_slot(message.from_number) - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            sid = self.twilio.send_message(to=message.to_number, body=message.body, from_number=message.from_number)
+        except Exception as e:
+            if _is_transient(e) and message.attempts < self.max_attempts:
+                wait = min(2 ** message.attempts, 300)
+                logger.warning(f"⏳ Twilio falló ({e}). Reintento {message.attempts}/{self.max_attempts} en {wait}s.")
+                self._finish(message, status="queued", next_attempt_at=time.time() + wait, error=str(e))
+            else:
+                logger.error(f"❌ Mensaje {message.idempotency_key} falló definitivamente: {e}")
+                self._finish(message, status="failed", error=str(e))
+            return
+        self._finish(message, status="sent", sid=sid, error=None)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                message = self._claim_next()
+            except Exception as e:
+                logger.error(f"❌ Error leyendo el outbox: {e}")
+                message = None
+            if message is None:
+                if time.time() - self._last_recovery > self.sending_stale_seconds:
+                    try:
+                        self._recover_interrupted()
+                    except Exception as e:
+                        logger.error(f"❌ Error revisando envíos interrumpidos: {e}")
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            try:
+                self._dispatch(message)
+            except Exception as e:
+                # Ej: 'database is locked' al guardar el resultado. El hilo sigue vivo; el
+                # mensaje queda 'sending' y _recover_interrupted lo marca 'unknown'.
+                logger.error(f"❌ Error despachando el mensaje {message.idempotency_key}: {e}")
+
+outbox = Outbox()
@@ -0,0 +1,259 @@
+import re
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from app.core.config import settings
+from app.utils.disk_cache import PersistentCache, make_key
+from app.utils.metrics import track, payload_size
+
+logger = logging.getLogger(__name__)
+
+APIFY_ACTOR_ID = "compass/crawler-google-places"
+
+def apify_client_factory(token: str):
+    """Cliente real de Apify (import diferido: solo se carga el SDK si se scrapea)."""
+    from apify_client import ApifyClient
+    return ApifyClient(token)
+
+# Estados finales de un run de Apify
+APIFY_TERMINAL_STATUSES = {"SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"}
+
+class ScrapeCancelled(Exception):
+    """El usuario canceló el scraping desde el dashboard."""
+
+class ApifyStartError(Exception):
+    """No se pudo arrancar el actor (token inválido, sin créditos, etc.)."""
+
+# Un semáforo por token de Apify: limita los runs simultáneos de cada cuenta
+_token_semaphores = {}
+_token_semaphores_lock = threading.Lock()
+
+def _token_semaphore(apify_token: str, max_parallel: int) -> threading.BoundedSemaphore:
+    with _token_semaphores_lock:
+        if apify_token not in _token_semaphores:
+            _token_semaphores[apify_token] = threading.BoundedSemaphore(max_parallel)
+        return _token_semaphores[apify_token]
+
+# Caché de resultados de Apify: repetir una búsqueda reciente no vuelve a correr el actor
+_search_cache = None
+_search_cache_lock = threading.Lock()
+
+def get_search_cache() -> PersistentCache:
+    global _search_cache
+    with _search_cache_lock:
+        if _search_cache is None:
+            _search_cache = PersistentCache(
+                namespace="apify_search",
+                ttl_seconds=settings.APIFY_CACHE_TTL_HOURS * 3600,
+                max_entries=settings.APIFY_CACHE_MAX_ENTRIES
+            )
+        return _search_cache
+
+def search_cache_key(search: str, language: str, only_direct_places: bool) -> str:
+    """El límite NO forma parte de la clave: una búsqueda más grande sirve para una más chica."""
+    normalized = " ".join(search.lower().split())
+    return make_key(normalized, language, bool(only_direct_places))
+
+def project_item(item: dict) -> dict:
+    """Solo los campos que usamos, para que la caché ocupe poco."""
+    return {
+        "title": item.get("title"),
+        "phone": item.get("phoneUnformatted") or item.get("phone"),
+        "website": item.get("website"),
+        "googleMapsUrl": item.get("googleMapsUrl"),
+        "placeId": item.get("placeId"),
+    }
+
+def build_queries(cities: list, niches: list, country: str = None) -> list:
+    """Matriz ciudades x nichos -> [(niche, city, search_string), ...] sin repetidos."""
+    queries = []
+    seen = set()
+    for city in cities:
+        for niche in niches:
+            search = f"{niche} en {city}, {country}" if country else f"{niche} en {city}"
+            key = " ".join(search.lower().split())
+            if key not in seen:
+                seen.add(key)
+                queries.append((niche, city, search))
+    return queries
+
+def item_to_lead(item: dict, niche: str = None):
+    """Convierte un item de Apify en lead del Excel. None si no tiene teléfono."""
+    # Apify a veces devuelve el teléfono en 'phone' o 'phoneUnformatted'
+    phone = item.get("phoneUnformatted") or item.get("phone")
+    if not phone:
+        return None
+    notes = f"Web: {item.get('website')} | Maps: {item.get('googleMapsUrl')}"
+    return {
+        "Nombre": item.get("title"),
+        "Phone": phone,
+        "Notas": f"Nicho: {niche} | {notes}" if niche else notes,
+        # No va al Excel; se usa para detectar duplicados
+        "PlaceId": item.get("placeId")
+    }
+
+class ScrapeEngine:
+    """
+    Motor único de scraping de Google Maps (actor de Apify), usado por el
+    dashboard (ScraperService) y por el CLI (scraper.py).
+    El cliente de Apify es inyectable ('client_factory') para poder probarlo contra un fake local.
+    """
+    def __init__(self, apify_token: str, client_factory=apify_client_factory, max_parallel: int = None, use_cache: bool = True):
+        self.client = client_factory(apify_token)
+        self.max_parallel = max_parallel or settings.APIFY_MAX_PARALLEL_RUNS
+        self._semaphore = _token_semaphore(apify_token, self.max_parallel)
+        self.cache = get_search_cache() if use_cache else None
+        # Búsquedas de este motor que se respondieron desde la caché
+        self.served_from_cache = set()
+
+    def _cached_items(self, search: str, limit: int, language: str, only_direct_places: bool):
+        """Items cacheados si alcanzan para 'limit' (o si la búsqueda ya se agotó), si no None."""
+        if self.cache is None:
+            return None
+        cached = self.cache.get(search_cache_key(search, language, only_direct_places))
+        if cached is None:
+            return None
+        # 'exhausted': Apify devolvió menos lugares que el límite pedido => no hay más
+        if cached["limit"] >= limit or cached["exhausted"]:
+            return cached["items"][:limit]
+        return None
+
+    def _store_items(self, search: str, limit: int, language: str, only_direct_places: bool, items: list):
+        if self.cache is None:
+            return
+        key = search_cache_key(search, language, only_direct_places)
+        previous = self.cache.get(key)
+        if previous is not None and previous["limit"] > limit:
+            return
+        self.cache.set(key, {"limit": limit, "exhausted": len(items) < limit, "items": items})
+
+    def _run_input(self, search: str, limit: int, language: str, only_direct_places: bool) -> dict:
+        return {
+            "searchStringsArray": [search],
+            "maxCrawledPlacesPerSearch": limit,
+            "language": language,
+            "onlyDirectPlaces": only_direct_places,
+        }
+
+    def stream_query(self, search: str, limit: int, language: str = "es", only_direct_places: bool = False,
+                     progress=None, cancel_event=None, poll_secs: int = 5, page_size: int = 100):
+        """
+        Generador de items de UNA búsqueda. Arranca el actor y va leyendo el dataset
+        (por offset) MIENTRAS corre; cuando termina, vacía el resto.
+        Si el actor no arranca se lanza ApifyStartError (antes del primer item).
+        Los items salen como proyección compacta (ver project_item) y, si la misma
+        búsqueda se hizo hace poco con un límite igual o mayor, vienen de la caché.
+        """
+        progress = progress or (lambda phase, **data: None)
+
+        cached = self._cached_items(search, limit, language, only_direct_places)
+        if cached is not None:
+            self.served_from_cache.add(search)
+            progress("cache_hit", search=search, items=len(cached))
+            yield from cached
+            return
+
+        fetched = []
+        with self._semaphore:
+            progress("running_actor", search=search)
+            try:
+                with track("apify", "actor.start"):
+                    run = self.client.actor(APIFY_ACTOR_ID).start(
+                        run_input=self._run_input(search, limit, language, only_direct_places)
+                    )
+            except Exception as e:
+                raise ApifyStartError(str(e)) from e
+            run_client = self.client.run(run["id"])
+            dataset = self.client.dataset(run["defaultDatasetId"])
+            offset = 0
+            reason = "el consumidor dejó de leer"
+
+            try:
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        reason = "cancelado por el usuario"
+                        raise ScrapeCancelled()
+
+                    finished = run.get("status") in APIFY_TERMINAL_STATUSES
+
+                    # Leemos todas las páginas nuevas disponibles
+                    while True:
+                        with track("apify", "dataset.list_items") as call:
+                            page = dataset.list_items(offset=offset, limit=page_size)
+                            call.response_bytes = payload_size(page.items)
+                        for item in page.items:
+                            item = project_item(item)
+                            fetched.append(item)
+                            yield item
+                        offset += len(page.items)
+                        if len(page.items) < page_size:
+                            break
+
+                    progress("items_fetched", search=search, items=offset, apify_status=run.get("status"))
+
+                    if finished:
+                        break
+                    with track("apify", "run.wait_for_finish"):
+                        run = run_client.wait_for_finish(wait_secs=poll_secs) or run
+            finally:
+                # Cancelación, error de Apify o del que consume el stream (ej: add_leads_stream):
+                # si el run sigue vivo lo abortamos, si no sigue corriendo (y cobrando) hasta el límite
+                if run.get("status") not in APIFY_TERMINAL_STATUSES:
+                    logger.info(f"🛑 Abortando run de Apify {run['id']} ({reason}).")
+                    try:
+                        with track("apify", "run.abort"):
+                            run_client.abort()
+                    except Exception as e:
+                        logger.error(f"❌ No se pudo abortar el run de Apify {run['id']}: {e}")
+
+            if run.get("status") != "SUCCEEDED":
+                raise Exception(f"El run de Apify terminó con estado {run.get('status')}")
+
+        self._store_items(search, limit, language, only_direct_places, fetched)
+
+    def run_batch(self, queries: list, limit: int, language: str = "es", only_direct_places: bool = False,
+                  progress=None, cancel_event=None) -> dict:
+        """
+        Corre varias búsquedas [(niche, city, search), ...] en paralelo (máximo
+        'max_parallel' runs por token) y une los resultados deduplicando por
+        placeId / teléfono en una sola pasada.
+        Retorna {"leads": [...], "raw_items": N, "from_cache": N, "errors": {search: mensaje}}.
+        """
+        progress = progress or (lambda phase, **data: None)
+
+        def collect(niche, search):
+            return niche, list(self.stream_query(
+                search, limit, language, only_direct_places, progress=progress, cancel_event=cancel_event
+            ))
+
+        leads = []
+        seen = set()
+        raw_items = 0
+        errors = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="apify") as executor:
+            futures = {executor.submit(collect, niche, search): search for niche, _, search in queries}
+            for future in as_completed(futures):
+                search = futures[future]
+                try:
+                    niche, items = future.result()
+                except ScrapeCancelled:
+                    raise
+                except Exception as e:
+                    logger.error(f"❌ Falló la búsqueda '{search}': {e}")
+                    errors[search] = str(e)
+                    continue
+
+                raw_items += len(items)
+                for item in items:
+                    lead = item_to_lead(item, niche)
+                    if lead is None:
+                        continue
+                    keys = {k for k in (lead["PlaceId"], re.sub(r"\D", "", str(lead["Phone"]))) if k}
+                    if keys & seen:
+                        continue
+                    seen.update(keys)
+                    leads.append(lead)
+                progress("query_done", search=search, items=len(items), merged_leads=len(leads))
+
+        return {"leads": leads, "raw_items": raw_items, "from_cache": len(self.served_from_cache), "errors": errors}
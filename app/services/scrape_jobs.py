@@ -0,0 +1,303 @@
+import time
+import uuid
+import json
+import asyncio
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from app.db import database, models
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = {"success", "error", "cancelled"}
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+class ScrapeJob:
+    """
+    Una búsqueda del dashboard corriendo en segundo plano. El estado y los
+    eventos viven en la base (tablas scrape_jobs y scrape_job_events): con
+    varios workers, cualquiera puede consultarla, seguir su stream o cancelarla,
+    no solo el que la está corriendo.
+    """
+    def __init__(self, job_id: str, owner: str, session_factory=database.SessionLocal):
+        self.id = job_id
+        self.owner = owner
+        self.session_factory = session_factory
+        # Solo lo usa el worker que corre el job (ScrapeJobManager lo activa si se pide cancelar)
+        self.cancel_event = threading.Event()
+
+    def _add_event(self, db, phase: str, ts: float, **data):
+        db.add(models.ScrapeJobEvent(job_id=self.id, payload=_dumps({"phase": phase, "ts": ts, **data})))
+
+    def emit(self, phase: str, **data):
+        db = self.session_factory()
+        try:
+            db.query(models.ScrapeJobState).filter(models.ScrapeJobState.id == self.id).update(
+                {"phase": phase}, synchronize_session=False
+            )
+            self._add_event(db, phase, time.time(), **data)
+            db.commit()
+        finally:
+            db.close()
+
+    def set_running(self):
+        State = models.ScrapeJobState
+        db = self.session_factory()
+        try:
+            db.query(State).filter(State.id == self.id, State.status == "queued").update(
+                {"status": "running"}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def finish(self, result: dict) -> bool:
+        """Guarda el resultado. Solo cuenta el primero (ej: el apagado ya lo dio por interrumpido)."""
+        State = models.ScrapeJobState
+        status = result.get("status") if result.get("status") in FINAL_STATUSES else "error"
+        now = time.time()
+        db = self.session_factory()
+        try:
+            finished = db.query(State).filter(State.id == self.id, State.status.notin_(FINAL_STATUSES)).update(
+                {"status": status, "phase": status, "result": _dumps(result), "finished_at": now},
+                synchronize_session=False
+            )
+            if finished:
+                self._add_event(db, status, now, result=result)
+            db.commit()
+            return bool(finished)
+        finally:
+            db.close()
+
+    def _state(self, db):
+        state = db.get(models.ScrapeJobState, self.id)
+        if state is None:
+            raise KeyError(self.id)
+        return state
+
+    @property
+    def status(self) -> str:
+        db = self.session_factory()
+        try:
+            return self._state(db).status
+        finally:
+            db.close()
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINAL_STATUSES
+
+    def events_since(self, after_id: int = 0) -> list:
+        """[(id, evento)] posteriores a 'after_id', en orden."""
+        Event = models.ScrapeJobEvent
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(Event.id, Event.payload)
+                .filter(Event.job_id == self.id, Event.id > after_id)
+                .order_by(Event.id)
+                .all()
+            )
+            return [(event_id, json.loads(payload)) for event_id, payload in rows]
+        finally:
+            db.close()
+
+    def snapshot(self) -> dict:
+        Event = models.ScrapeJobEvent
+        db = self.session_factory()
+        try:
+            state = self._state(db)
+            last_event = (
+                db.query(Event.payload).filter(Event.job_id == self.id).order_by(Event.id.desc()).first()
+            )
+            return {
+                "job_id": self.id,
+                "status": state.status,
+                "phase": state.phase,
+                "params": json.loads(state.params),
+                "result": json.loads(state.result) if state.result else None,
+                "created_at": state.created_at,
+                "finished_at": state.finished_at,
+                "last_event": json.loads(last_event.payload) if last_event else None,
+            }
+        finally:
+            db.close()
+
+class ScrapeJobManager:
+    """
+    Ejecuta los scrapes en un pool de hilos del worker que recibió el pedido y
+    guarda los últimos N jobs en la base. Un hilo revisa cada 'cancel_poll'
+    segundos si alguien (en cualquier worker) pidió cancelar un job de este worker.
+    """
+    def __init__(self, max_workers: int = 3, max_jobs: int = 200, cancel_poll: float = 1.0,
+                 session_factory=database.SessionLocal):
+        self.max_jobs = max_jobs
+        self.cancel_poll = cancel_poll
+        self.session_factory = session_factory
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape-job")
+        self._local = {}     # job_id -> ScrapeJob que corre en este worker
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def submit(self, owner: str, params: dict, fn) -> ScrapeJob:
+        """'fn(job)' hace el trabajo y retorna el dict de resultado."""
+        job = ScrapeJob(uuid.uuid4().hex, owner, session_factory=self.session_factory)
+        now = time.time()
+        db = self.session_factory()
+        try:
+            db.add(models.ScrapeJobState(
+                id=job.id, owner=owner, params=_dumps(params), status="queued", phase="queued",
+                cancel_requested=False, created_at=now
+            ))
+            job._add_event(db, "queued", now)
+            db.commit()
+            self._prune(db)
+        finally:
+            db.close()
+        with self._lock:
+            self._local[job.id] = job
+        self._ensure_watcher()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: ScrapeJob, fn):
+        try:
+            if job.cancel_event.is_set():
+                job.finish({"status": "cancelled", "message": "Búsqueda cancelada."})
+                return
+            job.set_running()
+            try:
+                result = fn(job)
+            except Exception as e:
+                logger.error(f"❌ Error en job de scraping {job.id}: {e}")
+                result = {"status": "error", "message": str(e)}
+            job.finish(result)
+        finally:
+            with self._lock:
+                self._local.pop(job.id, None)
+
+    def _prune(self, db):
+        # Descarta los jobs terminados más viejos para no crecer sin límite
+        State = models.ScrapeJobState
+        keep = [job_id for (job_id,) in db.query(State.id).order_by(State.created_at.desc()).limit(self.max_jobs)]
+        old = [
+            job_id for (job_id,) in db.query(State.id).filter(
+                State.status.in_(FINAL_STATUSES), State.id.notin_(keep)
+            )
+        ]
+        if old:
+            db.query(models.ScrapeJobEvent).filter(models.ScrapeJobEvent.job_id.in_(old)).delete(synchronize_session=False)
+            db.query(State).filter(State.id.in_(old)).delete(synchronize_session=False)
+            db.commit()
+
+    def _ensure_watcher(self):
+        with self._lock:
+            if self._watcher is None or not self._watcher.is_alive():
+                self._stop.clear()
+                self._watcher = threading.Thread(target=self._watch_cancellations, name="scrape-job-cancel", daemon=True)
+                self._watcher.start()
+
+    def _watch_cancellations(self):
+        State = models.ScrapeJobState
+        while not self._stop.wait(self.cancel_poll):
+            with self._lock:
+                local = dict(self._local)
+            if not local:
+                continue
+            try:
+                db = self.session_factory()
+                try:
+                    cancelled = [
+                        job_id for (job_id,) in db.query(State.id).filter(
+                            State.id.in_(list(local)), State.cancel_requested.is_(True)
+                        )
+                    ]
+                finally:
+                    db.close()
+            except Exception as e:
+                logger.error(f"❌ Error revisando cancelaciones de scraping: {e}")
+                continue
+            for job_id in cancelled:
+                local[job_id].cancel_event.set()
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._local.get(job_id)
+        if job is not None:
+            return job
+        db = self.session_factory()
+        try:
+            state = db.get(models.ScrapeJobState, job_id)
+        finally:
+            db.close()
+        if state is None:
+            return None
+        return ScrapeJob(state.id, state.owner, session_factory=self.session_factory)
+
+    def list_for(self, owner: str) -> list:
+        State = models.ScrapeJobState
+        db = self.session_factory()
+        try:
+            job_ids = [
+                job_id for (job_id,) in db.query(State.id).filter(State.owner == owner).order_by(State.created_at)
+            ]
+        finally:
+            db.close()
+        return [ScrapeJob(job_id, owner, session_factory=self.session_factory).snapshot() for job_id in job_ids]
+
+    def cancel(self, job_id: str) -> bool:
+        State = models.ScrapeJobState
+        db = self.session_factory()
+        try:
+            requested = db.query(State).filter(State.id == job_id, State.status.notin_(FINAL_STATUSES)).update(
+                {"cancel_requested": True}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+        if not requested:
+            return False
+        job = self.get(job_id)
+        # Si corre en este worker, no esperamos al hilo que revisa la base
+        job.cancel_event.set()
+        job.emit("cancelling")
+        return True
+
+    def shutdown(self):
+        self._stop.set()
+        with self._lock:
+            local = list(self._local.values())
+        for job in local:
+            job.cancel_event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        # Lo que no termine antes de que se apague el proceso queda cerrado (y no 'running' para siempre)
+        for job in local:
+            try:
+                job.finish({"status": "cancelled", "message": "Búsqueda interrumpida: se reinició el servidor."})
+            except Exception as e:
+                logger.error(f"❌ Error cerrando el job de scraping {job.id}: {e}")
+
+    async def stream(self, job: ScrapeJob, poll_interval: float = 0.5, heartbeat: float = 15):
+        """Generador de Server-Sent Events con cada cambio de fase del job."""
+        last_id = 0
+        last_write = time.monotonic()
+        while True:
+            events = await asyncio.to_thread(job.events_since, last_id)
+            for event_id, event in events:
+                yield f"event: {event['phase']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                last_id = event_id
+            if events:
+                last_write = time.monotonic()
+            if await asyncio.to_thread(lambda: job.done and not job.events_since(last_id)):
+                return
+            if time.monotonic() - last_write > heartbeat:
+                # Comentario SSE para que proxies no corten la conexión
+                yield ": keep-alive\n\n"
+                last_write = time.monotonic()
+            await asyncio.sleep(poll_interval)
+
+scrape_jobs = ScrapeJobManager(max_workers=settings.SCRAPE_JOB_WORKERS)
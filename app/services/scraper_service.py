@@ -1,88 +1,147 @@
-from apify_client import ApifyClient
-# from app.core.config import settings  <-- Ya no necesitamos esto aquí
+from app.core.config import settings
 from app.services.gsheet_service import GSheetService
+from app.services.scrape_engine import (
+    ScrapeEngine, ScrapeCancelled, ApifyStartError, build_queries, item_to_lead, apify_client_factory
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
 class ScraperService:
-    def __init__(self):
+    def __init__(self, client_factory=apify_client_factory):
         # ¡IMPORTANTE! Quitamos el cliente por defecto.
         # Si no hay token del usuario, no se usa nada.
-        pass 
+        self.client_factory = client_factory
 
-    def scrape_and_save(self, city: str, country: str, niche: str, spreadsheet_id: str, limit: int, apify_token: str = None):
-        """
-        Busca leads usando OBLIGATORIAMENTE el token del usuario.
-        """
-        # 1. Validación Estricta del Token
+    def _check_token(self, apify_token: str):
+        """Validación Estricta del Token. Retorna el dict de error o None si está bien."""
         if not apify_token or len(apify_token) < 10:
             logger.warning("Intento de scraping sin token de Apify válido.")
             return {
                 "status": "error", 
                 "message": "⚠️ Error: Debes ingresar TU Token de Apify para poder buscar leads. No se ha realizado ninguna búsqueda."
             }
+        return None
+
+    def _apify_error(self, e: Exception) -> dict:
+        print(f"[ERROR] Fallo Apify: {e}")
+        # Mensaje más amigable si el token es inválido
+        if "authentication failed" in str(e).lower() or "token" in str(e).lower():
+            return {"status": "error", "message": "El Token de Apify ingresado no es válido o ha expirado."}
+        return {"status": "error", "message": str(e)}
+
+    def scrape_and_save(self, city: str, country: str, niche: str, spreadsheet_id: str, limit: int,
+                        apify_token: str = None, progress=None, cancel_event=None):
+        """
+        Busca leads usando OBLIGATORIAMENTE el token del usuario.
+        Los resultados se leen del dataset MIENTRAS el actor corre y se agregan al
+        Excel en bloques, sin esperar a tener todo en memoria.
+        'progress(phase, **data)' recibe el avance (para el job del dashboard) y
+        'cancel_event' (threading.Event) permite abortar el run de Apify a mitad de camino.
+        """
+        progress = progress or (lambda phase, **data: None)
+
+        token_error = self._check_token(apify_token)
+        if token_error:
+            return token_error
 
         logger.info(f"[INFO] Usando Token del Usuario: {apify_token[:5]}...")
-        client = ApifyClient(apify_token)
+        engine = ScrapeEngine(apify_token, client_factory=self.client_factory)
 
         search_location = f"{niche} en {city}, {country}"
         print(f"[INFO] Buscando: '{search_location}' (Limit: {limit})")
 
-        # 2. Configurar Apify
-        run_input = {
-            "searchStringsArray": [search_location], 
-            "maxCrawledPlacesPerSearch": limit,
-            "language": "es",
-            "onlyDirectPlaces": False, 
-        }
-
+        # Abrimos el Excel ANTES de gastar créditos de Apify
         try:
-            # Ejecutar el actor
-            run = client.actor("compass/crawler-google-places").call(run_input=run_input)
+            gsheet_specific = GSheetService(spreadsheet_id=spreadsheet_id)
         except Exception as e:
-            print(f"[ERROR] Fallo Apify: {e}")
-            # Mensaje más amigable si el token es inválido
-            if "authentication failed" in str(e).lower() or "token" in str(e).lower():
-                 return {"status": "error", "message": "El Token de Apify ingresado no es válido o ha expirado."}
-            return {"status": "error", "message": str(e)}
-
-        # 3. Procesar resultados
-        leads_found = []
+            return {"status": "error", "message": f"Error Excel: {str(e)}"}
+
+        # Pipeline en streaming: items del dataset -> leads -> dedup -> append_rows por bloques
+        report = {"found": 0, "added": 0, "duplicates": 0}
+
+        def on_chunk(chunk_report):
+            report.update(chunk_report)
+            progress("rows_added", **chunk_report)
+
         try:
-            dataset_items = client.dataset(run["defaultDatasetId"]).iterate_items()
-            for item in dataset_items:
-                phone = item.get("phoneUnformatted") or item.get("phone")
-                name = item.get("title")
-                url = item.get("googleMapsUrl")
-                website = item.get("website")
-                
-                if phone:
-                    lead_data = {
-                        "Nombre": name,
-                        "Phone": phone,
-                        "Notas": f"Nicho: {niche} | Web: {website} | Maps: {url}"
-                    }
-                    leads_found.append(lead_data)
+            items = engine.stream_query(search_location, limit, progress=progress, cancel_event=cancel_event)
+            leads = (lead for lead in (item_to_lead(item, niche) for item in items) if lead)
+            report.update(gsheet_specific.add_leads_stream(
+                leads, chunk_size=settings.SCRAPE_APPEND_CHUNK_SIZE, on_chunk=on_chunk
+            ))
+        except ApifyStartError as e:
+            return self._apify_error(e)
+        except ScrapeCancelled:
+            return {"status": "cancelled", "message": "Búsqueda cancelada.",
+                    "added_new": report["added"], "duplicates": report["duplicates"]}
         except Exception as e:
-             return {"status": "error", "message": f"Error procesando dataset: {str(e)}"}
+            print(f"[ERROR] Procesando resultados: {e}")
+            return {"status": "error", "message": f"Error procesando resultados: {str(e)}",
+                    "added_new": report["added"], "duplicates": report["duplicates"]}
+
+        print(f"[INFO] Encontrados {report['found']} leads brutos.")
+        progress("saved", found=report["found"], added=report["added"], duplicates=report["duplicates"])
+
+        return {
+            "status": "success", 
+            "found": report["found"], 
+            "added_new": report["added"],
+            "duplicates": report["duplicates"],
+            "city": city,
+            "niche": niche,
+            "from_cache": search_location in engine.served_from_cache
+        }
+
+    def scrape_batch_and_save(self, cities: list, niches: list, spreadsheet_id: str, limit: int,
+                              apify_token: str = None, country: str = None, only_direct_places: bool = False,
+                              progress=None, cancel_event=None):
+        """
+        Búsqueda múltiple: todas las combinaciones ciudades x nichos en paralelo,
+        resultados unidos y deduplicados, y UNA sola escritura al Excel.
+        """
+        progress = progress or (lambda phase, **data: None)
+
+        token_error = self._check_token(apify_token)
+        if token_error:
+            return token_error
 
-        print(f"[INFO] Encontrados {len(leads_found)} leads brutos.")
+        queries = build_queries(cities, niches, country)
+        if not queries:
+            return {"status": "error", "message": "Debes indicar al menos una ciudad y un nicho."}
 
-        # 4. Guardar en Excel y obtener reporte
         try:
             gsheet_specific = GSheetService(spreadsheet_id=spreadsheet_id)
-            # save_report ahora es un diccionario: {"added": X, "duplicates": Y}
-            save_report = gsheet_specific.add_leads(leads_found)
-            
-            return {
-                "status": "success", 
-                "found": len(leads_found), 
-                # Usamos los datos del nuevo reporte
-                "added_new": save_report['added'],
-                "duplicates": save_report['duplicates'],
-                "city": city,
-                "niche": niche
-            }
         except Exception as e:
-            return {"status": "error", "message": f"Error Excel: {str(e)}"}
\ No newline at end of file
+            return {"status": "error", "message": f"Error Excel: {str(e)}"}
+
+        engine = ScrapeEngine(apify_token, client_factory=self.client_factory)
+        print(f"[INFO] Búsqueda múltiple: {len(queries)} combinaciones (Limit: {limit} c/u)")
+
+        try:
+            batch = engine.run_batch(queries, limit, only_direct_places=only_direct_places,
+                                     progress=progress, cancel_event=cancel_event)
+        except ScrapeCancelled:
+            return {"status": "cancelled", "message": "Búsqueda cancelada."}
+
+        if batch["errors"] and len(batch["errors"]) == len(queries):
+            return self._apify_error(Exception(next(iter(batch["errors"].values()))))
+
+        try:
+            progress("saving", found=len(batch["leads"]))
+            report = gsheet_specific.add_leads_stream(batch["leads"], chunk_size=max(1, len(batch["leads"])))
+        except Exception as e:
+            return {"status": "error", "message": f"Error Excel: {str(e)}"}
+
+        progress("saved", found=report["found"], added=report["added"], duplicates=report["duplicates"])
+
+        return {
+            "status": "success",
+            "queries": len(queries),
+            "failed_queries": batch["errors"],
+            "raw_items": batch["raw_items"],
+            "queries_from_cache": batch["from_cache"],
+            "found": report["found"],
+            "added_new": report["added"],
+            "duplicates": report["duplicates"]
+        }
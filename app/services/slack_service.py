@@ -1,36 +1,176 @@
 import requests
 import json
+import os
+import time
+import queue
+import threading
 import logging
 from app.core.config import settings # <--- IMPORTANTE: Usamos tu config central
+from app.utils.metrics import track
 
 logger = logging.getLogger(__name__)
 
 class SlackService:
-    def __init__(self):
+    """
+    Notificador de Slack que no bloquea: send_alert() solo encola.
+    Un hilo en segundo plano junta las alertas que llegan dentro de una ventana
+    corta en UN mensaje, las manda con una sesión keep-alive, timeouts y
+    reintentos con backoff, y si Slack no responde (o la cola se llena) las
+    guarda en disco para reintentarlas después.
+    """
+    def __init__(self, queue_size: int = None, coalesce_seconds: float = None, spill_file: str = None,
+                 max_retries: int = 5, timeout=(3.05, 10)):
         # En lugar de buscar en el sistema, la sacamos de tu configuración ya cargada
         self.webhook_url = settings.SLACK_WEBHOOK_URL
+        self.coalesce_seconds = coalesce_seconds if coalesce_seconds is not None else settings.SLACK_COALESCE_SECONDS
+        self.spill_file = spill_file or settings.SLACK_SPILL_FILE
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=queue_size or settings.SLACK_QUEUE_SIZE)
+        self._session = requests.Session()
+        self._session.headers.update({'Content-Type': 'application/json'})
+        self._spill_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
 
     def send_alert(self, lead_phone, message_content):
+        """Encola la alerta y vuelve al instante (nunca espera a Slack)."""
         # Verificación de seguridad
         if not self.webhook_url:
             logger.warning("⚠️ CRÍTICO: No hay URL de Slack configurada en settings.")
             return
 
-        # Preparamos el mensaje bonito
-        payload = {
-            "text": f"🔥 *LEAD CALIENTE DETECTADO* 🔥\n\n📱 *Teléfono:* {lead_phone}\n💬 *Dijo:* _{message_content}_\n🚀 *Acción:* Link enviado. ¡Revisar Calendly!"
+        alert = {"phone": lead_phone, "message": message_content, "ts": time.time()}
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            logger.warning("⚠️ Cola de Slack llena, guardando alerta en disco.")
+            self._spill([alert])
+        self._ensure_started()
+
+    def start(self):
+        """Arranca el hilo (y con él el reenvío de lo que quedó en disco del arranque anterior)."""
+        if self.webhook_url:
+            self._ensure_started()
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="slack-notifier", daemon=True)
+                    self._thread.start()
+
+    # --- Armado del mensaje ---
+    def _build_payload(self, alerts: list) -> dict:
+        if len(alerts) == 1:
+            alert = alerts[0]
+            # Preparamos el mensaje bonito
+            return {
+                "text": f"🔥 *LEAD CALIENTE DETECTADO* 🔥\n\n📱 *Teléfono:* {alert['phone']}\n💬 *Dijo:* _{alert['message']}_\n🚀 *Acción:* Link enviado. ¡Revisar Calendly!"
+            }
+        lines = "\n".join(f"📱 *{a['phone']}* — _{a['message']}_" for a in alerts)
+        return {
+            "text": f"🔥 *{len(alerts)} LEADS CALIENTES DETECTADOS* 🔥\n\n{lines}\n\n🚀 *Acción:* Links enviados. ¡Revisar Calendly!"
         }
 
-        try:
-            response = requests.post(
-                self.webhook_url, 
-                data=json.dumps(payload),
-                headers={'Content-Type': 'application/json'}
-            )
-            if response.status_code != 200:
+    # --- Envío con reintentos ---
+    def _deliver(self, alerts: list) -> str:
+        """'sent', 'failed' (Slack no respondió: se guarda en disco) o 'rejected' (4xx: se descarta)."""
+        payload = json.dumps(self._build_payload(alerts))
+        for attempt in range(self.max_retries + 1):
+            try:
+                with track("slack", "webhook.post", request=payload) as call:
+                    response = self._session.post(self.webhook_url, data=payload, timeout=self.timeout)
+                    call.response_bytes = len(response.content or b"")
+                if response.status_code == 200:
+                    logger.info(f"✅ Notificación enviada a Slack con éxito ({len(alerts)} alerta/s).")
+                    return "sent"
                 logger.error(f"❌ Error Slack: {response.status_code} - {response.text}")
-            else:
-                logger.info("✅ Notificación enviada a Slack con éxito.")
-                
-        except Exception as e:
-            logger.error(f"❌ Fallo al conectar con Slack: {e}")
\ No newline at end of file
+                # 4xx (menos 429) no se arregla reintentando: ni ahora ni desde el disco
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    logger.error(f"🗑️ Slack rechazó {len(alerts)} alerta/s, se descartan: {alerts}")
+                    return "rejected"
+                wait = float(response.headers.get("Retry-After", 2 ** attempt))
+            except Exception as e:
+                logger.error(f"❌ Fallo al conectar con Slack: {e}")
+                wait = 2 ** attempt
+            if attempt < self.max_retries:
+                time.sleep(min(wait, 60))
+        return "failed"
+
+    # --- Respaldo en disco ---
+    def _spill(self, alerts: list):
+        with self._spill_lock:
+            with open(self.spill_file, "a", encoding="utf-8") as f:
+                for alert in alerts:
+                    f.write(json.dumps(alert, ensure_ascii=False) + "\n")
+
+    def _take_spilled(self) -> list:
+        with self._spill_lock:
+            if not os.path.exists(self.spill_file):
+                return []
+            with open(self.spill_file, "r", encoding="utf-8") as f:
+                alerts = [json.loads(line) for line in f if line.strip()]
+            os.remove(self.spill_file)
+            return alerts
+
+    def _run(self):
+        # Primero reintentamos lo que haya quedado guardado de antes
+        spilled = self._take_spilled()
+        if spilled and self._deliver(spilled) == "failed":
+            self._spill(spilled)
+
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+
+            # Juntamos las alertas que lleguen dentro de la ventana en un solo mensaje
+            batch = [first]
+            stop = False
+            deadline = time.monotonic() + self.coalesce_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    alert = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if alert is None:
+                    stop = True
+                    break
+                batch.append(alert)
+
+            result = self._deliver(batch)
+            if result == "sent":
+                # Slack volvió a responder: aprovechamos para mandar lo guardado en disco
+                spilled = self._take_spilled()
+                if spilled and self._deliver(spilled) == "failed":
+                    self._spill(spilled)
+            elif result == "failed":
+                self._spill(batch)
+
+            if stop:
+                break
+
+    def shutdown(self, timeout: float = 15):
+        """Manda lo pendiente (o lo guarda en disco) y frena el hilo."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=1)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=timeout)
+        # Lo que no se llegó a mandar queda en disco para el próximo arranque
+        leftover = []
+        while True:
+            try:
+                alert = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if alert is not None:
+                leftover.append(alert)
+        if leftover:
+            self._spill(leftover)
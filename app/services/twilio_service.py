@@ -1,23 +1,32 @@
-from twilio.rest import Client
 from app.core.config import settings
+from app.utils.metrics import track
 
 class TwilioService:
-    def __init__(self):
-        self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+    def __init__(self, client=None):
+        # 'client' permite inyectar un cliente compatible (ej: el fake de los benchmarks)
+        if client is None:
+            from twilio.rest import Client   # import diferido: el SDK tarda en cargar
+            client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        self.client = client
 
-    def send_message(self, to: str, body: str):
-        """Sends an SMS/WhatsApp message."""
+    def sender_for(self, to: str) -> str:
+        """Número de origen para 'to' (con prefijo whatsapp: si corresponde)."""
         # For this MVP, we will assume WhatsApp if the number starts with whatsapp:, otherwise SMS.
         # But for 'daily outreach' usually it's SMS unless specified.
         # If testing with WhatsApp Sandbox, 'to' and 'from' need 'whatsapp:' prefix.
-        
         from_number = settings.TWILIO_PHONE_NUMBER
         if to.startswith("whatsapp:") and not from_number.startswith("whatsapp:"):
              from_number = f"whatsapp:{from_number}"
+        return from_number
+
+    def send_message(self, to: str, body: str, from_number: str = None):
+        """Sends an SMS/WhatsApp message."""
+        from_number = from_number or self.sender_for(to)
         
-        message = self.client.messages.create(
-            body=body,
-            from_=from_number,
-            to=to
-        )
+        with track("twilio", "messages.create", request=body):
+            message = self.client.messages.create(
+                body=body,
+                from_=from_number,
+                to=to
+            )
         return message.sid
@@ -0,0 +1,112 @@
+import json
+import time
+import threading
+import hashlib
+import logging
+from app.db import database, models
+
+logger = logging.getLogger(__name__)
+
+EVICT_EVERY_N_WRITES = 50
+
+def make_key(*parts) -> str:
+    """Hash estable de cualquier combinación de valores serializables a JSON."""
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class PersistentCache:
+    """
+    Caché clave -> valor JSON guardada en SQLite (tabla cache_entries), con
+    vencimiento por TTL, límite de entradas (desaloja las menos usadas) y
+    contadores de hits/misses. Cada 'namespace' es una caché independiente.
+    """
+    def __init__(self, namespace: str, ttl_seconds: float, max_entries: int = 10000,
+                 session_factory=database.SessionLocal):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.session_factory = session_factory
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _count(self, attr: str, n: int = 1):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + n)
+
+    def get(self, key: str):
+        now = time.time()
+        db = self.session_factory()
+        try:
+            entry = db.get(models.CacheEntry, (self.namespace, key))
+            if entry is None:
+                self._count("misses")
+                return None
+            if now - entry.created_at > self.ttl_seconds:
+                db.delete(entry)
+                db.commit()
+                self._count("misses")
+                return None
+            entry.last_access = now
+            db.commit()
+            self._count("hits")
+            return json.loads(entry.value)
+        finally:
+            db.close()
+
+    def set(self, key: str, value):
+        now = time.time()
+        db = self.session_factory()
+        try:
+            db.merge(models.CacheEntry(
+                namespace=self.namespace, key=key, value=json.dumps(value, ensure_ascii=False),
+                created_at=now, last_access=now
+            ))
+            db.commit()
+            # El desalojo recorre la tabla, así que no lo hacemos en cada escritura
+            with self._lock:
+                self._writes += 1
+                should_evict = self._writes % EVICT_EVERY_N_WRITES == 1
+            if should_evict:
+                self._evict(db, now)
+        finally:
+            db.close()
+
+    def _evict(self, db, now: float):
+        Entry = models.CacheEntry
+        in_namespace = db.query(Entry).filter(Entry.namespace == self.namespace)
+
+        removed = in_namespace.filter(Entry.created_at < now - self.ttl_seconds).delete(synchronize_session=False)
+
+        overflow = in_namespace.count() - self.max_entries
+        if overflow > 0:
+            oldest = [
+                key for (key,) in db.query(Entry.key)
+                .filter(Entry.namespace == self.namespace)
+                .order_by(Entry.last_access)
+                .limit(overflow)
+            ]
+            removed += in_namespace.filter(Entry.key.in_(oldest)).delete(synchronize_session=False)
+
+        if removed:
+            db.commit()
+            self._count("evictions", removed)
+
+    def clear(self):
+        db = self.session_factory()
+        try:
+            db.query(models.CacheEntry).filter(models.CacheEntry.namespace == self.namespace).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
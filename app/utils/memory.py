@@ -1,27 +1,201 @@
 import json
 import os
+import re
+import time
+import logging
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app.db import database, models
+from app.utils.tokens import count_message_tokens
 
+logger = logging.getLogger(__name__)
+
+# Archivo JSON del sistema viejo (solo se usa para migrar una vez)
 MEMORY_FILE = "conversation_memory.json"
 
 class Memory:
-    def __init__(self):
-        if not os.path.exists(MEMORY_FILE):
-             with open(MEMORY_FILE, 'w') as f:
-                 json.dump({}, f)
-    
+    """
+    Historial de conversaciones guardado en SQLite (tabla conversation_messages).
+    Agregar un mensaje es un INSERT y leer el historial de un usuario es una
+    consulta por índice, sin importar cuántas conversaciones haya en total.
+    """
+    def __init__(self, session_factory=database.SessionLocal):
+        self.session_factory = session_factory
+
+        # Si todavía existe el JSON viejo, lo migramos una sola vez
+        if os.path.exists(MEMORY_FILE):
+            migrate_json_memory(MEMORY_FILE, session_factory=session_factory)
+
     def get_history(self, user_id: str) -> list:
-        with open(MEMORY_FILE, 'r') as f:
-            data = json.load(f)
-        return data.get(user_id, [])
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(models.ConversationMessage.role, models.ConversationMessage.content)
+                .filter(models.ConversationMessage.user_id == user_id)
+                .order_by(models.ConversationMessage.id)
+                .all()
+            )
+            return [{"role": role, "content": content} for role, content in rows]
+        finally:
+            db.close()
+
+    def count_messages(self, user_id: str) -> int:
+        db = self.session_factory()
+        try:
+            return (
+                db.query(func.count(models.ConversationMessage.id))
+                .filter(models.ConversationMessage.user_id == user_id)
+                .scalar()
+            )
+        finally:
+            db.close()
+
+    def get_messages_after(self, user_id: str, after_id: int = 0) -> list:
+        """
+        Mensajes con id > after_id, con sus tokens: [{"id", "role", "content", "tokens"}].
+        Los tokens se cuentan una vez por mensaje; si falta alguno (historial viejo) se calcula y se guarda.
+        """
+        Message, Count = models.ConversationMessage, models.MessageTokenCount
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(Message.id, Message.role, Message.content, Count.tokens)
+                .outerjoin(Count, Count.message_id == Message.id)
+                .filter(Message.user_id == user_id, Message.id > after_id)
+                .order_by(Message.id)
+                .all()
+            )
+            messages = []
+            missing = []
+            for message_id, role, content, tokens in rows:
+                if tokens is None:
+                    tokens = count_message_tokens(content)
+                    missing.append({"message_id": message_id, "tokens": tokens})
+                messages.append({"id": message_id, "role": role, "content": content, "tokens": tokens})
+            if missing:
+                db.bulk_insert_mappings(Count, missing)
+                db.commit()
+            return messages
+        finally:
+            db.close()
+
+    def add_message(self, user_id: str, role: str, content: str, message_sid: str = None) -> bool:
+        """
+        Guarda el mensaje. Con 'message_sid' (mensajes entrantes de Twilio) lo registra
+        en la misma transacción y retorna False si ya se había recibido (reintento).
+        """
+        db = self.session_factory()
+        try:
+            if message_sid:
+                db.add(models.InboundMessage(message_sid=message_sid, user_id=user_id, received_at=time.time()))
+                db.flush()
+            message = models.ConversationMessage(user_id=user_id, role=role, content=content)
+            db.add(message)
+            db.flush()
+            db.add(models.MessageTokenCount(message_id=message.id, tokens=count_message_tokens(content)))
+            _touch_conversation(db, user_id)
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            if not message_sid:
+                raise
+            return False
+        finally:
+            db.close()
 
-    def add_message(self, user_id: str, role: str, content: str):
-        with open(MEMORY_FILE, 'r') as f:
+    def get_summary(self, user_id: str):
+        """Resumen guardado de la conversación (o None)."""
+        db = self.session_factory()
+        try:
+            return db.get(models.ConversationSummary, user_id)
+        finally:
+            db.close()
+
+    def save_summary(self, user_id: str, summary: str, summarized_until_id: int, summary_tokens: int):
+        db = self.session_factory()
+        try:
+            db.merge(models.ConversationSummary(
+                user_id=user_id, summary=summary, summarized_until_id=summarized_until_id,
+                summary_tokens=summary_tokens, updated_at=time.time()
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+def _touch_conversation(db, user_id: str, added: int = 1):
+    """Actualiza la fila de 'conversations' y la vincula con su lead (por los últimos 8 dígitos)."""
+    conversation = db.get(models.Conversation, user_id)
+    if conversation is None:
+        conversation = models.Conversation(
+            user_id=user_id, phone_normalized=re.sub(r'\D', '', user_id), message_count=0
+        )
+        db.add(conversation)
+    if conversation.lead_id is None and conversation.phone_normalized:
+        lead = (
+            db.query(models.Lead.id)
+            .filter(models.Lead.phone_suffix == conversation.phone_normalized[-8:])
+            .order_by(models.Lead.id)
+            .first()
+        )
+        conversation.lead_id = lead.id if lead else None
+    conversation.message_count += added
+    conversation.last_message_at = time.time()
+
+def migrate_json_memory(json_path: str = MEMORY_FILE, session_factory=database.SessionLocal) -> int:
+    """
+    Importa el conversation_memory.json viejo a SQLite (mensajes y su fila en
+    'conversations') y lo renombra a '<archivo>.migrated'.
+    Corre una sola vez aunque arranquen varios workers a la vez: la marca en
+    data_migrations se inserta primero, en la misma transacción (el segundo
+    worker espera el lock y choca con la clave). Los usuarios que ya tienen
+    mensajes en la base se saltean. Retorna la cantidad de mensajes migrados.
+    """
+    try:
+        with open(json_path, 'r') as f:
             data = json.load(f)
-        
-        if user_id not in data:
-            data[user_id] = []
-        
-        data[user_id].append({"role": role, "content": content})
-        
-        with open(MEMORY_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+    except FileNotFoundError:
+        # Otro worker ya lo migró y lo renombró
+        return 0
+
+    Message = models.ConversationMessage
+    migrated = 0
+    skipped = 0
+    db = session_factory()
+    try:
+        db.add(models.DataMigration(name=f"json_memory:{os.path.abspath(json_path)}", applied_at=time.time()))
+        db.flush()
+        existing = {user_id for (user_id,) in db.query(Message.user_id).distinct()}
+        for user_id, messages in data.items():
+            if user_id in existing:
+                skipped += 1
+                continue
+            db.add_all([Message(user_id=user_id, role=msg["role"], content=msg["content"]) for msg in messages])
+            _touch_conversation(db, user_id, added=len(messages))
+            migrated += len(messages)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logger.info(f"📦 La memoria de {json_path} ya fue migrada (otro worker), no se importa de nuevo.")
+        migrated = None
+    finally:
+        db.close()
+
+    try:
+        os.replace(json_path, f"{json_path}.migrated")
+    except FileNotFoundError:
+        pass
+    if migrated is None:
+        return 0
+    logger.info(
+        f"📦 Memoria migrada: {migrated} mensajes de {len(data) - skipped} conversaciones "
+        f"({skipped} ya estaban en la base) ({json_path})."
+    )
+    return migrated
+
+if __name__ == "__main__":
+    # Migración manual: python -m app.utils.memory [ruta.json]
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    database.init_db()
+    migrate_json_memory(sys.argv[1] if len(sys.argv) > 1 else MEMORY_FILE)
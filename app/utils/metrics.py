@@ -0,0 +1,212 @@
+import time
+import uuid
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Buckets de latencia (segundos) y de tamaño de payload (bytes aprox.)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+class _Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # el último es +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricsRegistry:
+    """
+    Métricas en memoria (contadores, gauges e histogramas con labels) y su
+    exportación en formato de texto de Prometheus para /metrics.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._counters = {}     # (nombre, labels) -> valor
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []   # funciones que actualizan gauges justo antes de exportar
+
+    def _declare(self, name: str, kind: str, help_text: str):
+        if name not in self._types:
+            self._types[name] = kind
+            self._help[name] = help_text
+
+    @staticmethod
+    def _key(name: str, labels: dict):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def incr(self, name: str, labels: dict = None, amount: float = 1, help_text: str = ""):
+        with self._lock:
+            self._declare(name, "counter", help_text)
+            key = self._key(name, labels)
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: float, labels: dict = None, help_text: str = ""):
+        with self._lock:
+            self._declare(name, "gauge", help_text)
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, labels: dict = None, buckets: tuple = LATENCY_BUCKETS,
+                help_text: str = ""):
+        with self._lock:
+            self._declare(name, "histogram", help_text)
+            key = self._key(name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def register_collector(self, fn):
+        """'fn(registry)' se llama en cada render() (ej: para publicar estadísticas de cachés)."""
+        self._collectors.append(fn)
+
+    @staticmethod
+    def _labels(pairs, extra: tuple = ()) -> str:
+        pairs = tuple(pairs) + extra
+        if not pairs:
+            return ""
+        escaped = (f'{k}="{_escape(v)}"' for k, v in pairs)
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector(self)
+            except Exception as e:
+                logging.getLogger(__name__).error(f"❌ Error en un collector de métricas: {e}")
+
+        with self._lock:
+            by_name = {}
+            for store in (self._counters, self._gauges, self._histograms):
+                for (name, labels), value in store.items():
+                    by_name.setdefault(name, []).append((labels, value))
+
+            lines = []
+            for name in sorted(by_name):
+                kind = self._types[name]
+                if self._help.get(name):
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+                    if kind != "histogram":
+                        lines.append(f"{name}{self._labels(labels)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + ("+Inf",), value.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(labels, (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {value.total}")
+                    lines.append(f"{name}_count{self._labels(labels)} {value.count}")
+            return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+def payload_size(obj) -> int:
+    """Tamaño aproximado (bytes) de un request/respuesta, sin recorrer listas enteras."""
+    if obj is None:
+        return 0
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, str):
+        return len(obj.encode("utf-8", errors="ignore"))
+    if isinstance(obj, dict):
+        return sum(payload_size(k) + payload_size(v) for k, v in list(obj.items())[:50])
+    if isinstance(obj, (list, tuple)):
+        # Estimación: largo x tamaño del primer elemento (filas del Excel, items de Apify)
+        return len(obj) * payload_size(obj[0]) if obj else 0
+    return len(str(obj))
+
+class _Call:
+    def __init__(self):
+        self.request_bytes = None
+        self.response_bytes = None
+
+@contextmanager
+def track(service: str, operation: str, request=None):
+    """
+    Mide una llamada saliente (OpenAI, Twilio, Google Sheets, Slack, Apify):
+    latencia, errores y tamaño de request/respuesta.
+
+        with track("twilio", "messages.create", request=body) as call:
+            message = client.messages.create(...)
+            call.response_bytes = ...
+    """
+    call = _Call()
+    if request is not None:
+        call.request_bytes = payload_size(request)
+    labels = {"service": service, "operation": operation}
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception as e:
+        metrics.incr("external_call_errors_total", {**labels, "error": type(e).__name__},
+                     help_text="Llamadas externas que lanzaron una excepción")
+        raise
+    finally:
+        metrics.observe("external_call_duration_seconds", time.perf_counter() - start, labels,
+                        help_text="Latencia de las llamadas a servicios externos")
+        metrics.incr("external_calls_total", labels, help_text="Llamadas a servicios externos")
+        if call.request_bytes is not None:
+            metrics.observe("external_call_request_bytes", call.request_bytes, labels, SIZE_BUCKETS,
+                            help_text="Tamaño aproximado de los requests salientes")
+        if call.response_bytes is not None:
+            metrics.observe("external_call_response_bytes", call.response_bytes, labels, SIZE_BUCKETS,
+                            help_text="Tamaño aproximado de las respuestas")
+
+class InstrumentedProxy:
+    """
+    Envuelve un objeto de un SDK (ej: la worksheet de gspread) y mide las
+    llamadas a los métodos indicados. El resto de los atributos pasan directo.
+    """
+    def __init__(self, target, service: str, methods: tuple):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_service", service)
+        object.__setattr__(self, "_methods", frozenset(methods))
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name not in self._methods or not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            with track(self._service, name, request=args[0] if args else None) as call:
+                result = attr(*args, **kwargs)
+                call.response_bytes = payload_size(result)
+                return result
+        return wrapper
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+# --- Trace IDs ---
+
+trace_id_var = contextvars.ContextVar("trace_id", default="-")
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+class TraceIdFilter(logging.Filter):
+    """Agrega 'trace_id' a cada log (el del request o mensaje que se está procesando)."""
+    def filter(self, record):
+        record.trace_id = trace_id_var.get()
+        return True
+
+def install_trace_logging(fmt: str = "%(levelname)s:%(name)s:[%(trace_id)s] %(message)s"):
+    """Pone el trace_id en el formato de los handlers del logger raíz."""
+    root = logging.getLogger()
+    for handler in root.handlers:
+        handler.addFilter(TraceIdFilter())
+        handler.setFormatter(logging.Formatter(fmt))
@@ -0,0 +1,41 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class StartupProfile:
+    """
+    Tiempos del arranque en frío, por etapa (imports, lifespan, ...), para seguir
+    cuánto tarda cada deploy o reinicio. Cada mark() mide desde el anterior; el
+    primero desde que se importó este módulo (lo primero que importa main.py).
+    Para ver qué módulo pesa más: python -X importtime main.py 2> importtime.log
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = {}
+        self.ready_at = None
+
+    def mark(self, phase: str) -> float:
+        now = time.perf_counter()
+        seconds = round(now - self._last, 4)
+        self.phases[phase] = seconds
+        self._last = now
+        return seconds
+
+    def ready(self):
+        """Fin del arranque: la app ya puede recibir requests."""
+        self.ready_at = time.perf_counter()
+        logger.info(f"🚀 Arranque en {round(self.ready_at - self.started, 3)}s: {self.phases}")
+
+    def report(self, services: dict = None) -> dict:
+        total = (self.ready_at or time.perf_counter()) - self.started
+        return {
+            "ready": self.ready_at is not None,
+            "total_s": round(total, 4),
+            "phases_s": dict(self.phases),
+            # Servicios creados en su primer uso (ver app/core/container.py)
+            "services_s": services or {},
+        }
+
+startup_profile = StartupProfile()
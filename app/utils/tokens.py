@@ -0,0 +1,34 @@
+import math
+
+# tiktoken es opcional: si no está instalado usamos una estimación (~4 caracteres por token)
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Tokens extra que suma cada mensaje del chat (rol + separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encodings = {}
+
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+    return _encodings[model]
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Tokens de un texto, calculados localmente (sin llamar a la API)."""
+    text = text or ""
+    encoding = _encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text))
+
+def count_message_tokens(content: str, model: str = "gpt-4o") -> int:
+    """Tokens que ocupa un mensaje {role, content} dentro del prompt."""
+    return count_tokens(content, model) + MESSAGE_OVERHEAD_TOKENS
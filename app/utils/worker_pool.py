@@ -0,0 +1,87 @@
+import queue
+import threading
+import contextvars
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """La cola del worker está llena (hay que devolver 503 y que Twilio reintente)."""
+
+class KeyedWorkerPool:
+    """
+    Pool de hilos con colas acotadas. Cada tarea tiene una clave (ej: el número
+    'From') y todas las tareas de la misma clave caen siempre en el mismo hilo,
+    así se procesan en el orden en que llegaron.
+    """
+    def __init__(self, num_workers: int = 4, max_queue_size: int = 100, name: str = "worker"):
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.name = name
+        self._queues = []
+        self._threads = []
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._stopped = False
+            started = self._start_locked()
+        if started:
+            logger.info(f"⚙️ Pool '{self.name}' iniciado con {self.num_workers} workers.")
+
+    def _start_locked(self) -> bool:
+        if self._threads:
+            return False
+        for i in range(self.num_workers):
+            q = queue.Queue(maxsize=self.max_queue_size)
+            t = threading.Thread(target=self._run, args=(q,), name=f"{self.name}-{i}", daemon=True)
+            self._queues.append(q)
+            self._threads.append(t)
+            t.start()
+        return True
+
+    def submit(self, key: str, fn, *args, **kwargs):
+        """Encola la tarea sin bloquear. Lanza QueueFullError si no hay lugar o si el pool se está apagando."""
+        shard = zlib.crc32(key.encode("utf-8")) % self.num_workers
+        # put_nowait no bloquea: tomar el lock acá es barato y evita encolar detrás del fin de la cola
+        with self._lock:
+            if self._stopped:
+                raise QueueFullError(f"Pool '{self.name}' detenido.")
+            if self._start_locked():
+                logger.info(f"⚙️ Pool '{self.name}' iniciado con {self.num_workers} workers.")
+            try:
+                # Copiamos el contexto (ej: el trace_id del request) para que llegue al hilo
+                self._queues[shard].put_nowait((contextvars.copy_context(), fn, args, kwargs))
+            except queue.Full:
+                raise QueueFullError(f"Cola '{self.name}-{shard}' llena ({self.max_queue_size} tareas).")
+
+    def pending(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def shutdown(self, timeout: float = 30):
+        """Deja terminar lo que ya está encolado y frena los hilos."""
+        # Bajo el lock solo marcamos el pool como detenido; el put (que puede esperar
+        # a que se libere lugar) y el join van afuera, sin frenar a submit/pending.
+        with self._lock:
+            self._stopped = True
+            queues, threads = self._queues, self._threads
+            self._queues = []
+            self._threads = []
+        for q in queues:
+            q.put(None)
+        for t in threads:
+            t.join(timeout=timeout)
+        logger.info(f"⚙️ Pool '{self.name}' detenido.")
+
+    def _run(self, q: queue.Queue):
+        while True:
+            task = q.get()
+            if task is None:
+                break
+            context, fn, args, kwargs = task
+            try:
+                context.run(fn, *args, **kwargs)
+            except Exception as e:
+                logger.error(f"❌ Error en tarea de '{self.name}': {e}")
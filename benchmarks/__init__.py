@@ -0,0 +1,10 @@
+"""
+Benchmarks offline de los caminos críticos (webhook, Excel, daily outreach,
+memoria y scraping) contra fakes en memoria de Google Sheets, OpenAI, Twilio y
+Apify, sin credenciales. Los resultados salen en JSON para comparar commits.
+
+    python -m benchmarks                          # todos los escenarios
+    python -m benchmarks webhook sheets --quick   # algunos, con tamaños chicos
+    python -m benchmarks --openai-latency-ms 400 --output bench.json
+    python -m benchmarks --compare base.json bench.json
+"""
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import logging
+import argparse
+
+from benchmarks.runner import prepare_environment, build_report, compare
+
+SCENARIO_NAMES = ["webhook", "sheets", "outreach", "outreach_batch", "outreach_grouped", "memory", "scrape"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmarks offline con servicios falsos.")
+    parser.add_argument("scenarios", nargs="*", help=f"Escenarios a correr (default: todos): {', '.join(SCENARIO_NAMES)}")
+    parser.add_argument("--quick", action="store_true", help="Tamaños reducidos")
+    parser.add_argument("--output", help="Archivo JSON de salida (default: stdout)")
+    parser.add_argument("--sheets-latency-ms", type=float, default=0)
+    parser.add_argument("--openai-latency-ms", type=float, default=0)
+    parser.add_argument("--twilio-latency-ms", type=float, default=0)
+    parser.add_argument("--apify-latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Jitter uniforme sumado a cada latencia")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de error por llamada (todos los fakes)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="Logs de la app en INFO")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NUEVO"), help="Compara dos reportes JSON y sale")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        for key, base, new, ratio in compare(*args.compare):
+            print(f"{key:70s} {base:>12} -> {new:>12}  x{ratio}")
+        return 0
+
+    unknown = [name for name in args.scenarios if name not in SCENARIO_NAMES]
+    if unknown:
+        parser.error(f"escenarios desconocidos: {', '.join(unknown)}")
+    # prepare_environment cambia de directorio: resolvemos la salida antes
+    output = os.path.abspath(args.output) if args.output else None
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    workdir = prepare_environment()
+
+    # Recién ahora se puede importar la app (lee el entorno al importarse)
+    from benchmarks.fakes import FaultProfile
+    from benchmarks.scenarios import BenchContext, SCENARIOS, QUICK_PARAMS
+
+    def profile(latency_ms, offset):
+        return FaultProfile(latency_ms, args.jitter_ms, args.error_rate, seed=args.seed + offset)
+
+    ctx = BenchContext(
+        sheets=profile(args.sheets_latency_ms, 0),
+        openai=profile(args.openai_latency_ms, 1),
+        twilio=profile(args.twilio_latency_ms, 2),
+        apify=profile(args.apify_latency_ms, 3),
+        seed=args.seed
+    )
+
+    results = {}
+    try:
+        for name in args.scenarios or SCENARIO_NAMES:
+            params = QUICK_PARAMS[name] if args.quick else {}
+            print(f"▶️ {name}...", file=sys.stderr)
+            results[name] = SCENARIOS[name](ctx, **params)
+        results["fake_calls"] = ctx.profile_stats()
+    finally:
+        ctx.shutdown()
+
+    report = build_report(results, {**vars(args), "workdir": workdir})
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, "w") as f:
+            f.write(text)
+        print(f"✅ Resultados en {output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+"""
+Fakes en memoria de Google Sheets, OpenAI, Twilio y Apify para los benchmarks.
+Imitan solo la parte de cada SDK que usa la app, con latencia y tasa de error
+configurables (FaultProfile) para simular la red sin credenciales.
+"""
+import re
+import json
+import time
+import zlib
+import random
+import threading
+from gspread.utils import a1_to_rowcol
+
+class FakeServiceError(Exception):
+    """Error inyectado por un fake (cuenta como transitorio para el outbox)."""
+
+class FaultProfile:
+    """Latencia (ms, con jitter uniforme) y probabilidad de error por llamada."""
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0.0, seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def hit(self, operation: str):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if fail:
+            raise FakeServiceError(f"error simulado en {operation}")
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "errors": self.errors}
+
+# --- Google Sheets ---
+
+class _FakeSpreadsheet:
+    def __init__(self, spreadsheet_id: str):
+        self.id = spreadsheet_id
+
+class FakeWorksheet:
+    """sheet1 de una planilla, guardada como lista de filas (la fila 1 son las cabeceras)."""
+    HEADERS = ["Nombre", "Phone", "Status", "Notas"]
+
+    def __init__(self, spreadsheet_id: str, rows: list = None, profile: FaultProfile = None):
+        self.id = 0
+        self.spreadsheet = _FakeSpreadsheet(spreadsheet_id)
+        self.profile = profile or FaultProfile()
+        self._rows = [list(self.HEADERS)] + [list(r) for r in (rows or [])]
+        self._lock = threading.Lock()
+
+    @classmethod
+    def with_leads(cls, spreadsheet_id: str, count: int, status: str = "New", profile: FaultProfile = None):
+        rows = [
+            [f"Clínica {i}", f"+54 9 261 {i:07d}", status, f"https://www.google.com/maps/search/?api=1&query_place_id=place{i}"]
+            for i in range(count)
+        ]
+        return cls(spreadsheet_id, rows, profile)
+
+    def _cell(self, row: int, col: int):
+        if row - 1 < len(self._rows) and col - 1 < len(self._rows[row - 1]):
+            return self._rows[row - 1][col - 1]
+        return ""
+
+    def _column_range(self, a1: str) -> list:
+        """Rangos de una columna tipo 'B2:B' (hasta el final)."""
+        match = re.match(r"([A-Z]+)(\d+):[A-Z]+(\d*)$", a1)
+        start_row, col = a1_to_rowcol(f"{match.group(1)}{match.group(2)}")
+        end_row = int(match.group(3)) if match.group(3) else len(self._rows)
+        return [[self._cell(r, col)] for r in range(start_row, end_row + 1)]
+
+    def row_values(self, row: int) -> list:
+        self.profile.hit("row_values")
+        with self._lock:
+            return list(self._rows[row - 1])
+
+    def col_values(self, col: int) -> list:
+        self.profile.hit("col_values")
+        with self._lock:
+            return [self._cell(r, col) for r in range(1, len(self._rows) + 1)]
+
+    def get(self, a1: str) -> list:
+        self.profile.hit("get")
+        with self._lock:
+            return self._column_range(a1)
+
+    def batch_get(self, ranges: list) -> list:
+        self.profile.hit("batch_get")
+        with self._lock:
+            return [self._column_range(a1) for a1 in ranges]
+
+    def get_all_values(self) -> list:
+        self.profile.hit("get_all_values")
+        with self._lock:
+            return [list(r) for r in self._rows]
+
+    def get_all_records(self) -> list:
+        self.profile.hit("get_all_records")
+        with self._lock:
+            headers = self._rows[0]
+            return [dict(zip(headers, r)) for r in self._rows[1:]]
+
+    def append_rows(self, rows: list):
+        self.profile.hit("append_rows")
+        with self._lock:
+            first = len(self._rows) + 1
+            self._rows.extend(list(r) for r in rows)
+            last = len(self._rows)
+        return {"updates": {"updatedRange": f"Sheet1!A{first}:D{last}", "updatedRows": len(rows)}}
+
+    def batch_update(self, updates: list):
+        self.profile.hit("batch_update")
+        with self._lock:
+            for update in updates:
+                row, col = a1_to_rowcol(update["range"])
+                while len(self._rows) < row:
+                    self._rows.append([])
+                cells = self._rows[row - 1]
+                cells.extend([""] * (col - len(cells)))
+                cells[col - 1] = update["values"][0][0]
+
+class FakeGoogleClients:
+    """Reemplazo de GoogleClientFactory: devuelve siempre las hojas falsas registradas."""
+    def __init__(self, worksheet: FakeWorksheet):
+        self.default = worksheet
+        self.worksheets = {worksheet.spreadsheet.id: worksheet}
+
+    def add(self, worksheet: FakeWorksheet):
+        self.worksheets[worksheet.spreadsheet.id] = worksheet
+        return worksheet
+
+    def get_client(self):
+        return self
+
+    def get_worksheet(self, spreadsheet_id=None):
+        return self.worksheets[spreadsheet_id] if spreadsheet_id else self.default
+
+    def forget(self, spreadsheet_id=None):
+        pass
+
+# --- OpenAI ---
+
+class _Obj:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+class FakeOpenAI:
+    """
+    chat.completions.create con respuestas según el prompt: calificación de
+    leads (JSON), clasificación de intents, resúmenes y respuestas de chat.
+    """
+    def __init__(self, profile: FaultProfile = None, qualify_ratio: float = 0.8, seed: int = None):
+        self.profile = profile or FaultProfile()
+        self.qualify_ratio = qualify_ratio
+        self._rng = random.Random(seed)
+        self.chat = _Obj(completions=_Obj(create=self._create))
+
+    def _analysis(self) -> dict:
+        qualified = self._rng.random() < self.qualify_ratio
+        return {
+            "score": 8 if qualified else 3,
+            "reason": "benchmark",
+            "is_qualified": qualified,
+            "suggested_message": "Hola, ¿cómo manejan las inasistencias hoy?"
+        }
+
+    def _reply(self, messages: list) -> str:
+        system = messages[0]["content"] if messages else ""
+        if '"results"' in system:
+            # Calificación agrupada: el array de leads viene después de "Analiza estos leads: "
+            leads = json.loads(messages[-1]["content"].split(": ", 1)[1])
+            return json.dumps({"results": [{"lead_id": lead["lead_id"], **self._analysis()} for lead in leads]})
+        if "is_qualified" in system:
+            return json.dumps(self._analysis())
+        if "clasificador" in system:
+            return "INTERESTED"
+        if "Actualiza el resumen" in messages[-1]["content"]:
+            return "El prospecto tiene una clínica y preguntó por precios."
+        return "¿Te parece bien si te muestro cómo funciona en una llamada de 10 min?"
+
+    def _create(self, model: str, messages: list, **kwargs):
+        self.profile.hit("chat.completions.create")
+        content = self._reply(messages)
+        return _Obj(choices=[_Obj(message=_Obj(content=content))])
+
+# --- Twilio ---
+
+class FakeTwilio:
+    """client.messages.create(...) -> objeto con .sid"""
+    def __init__(self, profile: FaultProfile = None):
+        self.profile = profile or FaultProfile()
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.messages = _Obj(create=self._create)
+
+    def _create(self, body: str, from_: str, to: str):
+        self.profile.hit("messages.create")
+        with self._lock:
+            self._counter += 1
+            return _Obj(sid=f"SMfake{self._counter:08d}")
+
+# --- Apify ---
+
+class FakeApify:
+    """
+    Cliente de Apify con runs que terminan después de 'polls_to_finish' polls y
+    un dataset que se va llenando mientras el run "corre".
+    Se usa como client_factory de ScrapeEngine: FakeApify.factory(profile).
+    """
+    def __init__(self, token: str = None, profile: FaultProfile = None, polls_to_finish: int = 2):
+        self.profile = profile or FaultProfile()
+        self.polls_to_finish = polls_to_finish
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def factory(cls, profile: FaultProfile = None, polls_to_finish: int = 2):
+        return lambda token: cls(token, profile, polls_to_finish)
+
+    def actor(self, actor_id: str):
+        return _Obj(start=self._start)
+
+    def _start(self, run_input: dict):
+        self.profile.hit("actor.start")
+        search = run_input["searchStringsArray"][0]
+        limit = run_input["maxCrawledPlacesPerSearch"]
+        with self._lock:
+            run_id = f"run{len(self._runs)}"
+            items = [
+                {
+                    "title": f"{search} #{i}",
+                    "phone": f"+54 9 {zlib.crc32(search.encode()) % 1000:03d} {i:07d}",
+                    "website": f"https://clinica{i}.example.com",
+                    "googleMapsUrl": f"https://www.google.com/maps/search/?api=1&query_place_id={run_id}p{i}",
+                    "placeId": f"{run_id}p{i}",
+                }
+                for i in range(limit)
+            ]
+            self._runs[run_id] = {"items": items, "polls": 0}
+        return {"id": run_id, "defaultDatasetId": run_id, "status": "RUNNING"}
+
+    def _visible(self, run: dict) -> int:
+        done = min(run["polls"], self.polls_to_finish)
+        return len(run["items"]) * done // self.polls_to_finish
+
+    def run(self, run_id: str):
+        def wait_for_finish(wait_secs: int = None):
+            self.profile.hit("run.wait_for_finish")
+            with self._lock:
+                run = self._runs[run_id]
+                run["polls"] += 1
+                finished = run["polls"] >= self.polls_to_finish
+            return {"id": run_id, "defaultDatasetId": run_id, "status": "SUCCEEDED" if finished else "RUNNING"}
+        return _Obj(wait_for_finish=wait_for_finish, abort=lambda: None)
+
+    def dataset(self, dataset_id: str):
+        def list_items(offset: int = 0, limit: int = 100):
+            self.profile.hit("dataset.list_items")
+            with self._lock:
+                run = self._runs[dataset_id]
+                visible = run["items"][:self._visible(run)]
+            return _Obj(items=visible[offset:offset + limit])
+        return _Obj(list_items=list_items)
+
+# --- OpenAI Batch API ---
+
+class FakeBatchTransport:
+    """
+    Transporte de la Batch API (ver app/services/openai_batch.py) que responde
+    cada pedido con FakeOpenAI. Cada batch termina después de 'polls_to_finish' polls.
+    """
+    def __init__(self, openai: FakeOpenAI = None, profile: FaultProfile = None, polls_to_finish: int = 2):
+        self.openai = openai or FakeOpenAI()
+        self.profile = profile or FaultProfile()
+        self.polls_to_finish = polls_to_finish
+        self._files = {}
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def upload(self, jsonl: bytes) -> str:
+        self.profile.hit("files.create")
+        with self._lock:
+            file_id = f"file-{len(self._files)}"
+            self._files[file_id] = jsonl.decode("utf-8")
+        return file_id
+
+    def create(self, input_file_id: str) -> str:
+        self.profile.hit("batches.create")
+        with self._lock:
+            batch_id = f"batch-{len(self._batches)}"
+            self._batches[batch_id] = {"input": input_file_id, "polls": 0, "output": None, "cancelled": False}
+        return batch_id
+
+    def _run(self, batch: dict) -> str:
+        lines = []
+        for line in self._files[batch["input"]].splitlines():
+            request = json.loads(line)
+            response = self.openai.chat.completions.create(**request["body"])
+            lines.append(json.dumps({
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "body": {
+                    "choices": [{"message": {"content": response.choices[0].message.content}}]
+                }},
+                "error": None,
+            }))
+        output_id = f"file-out-{batch['input']}"
+        self._files[output_id] = "\n".join(lines)
+        return output_id
+
+    def retrieve(self, batch_id: str) -> dict:
+        self.profile.hit("batches.retrieve")
+        with self._lock:
+            batch = self._batches[batch_id]
+            batch["polls"] += 1
+            if batch["cancelled"]:
+                return {"status": "cancelled", "output_file_id": None, "error_file_id": None}
+            if batch["polls"] < self.polls_to_finish:
+                return {"status": "in_progress", "output_file_id": None, "error_file_id": None}
+            if batch["output"] is None:
+                batch["output"] = self._run(batch)
+            return {"status": "completed", "output_file_id": batch["output"], "error_file_id": None}
+
+    def download(self, file_id: str) -> str:
+        self.profile.hit("files.content")
+        return self._files[file_id]
+
+    def cancel(self, batch_id: str):
+        with self._lock:
+            self._batches[batch_id]["cancelled"] = True
@@ -0,0 +1,112 @@
+"""
+Utilidades comunes de los benchmarks: entorno aislado, métricas y salida JSON.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Variables obligatorias de Settings (valores de mentira: todo va contra los fakes) y
+# límites de cuota altos para medir el código y no el rate limit. Se pueden pisar por entorno.
+BENCH_ENV = {
+    "OPENAI_API_KEY": "sk-bench",
+    "TWILIO_ACCOUNT_SID": "ACbench",
+    "TWILIO_AUTH_TOKEN": "bench",
+    "TWILIO_PHONE_NUMBER": "+10000000000",
+    "GOOGLE_SHEET_NAME": "bench",
+    "OPENAI_REQUESTS_PER_SECOND": "100000",
+    "TWILIO_MESSAGES_PER_SECOND": "100000",
+    "SHEETS_WRITE_REQUESTS_PER_MINUTE": "1000000",
+    "SHEET_FLUSH_INTERVAL_SECONDS": "0.5",
+    "QUALIFY_BATCH_POLL_SECONDS": "0.2",
+}
+
+def prepare_environment() -> str:
+    """
+    Crea un directorio temporal, se mueve ahí y apunta la base SQLite a ese
+    directorio, así los benchmarks nunca tocan leads.db ni conversation_memory.json.
+    Hay que llamarlo ANTES de importar cualquier módulo de 'app'.
+    """
+    workdir = tempfile.mkdtemp(prefix="vw-bench-")
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["SLACK_SPILL_FILE"] = os.path.join(workdir, "slack_spill.jsonl")
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    # Sin Slack real aunque esté en el .env
+    os.environ["SLACK_WEBHOOK_URL"] = ""
+    return workdir
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(samples: list) -> dict:
+    """Segundos -> {count, mean_ms, p50_ms, p90_ms, p99_ms, max_ms}."""
+    values = sorted(samples)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p90_ms": round(percentile(values, 90) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3),
+    }
+
+def timed(fn, *args, **kwargs):
+    """(resultado, segundos)"""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+def build_report(results: dict, args: dict) -> dict:
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": args,
+        },
+        "results": results,
+    }
+
+def _flatten(prefix: str, value, out: dict):
+    if isinstance(value, dict):
+        for key, sub in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else str(key), sub, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = value
+
+def compare(base_path: str, new_path: str) -> list:
+    """Compara dos reportes JSON: [(métrica, base, nuevo, nuevo/base)] de las métricas numéricas en común."""
+    with open(base_path) as f:
+        base = {}
+        _flatten("", json.load(f)["results"], base)
+    with open(new_path) as f:
+        new = {}
+        _flatten("", json.load(f)["results"], new)
+    rows = []
+    for key in sorted(base.keys() & new.keys()):
+        ratio = round(new[key] / base[key], 3) if base[key] else None
+        rows.append((key, base[key], new[key], ratio))
+    return rows
@@ -0,0 +1,312 @@
+"""
+Escenarios de benchmark. Se importa DESPUÉS de runner.prepare_environment()
+(los módulos de 'app' leen la configuración y abren la base al importarse).
+"""
+import time
+import random
+import asyncio
+import threading
+from fastapi import HTTPException
+
+from benchmarks.fakes import (
+    FaultProfile, FakeWorksheet, FakeGoogleClients, FakeOpenAI, FakeTwilio, FakeApify, FakeBatchTransport
+)
+from benchmarks.runner import summarize, timed
+
+from app.db import database
+from app.core.container import container
+from app.services import gsheet_service as gsheet_module
+from app.services.twilio_service import TwilioService
+
+class BenchContext:
+    """Fakes compartidos por todos los escenarios de una corrida."""
+    def __init__(self, sheets: FaultProfile, openai: FaultProfile, twilio: FaultProfile,
+                 apify: FaultProfile, seed: int = 1):
+        self.profiles = {"sheets": sheets, "openai": openai, "twilio": twilio, "apify": apify}
+        self.seed = seed
+        database.init_db()
+        self.clients = FakeGoogleClients(FakeWorksheet.with_leads("bench-default", 1000, status="Contacted", profile=sheets))
+        self.openai = FakeOpenAI(openai, seed=seed)
+        self.twilio = FakeTwilio(twilio)
+
+        # Sheets: GSheetService pide el cliente al factory del módulo
+        gsheet_module.google_clients = self.clients
+
+        # OpenAI: webhook y daily job toman el cliente del container
+        container.reset()
+        container.override("openai_client", self.openai)
+
+        # Twilio: el outbox crea su TwilioService de forma diferida
+        from app.services.outbox import outbox
+        outbox.twilio_factory = lambda: TwilioService(client=self.twilio)
+        outbox._twilio = None
+        self.outbox = outbox
+
+    def profile_stats(self) -> dict:
+        return {name: profile.stats() for name, profile in self.profiles.items()}
+
+    def shutdown(self):
+        from app.services.gsheet_service import sheet_writer
+        self.outbox.shutdown()
+        sheet_writer.shutdown()
+
+# --- Webhook ---
+
+MESSAGES = [
+    "Hola, ¿cuánto cuesta?",
+    "Tengo muchas inasistencias en la clínica",
+    "Si dale",
+    "¿Funciona con Google Calendar?",
+    "Usamos una agenda en papel",
+    "No gracias",
+]
+
+def bench_webhook(ctx: BenchContext, messages: int = 500, users: int = 50) -> dict:
+    """
+    Mensajes entrantes de WhatsApp: tiempo de respuesta del endpoint (ack) y
+    latencia total hasta terminar el pipeline (GPT, memoria, estados, outbox).
+    Si la cola está llena (503) se espera un poco y se reintenta, como Twilio.
+    """
+    from app.routes import webhook
+
+    webhook.message_workers.start()
+    ctx.outbox.start()
+
+    original = webhook.process_message
+    enqueued_at = {}
+    done_latencies = []
+    done_lock = threading.Lock()
+    all_done = threading.Event()
+
+    def timed_process(user_id, body, message_sid=None):
+        try:
+            return original(user_id, body, message_sid)
+        finally:
+            with done_lock:
+                done_latencies.append(time.perf_counter() - enqueued_at[message_sid])
+                if len(done_latencies) == messages:
+                    all_done.set()
+
+    # MessageSid únicos por corrida: los repetidos se descartan como reintentos de Twilio
+    batch = f"{time.time_ns():x}"
+
+    async def send_all():
+        acks = []
+        rejected = 0
+        for i in range(messages):
+            user = f"whatsapp:+549261{i % users:07d}"
+            sid = f"SMbench{batch}{i:08d}"
+            while True:
+                enqueued_at[sid] = time.perf_counter()
+                try:
+                    await webhook.whatsapp_webhook(From=user, Body=MESSAGES[i % len(MESSAGES)], MessageSid=sid)
+                    acks.append(time.perf_counter() - enqueued_at[sid])
+                    break
+                except HTTPException:
+                    rejected += 1
+                    await asyncio.sleep(0.005)
+        return acks, rejected
+
+    webhook.process_message = timed_process
+    try:
+        start = time.perf_counter()
+        acks, rejected = asyncio.run(send_all())
+        all_done.wait(timeout=600)
+        elapsed = time.perf_counter() - start
+    finally:
+        webhook.process_message = original
+        webhook.message_workers.shutdown()
+
+    return {
+        "messages": messages,
+        "users": users,
+        "processed": len(done_latencies),
+        "rejected_503": rejected,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msgs_per_s": round(len(done_latencies) / elapsed, 1) if elapsed else 0,
+        "ack": summarize(acks),
+        "end_to_end": summarize(done_latencies),
+        "intent_sources": container.openai_service.intent_stats(),
+    }
+
+# --- Excel: add_leads / update_status_by_phone ---
+
+def bench_sheets(ctx: BenchContext, sizes=(1000, 10000, 100000), batch: int = 100, lookups: int = 200) -> dict:
+    """
+    Costo de add_leads y de update_status_by_phone (tabla local de leads + LeadSync)
+    según el tamaño de la hoja.
+    """
+    from app.services.gsheet_service import GSheetService, sheet_writer
+    from app.services.lead_store import lead_sync
+
+    rng = random.Random(ctx.seed)
+    results = {}
+    for size in sizes:
+        spreadsheet_id = f"bench-sheet-{size}"
+        worksheet = ctx.clients.add(
+            FakeWorksheet.with_leads(spreadsheet_id, size, status="Contacted", profile=ctx.profiles["sheets"])
+        )
+        service = GSheetService(spreadsheet_id)
+
+        def new_leads(offset):
+            return [
+                {"Nombre": f"Nueva {offset + i}", "Phone": f"+54 9 351 {offset + i:07d}",
+                 "Notas": f"https://www.google.com/maps/search/?api=1&query_place_id=new{offset + i}"}
+                for i in range(batch)
+            ]
+
+        duplicates = [
+            {"Nombre": f"Clínica {i}", "Phone": f"+54 9 261 {i:07d}", "Notas": ""}
+            for i in rng.sample(range(size), min(batch, size))
+        ]
+        # Primera carga: incluye reconstruir el índice de duplicados desde la hoja
+        report_cold, add_cold = timed(service.add_leads, new_leads(0) + duplicates)
+        _, add_warm = timed(service.add_leads, new_leads(batch) + duplicates)
+
+        targets = [f"+549261{i:07d}" for i in rng.choices(range(size), k=lookups)]
+
+        lead_sync.track(service)
+        _, store_pull = timed(lead_sync.sync, spreadsheet_id, True)
+        store_samples = [
+            timed(lead_sync.update_status_by_phone, service, phone, "Contacted")[1] for phone in targets
+        ]
+        _, store_push = timed(lead_sync.push, spreadsheet_id)
+        sheet_writer.flush()
+
+        results[str(size)] = {
+            "add_leads": {
+                "batch": len(new_leads(0)) + len(duplicates),
+                "added": report_cold["added"],
+                "cold_ms": round(add_cold * 1000, 3),
+                "warm_ms": round(add_warm * 1000, 3),
+            },
+            "update_status_by_phone_store": {
+                "pull_ms": round(store_pull * 1000, 3),
+                "push_ms": round(store_push * 1000, 3),
+                **summarize(store_samples),
+            },
+            "sheet_api_calls": worksheet.profile.stats(),
+        }
+    return results
+
+# --- Daily outreach ---
+
+def bench_outreach(ctx: BenchContext, leads: int = 200, batch_mode: bool = False, group_size: int = 1) -> dict:
+    """Leads por minuto de daily_outreach_job (directo, agrupado o con la Batch API falsa)."""
+    from app.scheduler import tasks
+    from app.core.config import settings
+    from app.services.gsheet_service import sheet_writer
+
+    mode = "batch" if batch_mode else ("grouped" if group_size > 1 else "direct")
+    spreadsheet_id = f"bench-outreach-{mode}"
+    worksheet = ctx.clients.add(
+        FakeWorksheet.with_leads(spreadsheet_id, leads, status="New", profile=ctx.profiles["sheets"])
+    )
+    previous_default = ctx.clients.default
+    ctx.clients.default = worksheet
+
+    tasks.qualify_cache.clear()
+    ctx.outbox.start()
+    transport = FakeBatchTransport(ctx.openai, ctx.profiles["openai"]) if batch_mode else None
+    previous_group_size = settings.QUALIFY_LEADS_PER_REQUEST
+    settings.QUALIFY_LEADS_PER_REQUEST = group_size
+    calls_before = ctx.profiles["openai"].calls
+
+    try:
+        start = time.perf_counter()
+        asyncio.run(tasks.daily_outreach_job(batch_transport=transport))
+        elapsed = time.perf_counter() - start
+        sheet_writer.flush()
+    finally:
+        ctx.clients.default = previous_default
+        settings.QUALIFY_LEADS_PER_REQUEST = previous_group_size
+
+    statuses = {}
+    for record in worksheet.get_all_records():
+        statuses[record["Status"]] = statuses.get(record["Status"], 0) + 1
+
+    return {
+        "leads": leads,
+        "mode": mode,
+        "openai_calls": ctx.profiles["openai"].calls - calls_before,
+        "elapsed_s": round(elapsed, 3),
+        "leads_per_min": round(leads / elapsed * 60, 1) if elapsed else 0,
+        "final_statuses": statuses,
+    }
+
+# --- Memoria ---
+
+def bench_memory(ctx: BenchContext, history_sizes=(10, 100, 1000, 10000), appends: int = 50) -> dict:
+    """Costo de add_message, get_history y del armado de contexto según el largo del historial."""
+    from app.db import database, models
+    from app.utils.memory import Memory
+    from app.services.conversation_context import ConversationContext
+
+    memory = Memory()
+    context = ConversationContext(memory, summarizer=lambda previous, messages: "resumen de benchmark")
+    results = {}
+    for size in history_sizes:
+        user_id = f"whatsapp:+54911{size:08d}"
+        db = database.SessionLocal()
+        try:
+            db.bulk_insert_mappings(models.ConversationMessage, [
+                {"user_id": user_id, "role": "user" if i % 2 == 0 else "assistant", "content": f"Mensaje {i} " * 8}
+                for i in range(size)
+            ])
+            db.commit()
+        finally:
+            db.close()
+
+        add_samples = [timed(memory.add_message, user_id, "user", "Mensaje nuevo de benchmark")[1] for _ in range(appends)]
+        _, history_s = timed(memory.get_history, user_id)
+        _, context_cold = timed(context.build, user_id)
+        context_samples = [timed(context.build, user_id)[1] for _ in range(appends)]
+
+        results[str(size)] = {
+            "add_message": summarize(add_samples),
+            "get_history_ms": round(history_s * 1000, 3),
+            "context_build_cold_ms": round(context_cold * 1000, 3),
+            "context_build": summarize(context_samples),
+        }
+    return results
+
+# --- Scraping (Apify) ---
+
+def bench_scrape(ctx: BenchContext, cities=("Mendoza", "Córdoba", "Rosario"),
+                 niches=("Dentista", "Odontólogo"), limit: int = 100) -> dict:
+    """Búsqueda múltiple (ciudades x nichos) con el motor de scraping contra el Apify falso."""
+    from app.services.scrape_engine import ScrapeEngine, build_queries
+
+    engine = ScrapeEngine("bench-token", client_factory=FakeApify.factory(ctx.profiles["apify"]), use_cache=False)
+    queries = build_queries(list(cities), list(niches))
+    result, elapsed = timed(engine.run_batch, queries, limit)
+    return {
+        "queries": len(queries),
+        "limit": limit,
+        "raw_items": result["raw_items"],
+        "leads": len(result["leads"]),
+        "errors": len(result["errors"]),
+        "elapsed_s": round(elapsed, 3),
+        "items_per_s": round(result["raw_items"] / elapsed, 1) if elapsed else 0,
+    }
+
+SCENARIOS = {
+    "webhook": bench_webhook,
+    "sheets": bench_sheets,
+    "outreach": bench_outreach,
+    "outreach_batch": lambda ctx, **kw: bench_outreach(ctx, batch_mode=True, **kw),
+    "outreach_grouped": lambda ctx, **kw: bench_outreach(ctx, group_size=10, **kw),
+    "memory": bench_memory,
+    "scrape": bench_scrape,
+}
+
+# Tamaños reducidos para una corrida rápida (--quick)
+QUICK_PARAMS = {
+    "webhook": {"messages": 100, "users": 20},
+    "sheets": {"sizes": (1000, 10000), "batch": 50, "lookups": 50},
+    "outreach": {"leads": 50},
+    "outreach_batch": {"leads": 50},
+    "outreach_grouped": {"leads": 50},
+    "memory": {"history_sizes": (10, 100, 1000), "appends": 20},
+    "scrape": {"limit": 50},
+}
@@ -1,46 +1,112 @@
+from app.utils.startup import startup_profile   # primero: mide el tiempo de los imports
+import os
+import time
 import logging
 import asyncio
 import secrets
-from fastapi import FastAPI, Depends, HTTPException, status
+import threading
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.staticfiles import StaticFiles 
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.openapi.docs import get_swagger_ui_html
 from fastapi.openapi.utils import get_openapi
-from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from contextlib import asynccontextmanager
-from pydantic import BaseModel 
-from typing import Optional
 
 # Imports de tus módulos
 from app.routes import webhook
-from app.scheduler.tasks import daily_outreach_job
-from app.db import database, models
-from app.routers import auth
+from app.scheduler.tasks import daily_outreach_job, qualify_cache
+from app.scheduler.leader import LeaderLock
+from app.db import database
+from app.routers import auth, scrape
 from app.core import security
+from app.services.gsheet_service import sheet_writer
+from app.services.scrape_jobs import scrape_jobs
+from app.services.outbox import outbox
+from app.services.lead_store import lead_sync
+from app.core.config import settings
+from app.core.container import container
+from app.utils.metrics import metrics, trace_id_var, new_trace_id, install_trace_logging
+
+startup_profile.mark("imports")
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
+if settings.TRACE_IDS_ENABLED:
+    install_trace_logging()
 logger = logging.getLogger(__name__)
 
-# Initialize Scheduler
-scheduler = BackgroundScheduler()
+# Initialize Scheduler: corre en el event loop (los jobs async se esperan de verdad).
+# Con varios workers, cada job programado lo ejecuta solo el líder (lock en la base).
+scheduler = AsyncIOScheduler()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    scheduler.add_job(daily_outreach_job, 'cron', hour=10, minute=0, id="daily_outreach")
+    startup_profile.mark("app_setup")
+
+    # Tablas e índices (antes del lock del scheduler, que usa sus tablas)
+    database.init_db()
+
+    leader_lock = LeaderLock(
+        "scheduler",
+        ttl=settings.SCHEDULER_LOCK_TTL_SECONDS,
+        heartbeat=settings.SCHEDULER_HEARTBEAT_SECONDS,
+        max_run_seconds=settings.SCHEDULER_MAX_RUN_SECONDS
+    )
+    app.state.leader_lock = leader_lock
+    outreach_job = daily_outreach_job
+    heartbeat_task = None
+    if settings.SCHEDULER_LEADER_ELECTION:
+        outreach_job = leader_lock.leader_job("daily_outreach", daily_outreach_job)
+        heartbeat_task = asyncio.create_task(leader_lock.heartbeat_loop())
+    scheduler.add_job(outreach_job, 'cron', hour=10, minute=0, id="daily_outreach")
     scheduler.start()
     logger.info("Scheduler started.")
-    
-    # Initialize DB models
-    models.Base.metadata.create_all(bind=database.engine)
+
+    # Workers del webhook de WhatsApp y dispatcher del outbox de Twilio
+    webhook.message_workers.start()
+    outbox.start()
+
+    # Sincronización de la tabla leads con el Excel
+    lead_sync.start()
+
+    # Alertas de Slack que quedaron en disco del arranque anterior: se reenvían ya
+    if os.path.exists(settings.SLACK_SPILL_FILE):
+        container.slack_service.start()
+    startup_profile.mark("lifespan")
+    startup_profile.ready()
+
+    # Conexiones a Google y OpenAI en segundo plano: el arranque no las espera
+    if settings.WARMUP_SERVICES_ON_STARTUP:
+        threading.Thread(
+            target=container.warm_up, args=(["gsheet_service", "openai_service"],),
+            name="warm-up", daemon=True
+        ).start()
     
     yield
     # Shutdown
     scheduler.shutdown()
+    if heartbeat_task is not None:
+        heartbeat_task.cancel()
+        await asyncio.to_thread(leader_lock.release)
     logger.info("Scheduler shut down.")
 
+    # Terminamos de responder los mensajes ya encolados
+    webhook.message_workers.shutdown()
+    slack_service = container.peek("slack_service")
+    if slack_service is not None:
+        slack_service.shutdown()
+    outbox.shutdown()
+
+    # Cancelamos las búsquedas del dashboard que sigan corriendo
+    scrape_jobs.shutdown()
+
+    # Subimos los estados pendientes y mandamos al Excel lo que quedó en el buffer
+    lead_sync.shutdown()
+    sheet_writer.shutdown()
+
 # --- SEGURIDAD: Desactivamos los docs automáticos públicos ---
 app = FastAPI(
     title="Violet Wave Dashboard", 
@@ -53,18 +119,66 @@ app = FastAPI(
 # --- MONTAR CARPETA STATIC ---
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
+# ==========================================
+# 📈 MÉTRICAS Y TRACE IDS
+# ==========================================
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """Latencia por ruta + trace ID (se toma de X-Request-ID o se genera) que aparece en los logs."""
+    token = None
+    trace_id = None
+    if settings.TRACE_IDS_ENABLED:
+        trace_id = request.headers.get("X-Request-ID") or new_trace_id()
+        token = trace_id_var.set(trace_id)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        if trace_id:
+            response.headers["X-Request-ID"] = trace_id
+        return response
+    finally:
+        # Plantilla de la ruta ('/api/buscar-leads/{job_id}'), no la URL, para no explotar las series
+        route = request.scope.get("route")
+        labels = {
+            "method": request.method,
+            "route": getattr(route, "path", "unmatched"),
+            "status": str(status_code),
+        }
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - start, labels,
+                        help_text="Latencia de los requests HTTP por ruta")
+        if token is not None:
+            trace_id_var.reset(token)
+
+def _collect_app_stats(registry):
+    """Estado de cachés y colas, publicado como gauges en cada scrape de /metrics."""
+    for name, stats in (("auth_user", security.user_cache.stats()), ("qualify_lead", qualify_cache.stats())):
+        for key in ("hits", "misses", "hit_rate"):
+            registry.set_gauge(f"cache_{key}", stats[key], {"cache": name}, help_text="Estadísticas de cachés")
+    openai_service = container.peek("openai_service")   # sin crearlo solo para las métricas
+    if openai_service is not None:
+        for source, count in openai_service.intent_stats().items():
+            registry.set_gauge("intent_classifications", count, {"source": source},
+                               help_text="Clasificaciones de intents por origen (rules, model, memo, llm)")
+    leader_lock = getattr(app.state, "leader_lock", None)
+    if leader_lock is not None:
+        registry.set_gauge("scheduler_is_leader", int(leader_lock.is_leader),
+                           help_text="1 si este worker es el líder del scheduler")
+    for phase, seconds in startup_profile.phases.items():
+        registry.set_gauge("startup_phase_seconds", seconds, {"phase": phase},
+                           help_text="Duración de cada etapa del arranque en frío")
+    registry.set_gauge("sheet_writer_pending_cells", sheet_writer.pending_count(),
+                       help_text="Celdas esperando en el write-behind del Excel")
+    registry.set_gauge("webhook_queue_pending", webhook.message_workers.pending(),
+                       help_text="Mensajes de WhatsApp esperando un worker")
+
+metrics.register_collector(_collect_app_stats)
+
 # --- INCLUDE ROUTERS ---
 app.include_router(webhook.router)
 app.include_router(auth.router)
-
-# --- MODELOS DE DATOS ---
-class ScrapeRequest(BaseModel):
-    apify_token: Optional[str] = None # <--- Campo del Token Apify
-    city: str
-    country: str
-    niche: str          
-    spreadsheet_id: str 
-    limit: int = 10
+app.include_router(scrape.router)
 
 # ==========================================
 # 🛡️ SEGURIDAD PARA /DOCS (SWAGGER) - BLINDAJE
@@ -96,6 +210,16 @@ async def get_swagger_documentation(username: str = Depends(get_current_username
 async def get_open_api_endpoint(username: str = Depends(get_current_username_docs)):
     return get_openapi(title="Violet Wave API", version="1.0.0", routes=app.routes)
 
+# Métricas en formato Prometheus (mismo acceso que /docs)
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(username: str = Depends(get_current_username_docs)):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Tiempos del último arranque en frío (mismo acceso que /docs)
+@app.get("/startup-profile", include_in_schema=False)
+async def get_startup_profile(username: str = Depends(get_current_username_docs)):
+    return startup_profile.report(services=container.build_stats())
+
 # ==========================================
 # 🚀 RUTAS PRINCIPALES DEL DASHBOARD
 # ==========================================
@@ -108,44 +232,19 @@ def read_login():
 def read_dashboard():
     return FileResponse('static/dashboard.html')
 
-# --- ENDPOINT PARA BUSCAR LEADS (PROTEGIDO JWT) ---
-@app.post("/api/buscar-leads")
-async def buscar_leads_google_maps(
-    request: ScrapeRequest, 
-    current_user: models.User = Depends(security.get_current_user)
-):
-    """
-    DASHBOARD TOOL: Busca leads en Google Maps y llena el Excel indicado.
-    Requiere autenticación JWT + Token Apify opcional.
-    """
-    from app.services.scraper_service import ScraperService
-    
-    logger.info(f"🔎 Buscando '{request.niche}' (User: {current_user.email})")
-    
-    scraper = ScraperService()
-    
-    # Pasamos el token del usuario (si lo puso) al servicio
-    result = scraper.scrape_and_save(
-        city=request.city, 
-        country=request.country, 
-        niche=request.niche,
-        spreadsheet_id=request.spreadsheet_id,
-        limit=request.limit,
-        apify_token=request.apify_token
-    )
-    
-    return result
-
 # --- ENDPOINT DE PRUEBA MANUAL ---
 @app.post("/test-manual")
-async def test_manual_trigger(current_user: models.User = Depends(security.get_current_user)):
+async def test_manual_trigger(current_user: security.CurrentUser = Depends(security.get_current_user)):
     logger.info(f">>> 🔴 INICIANDO PRUEBA MANUAL (User: {current_user.email}) <<<")
     try:
-        if asyncio.iscoroutinefunction(daily_outreach_job):
-            await daily_outreach_job()
-        else:
-            daily_outreach_job()
+        # Misma reserva en scheduled_runs que el job programado: no corre si ya hay uno en curso
+        run_key = f"manual-{time.strftime('%Y-%m-%dT%H:%M:%S')}"
+        if not await app.state.leader_lock.run_once("daily_outreach", run_key, daily_outreach_job):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail="El daily outreach ya está corriendo en otro worker.")
         return {"status": "success", "message": "Tarea ejecutada."}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error: {e}")
         return {"status": "error", "message": str(e)}
@@ -1,83 +1,54 @@
-from apify_client import ApifyClient
-from app.services.gsheet_service import GSheetService
+import argparse
+from app.services.scraper_service import ScraperService
 from app.core.config import settings
+from app.db import database
 import logging
 
 # Configuración
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-def run_scraper(city="Mendoza", limit=20):
+def run_scraper(city="Mendoza", limit=20, niches=None, cities=None, spreadsheet_id=None):
     """
-    Busca dentistas en la ciudad especificada y los guarda en Sheets.
+    Busca dentistas (o los nichos indicados) en las ciudades especificadas y los guarda en Sheets.
+    Todas las combinaciones ciudad x nicho corren en paralelo con el motor compartido.
     """
     if not settings.APIFY_TOKEN:
         print("[ERROR] Falta APIFY_TOKEN en el .env")
         return
 
-    print(f"[INFO] Iniciando busqueda de Dentistas en {city}...")
-    
-    # 1. Conectar con Apify
-    client = ApifyClient(settings.APIFY_TOKEN)
-
-    # 2. Configurar el Actor de Google Maps
-    # ID CORRECTO: compass/crawler-google-places
-    run_input = {
-        "searchStringsArray": [f"Dentistas en {city}", f"Clínica Dental en {city}"],
-        "maxCrawledPlacesPerSearch": limit,
-        "language": "es",
-        "onlyDirectPlaces": True, 
-    }
-
-    # 3. Ejecutar el scraper
-    try:
-        # CORRECCIÓN AQUÍ: Usamos el ID oficial de Compass
-        print("[INFO] Enviando tarea a Apify (esto puede tardar unos segundos)...")
-        run = client.actor("compass/crawler-google-places").call(run_input=run_input)
-    except Exception as e:
-        print(f"[ERROR] Fallo al conectar con Apify: {e}")
-        return
-
-    print("[INFO] Descargando resultados...")
-    
-    # 4. Procesar resultados
-    leads_to_save = []
-    
-    try:
-        # Iteramos sobre los items que encontró
-        dataset_items = client.dataset(run["defaultDatasetId"]).iterate_items()
-        
-        for item in dataset_items:
-            # Apify a veces devuelve el teléfono en 'phone' o 'phoneUnformatted'
-            phone = item.get("phoneUnformatted") or item.get("phone")
-            name = item.get("title")
-            url = item.get("googleMapsUrl")
-            website = item.get("website")
-            
-            # FILTRO DE CALIDAD: Solo guardamos si tiene teléfono
-            if phone:
-                lead_data = {
-                    "Nombre": name,
-                    "Phone": phone,
-                    "Notas": f"Web: {website} | Maps: {url}"
-                }
-                leads_to_save.append(lead_data)
-                
-        print(f"[OK] Encontrados {len(leads_to_save)} leads con telefono.")
-
-        # 5. Guardar en Google Sheets
-        if leads_to_save:
-            gsheet = GSheetService()
-            gsheet.add_leads(leads_to_save)
-        else:
-            print("[AVISO] No se encontraron leads validos esta vez.")
-            
-    except Exception as e:
-        print(f"[ERROR] Procesando datos: {e}")
+    cities = cities or [city]
+    niches = niches or ["Dentistas", "Clínica Dental"]
+
+    print(f"[INFO] Iniciando busqueda de {', '.join(niches)} en {', '.join(cities)}...")
+    print("[INFO] Enviando tareas a Apify (esto puede tardar unos segundos)...")
+
+    result = ScraperService().scrape_batch_and_save(
+        cities=cities,
+        niches=niches,
+        spreadsheet_id=spreadsheet_id,
+        limit=limit,
+        apify_token=settings.APIFY_TOKEN,
+        only_direct_places=True,
+        progress=lambda phase, **data: logger.info(f"[{phase}] {data}")
+    )
+
+    if result["status"] == "success":
+        print(f"[OK] {result['found']} leads con telefono ({result['added_new']} nuevos, {result['duplicates']} duplicados).")
+        for search, error in result["failed_queries"].items():
+            print(f"[AVISO] Falló '{search}': {error}")
+    else:
+        print(f"[ERROR] {result.get('message')}")
+    return result
 
 if __name__ == "__main__":
-    # Puedes cambiar la ciudad y la cantidad aquí
-    CIUDAD = "Mendoza, Argentina"
-    CANTIDAD = 5 
-    
-    run_scraper(CIUDAD, CANTIDAD)
\ No newline at end of file
+    # Ej: python scraper.py --cities "Mendoza, Argentina" "Córdoba, Argentina" --niches Dentistas Ortodoncistas --limit 10
+    parser = argparse.ArgumentParser(description="Busca leads en Google Maps (Apify) y los guarda en Sheets.")
+    parser.add_argument("--cities", nargs="+", default=["Mendoza, Argentina"])
+    parser.add_argument("--niches", nargs="+", default=["Dentistas", "Clínica Dental"])
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--spreadsheet-id", default=None, help="Por defecto usa GOOGLE_SHEET_NAME")
+    args = parser.parse_args()
+
+    database.init_db()
+    run_scraper(limit=args.limit, niches=args.niches, cities=args.cities, spreadsheet_id=args.spreadsheet_id)